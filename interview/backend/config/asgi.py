@@ -0,0 +1,16 @@
+"""
+ASGI config for CRM project.
+
+Django runs each request's sync code in a thread of its own under ASGI, so
+connections kept per thread would pile up; the connection pool (DB_POOL)
+is on by default instead.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('DB_POOL', 'True')
+
+application = get_asgi_application()
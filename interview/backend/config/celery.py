@@ -16,9 +16,28 @@ app.autodiscover_tasks()
 
 # Configure periodic tasks
 app.conf.beat_schedule = {
-    'check-reminders-every-minute': {
+    # Reminders are dispatched on time by run_reminder_scheduler;
+    # this only catches ones it missed
+    'check-reminders-sweep': {
         'task': 'crm.tasks.check_reminders',
-        'schedule': crontab(minute='*/1'),  # Run every minute
+        'schedule': crontab(minute='*/15'),  # Run every 15 minutes
+    },
+    'update-analytics-rollups': {
+        'task': 'crm.tasks.update_analytics_rollups',
+        'schedule': crontab(minute='*/5'),  # Run every 5 minutes
+    },
+    'find-duplicate-leads': {
+        'task': 'crm.tasks.find_duplicate_leads',
+        'schedule': crontab(hour=2, minute=30),  # Run nightly
+    },
+    'push-dashboard-stats': {
+        'task': 'crm.tasks.push_dashboard_stats',
+        'schedule': 5.0,  # Run every 5 seconds
+        'options': {'expires': 5},
+    },
+    'purge-sync-tombstones': {
+        'task': 'crm.tasks.purge_sync_tombstones',
+        'schedule': crontab(hour=3, minute=15),  # Run nightly
     },
 }
 
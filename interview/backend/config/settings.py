@@ -6,6 +6,7 @@ import os
 from pathlib import Path
 from datetime import timedelta
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -43,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'crm.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -52,6 +54,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'crm.middleware.AuditBufferMiddleware',
+    'crm.middleware.ReplicaRoutingMiddleware',
+    'crm.middleware.AsyncStreamingMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -80,15 +85,57 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Set DB_ENGINE=postgresql in .env to use PostgreSQL
 DB_ENGINE = config('DB_ENGINE', default='sqlite')
 
+# Threads per process running the independent queries of the dashboard stats
+# and the global search concurrently (see crm.parallel); below 2 runs them
+# one after another. Each thread may hold a database connection
+PARALLEL_QUERY_THREADS = config('PARALLEL_QUERY_THREADS', default=8, cast=int)
+
+# Threads serving requests in each gunicorn worker (start_prod.sh)
+APP_SERVER_THREADS = config('APP_SERVER_THREADS', default=16, cast=int)
+
+# PostgreSQL connections persist for DB_CONN_MAX_AGE seconds per thread and
+# are checked before reuse. With DB_POOL=True each worker process shares a
+# pool of at most DB_POOL_MAX_SIZE connections between its threads instead
+# (see crm.dbpool). The pool must cover every request thread and query
+# thread, so it defaults to their sum; keep workers * DB_POOL_MAX_SIZE below
+# max_connections
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=60, cast=int)
+DB_POOL = config('DB_POOL', default=False, cast=bool)
+DB_POOL_THREADS = APP_SERVER_THREADS + (PARALLEL_QUERY_THREADS if PARALLEL_QUERY_THREADS >= 2 else 0)
+DB_POOL_MAX_SIZE = config('DB_POOL_MAX_SIZE', default=DB_POOL_THREADS, cast=int)
+if DB_POOL and DB_POOL_MAX_SIZE < DB_POOL_THREADS:
+    raise ImproperlyConfigured(
+        f'DB_POOL_MAX_SIZE={DB_POOL_MAX_SIZE} cannot serve APP_SERVER_THREADS={APP_SERVER_THREADS} '
+        f'request threads and PARALLEL_QUERY_THREADS={PARALLEL_QUERY_THREADS} query threads at once'
+    )
+
 if DB_ENGINE == 'postgresql':
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.postgresql',
+            'ENGINE': 'crm.dbpool' if DB_POOL else 'django.db.backends.postgresql',
             'NAME': config('DB_NAME', default='crm_db'),
             'USER': config('DB_USER', default='postgres'),
             'PASSWORD': config('DB_PASSWORD', default='postgres'),
             'HOST': config('DB_HOST', default='localhost'),
             'PORT': config('DB_PORT', default='5432'),
+            # The pool keeps connections itself; Django gives them back after each request
+            'CONN_MAX_AGE': 0 if DB_POOL else DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': config('DB_CONNECT_TIMEOUT', default=5, cast=int),
+                # Notice dead connections, e.g. after a failover, instead of hanging
+                'keepalives': 1,
+                'keepalives_idle': 30,
+                'keepalives_interval': 10,
+                'keepalives_count': 3,
+            },
+            'POOL': {
+                'MAX_SIZE': DB_POOL_MAX_SIZE,
+                'TIMEOUT': config('DB_POOL_TIMEOUT', default=10.0, cast=float),
+                'CHECK_AFTER': config('DB_POOL_CHECK_AFTER', default=1.0, cast=float),
+                'MAX_IDLE': config('DB_POOL_MAX_IDLE', default=600, cast=int),
+                'MAX_LIFETIME': config('DB_POOL_MAX_LIFETIME', default=3600, cast=int),
+            },
         }
     }
 else:
@@ -100,6 +147,67 @@ else:
     }
 
 
+# Read replica
+# With DB_REPLICA=True, safe requests to the views that allow it read from the
+# `replica` database (see crm.routers): DB_REPLICA_HOST with PostgreSQL, and
+# db_replica.sqlite3, a copy of db.sqlite3 that stays behind, with SQLite.
+# Users who write read from the primary for REPLICA_STICKY_SECONDS afterwards,
+# marked by a signed cookie that every worker process can check
+DB_REPLICA = config('DB_REPLICA', default=False, cast=bool)
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=10, cast=int)
+
+if DB_REPLICA:
+    if DB_ENGINE == 'postgresql':
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'HOST': config('DB_REPLICA_HOST'),
+            'PORT': config('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        }
+    else:
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'NAME': BASE_DIR / 'db_replica.sqlite3',
+        }
+    # Tests read and write a single database
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_ROUTERS = ['crm.routers.ReplicaRouter']
+
+
+# Cache
+# Shared by every worker process and the Celery tasks, as writes anywhere must
+# invalidate what is cached (see crm.cache): Redis when REDIS_CACHE_URL is set,
+# else a table in the database, created by `manage.py createcachetable`
+REDIS_CACHE_URL = config('REDIS_CACHE_URL', default='')
+
+if REDIS_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'crm_cache',
+            'OPTIONS': {
+                'MAX_ENTRIES': config('DB_CACHE_MAX_ENTRIES', default=10000, cast=int),
+            },
+        }
+    }
+
+# Seconds authenticated users are cached for, so requests skip the user
+# lookup; saving a user invalidates its cached copies at once. On by default
+# only with Redis: reading a cached user from the database cache takes two
+# queries where loading it takes one. 0 turns the cache off
+USER_CACHE_TIMEOUT = config('USER_CACHE_TIMEOUT', default=60 if REDIS_CACHE_URL else 0, cast=int)
+
+# Seconds the global and per-user dashboard stats are cached for
+DASHBOARD_CACHE_TIMEOUT = config('DASHBOARD_CACHE_TIMEOUT', default=300, cast=int)
+DASHBOARD_USER_CACHE_TIMEOUT = config('DASHBOARD_USER_CACHE_TIMEOUT', default=60, cast=int)
+
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -129,6 +237,66 @@ STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# Hand batched audit log writes to a Celery worker instead of the request
+AUDIT_LOG_ASYNC = config('AUDIT_LOG_ASYNC', default=False, cast=bool)
+
+# Audit log retention: months kept in the database, months of archive files
+# kept on disk (0 keeps them forever), and monthly partitions created ahead
+AUDIT_LOG_RETENTION_MONTHS = config('AUDIT_LOG_RETENTION_MONTHS', default=12, cast=int)
+AUDIT_ARCHIVE_RETENTION_MONTHS = config('AUDIT_ARCHIVE_RETENTION_MONTHS', default=0, cast=int)
+AUDIT_LOG_PARTITIONS_AHEAD = config('AUDIT_LOG_PARTITIONS_AHEAD', default=3, cast=int)
+AUDIT_ARCHIVE_ROOT = config('AUDIT_ARCHIVE_ROOT', default=str(BASE_DIR / 'media' / 'audit_archive'))
+
+# Background export files and rows per export chunk
+EXPORT_ROOT = config('EXPORT_ROOT', default=str(BASE_DIR / 'media' / 'exports'))
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=50000, cast=int)
+# Seconds without progress after which an export job may be resumed and the
+# chunk a task was writing handed to another; keep above the time one chunk takes
+EXPORT_STALLED_SECONDS = config('EXPORT_STALLED_SECONDS', default=900, cast=int)
+
+# Lead imports: uploaded files, rows validated and inserted per chunk, failed
+# rows recorded per job, and uploads up to IMPORT_SYNC_MAX_BYTES imported
+# within the request instead of by a Celery worker
+IMPORT_ROOT = config('IMPORT_ROOT', default=str(BASE_DIR / 'media' / 'imports'))
+IMPORT_CHUNK_SIZE = config('IMPORT_CHUNK_SIZE', default=2000, cast=int)
+IMPORT_MAX_ERRORS = config('IMPORT_MAX_ERRORS', default=100, cast=int)
+IMPORT_SYNC_MAX_BYTES = config('IMPORT_SYNC_MAX_BYTES', default=256 * 1024, cast=int)
+
+# Largest number of rows accepted by the bulk create, update and delete endpoints
+BULK_MAX_ROWS = config('BULK_MAX_ROWS', default=1000, cast=int)
+
+# Duplicate lead detection: minimum score for a candidate pair, and blocks
+# (leads sharing a match key) larger than this are skipped as too generic
+DUPLICATE_MIN_SCORE = config('DUPLICATE_MIN_SCORE', default=0.5, cast=float)
+DUPLICATE_MAX_BLOCK_SIZE = config('DUPLICATE_MAX_BLOCK_SIZE', default=500, cast=int)
+
+# Changes feeds: rows and tombstones sent per response, seconds of recent
+# writes held back until commits settle, and days tombstones are kept (older
+# sync cursors must start over)
+SYNC_PAGE_SIZE = config('SYNC_PAGE_SIZE', default=5000, cast=int)
+SYNC_SETTLE_SECONDS = config('SYNC_SETTLE_SECONDS', default=5, cast=int)
+SYNC_TOMBSTONE_RETENTION_DAYS = config('SYNC_TOMBSTONE_RETENTION_DAYS', default=90, cast=int)
+
+# Render and parse API JSON with orjson (crm.renderers) instead of DRF's
+# stdlib-based classes; the output is the same either way
+FAST_JSON = config('FAST_JSON', default=True, cast=bool)
+
+# Per-request instrumentation (crm.performance): a Server-Timing header with
+# the SQL, serialization and render times, sent by default only with DEBUG
+# since it tells every client how many queries a request ran, a warning
+# listing the slowest queries and their plans for requests of
+# PERF_SLOW_REQUEST_MS or more, and
+# cProfile stats of PERF_PROFILE_SAMPLE_RATE of the requests to the URL
+# named PERF_PROFILE_ROUTE, written to PERF_PROFILE_DIR
+PERF_INSTRUMENTATION = config('PERF_INSTRUMENTATION', default=True, cast=bool)
+PERF_SERVER_TIMING = config('PERF_SERVER_TIMING', default=DEBUG, cast=bool)
+PERF_SLOW_REQUEST_MS = config('PERF_SLOW_REQUEST_MS', default=1000, cast=int)
+PERF_SLOW_QUERIES = config('PERF_SLOW_QUERIES', default=5, cast=int)
+PERF_EXPLAIN_SLOW_QUERIES = config('PERF_EXPLAIN_SLOW_QUERIES', default=True, cast=bool)
+PERF_PROFILE_ROUTE = config('PERF_PROFILE_ROUTE', default='')
+PERF_PROFILE_SAMPLE_RATE = config('PERF_PROFILE_SAMPLE_RATE', default=0.01, cast=float)
+PERF_PROFILE_DIR = config('PERF_PROFILE_DIR', default=str(BASE_DIR / 'media' / 'profiles'))
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -138,17 +306,26 @@ AUTH_USER_MODEL = 'users.User'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
-        'rest_framework.filters.SearchFilter',
-        'rest_framework.filters.OrderingFilter',
+        'crm.search.FullTextSearchFilter',
+        'crm.search.RankedOrderingFilter',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_RENDERER_CLASSES': (
+        'crm.renderers.ORJSONRenderer' if FAST_JSON else 'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'crm.renderers.ORJSONParser' if FAST_JSON else 'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'crm.pagination.CRMPagination',
     'PAGE_SIZE': 20,
 }
 
@@ -186,3 +363,25 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Reminders claimed and sent per batch, and dispatch tasks started per run
+REMINDER_BATCH_SIZE = config('REMINDER_BATCH_SIZE', default=500, cast=int)
+REMINDER_DISPATCH_WORKERS = config('REMINDER_DISPATCH_WORKERS', default=4, cast=int)
+
+# Redis pub/sub channel the reminder scheduler listens on for reminder changes,
+# and the longest it sleeps without a due reminder or a message
+REMINDER_SCHEDULER_URL = config('REMINDER_SCHEDULER_URL', default=CELERY_BROKER_URL)
+REMINDER_SCHEDULER_CHANNEL = config('REMINDER_SCHEDULER_CHANNEL', default='crm:reminders')
+REMINDER_SCHEDULER_MAX_SLEEP = config('REMINDER_SCHEDULER_MAX_SLEEP', default=60, cast=float)
+
+# Live dashboard events (crm.events): the pub/sub broker (crm.events.InMemoryBroker
+# only reaches subscribers in the same process), seconds each event stream
+# stays open before the browser reconnects, seconds between keepalives,
+# events buffered per subscriber of the in-memory broker, and streams each
+# process serves at once (under WSGI each holds one of the worker's
+# threads, 16 in start_prod.sh; further streams are answered 503)
+EVENTS_BROKER = config('EVENTS_BROKER', default='crm.events.RedisBroker')
+EVENTS_REDIS_URL = config('EVENTS_REDIS_URL', default=CELERY_BROKER_URL)
+EVENTS_STREAM_SECONDS = config('EVENTS_STREAM_SECONDS', default=300, cast=int)
+EVENTS_HEARTBEAT_SECONDS = config('EVENTS_HEARTBEAT_SECONDS', default=15, cast=int)
+EVENTS_QUEUE_SIZE = config('EVENTS_QUEUE_SIZE', default=1000, cast=int)
+EVENTS_MAX_STREAMS = config('EVENTS_MAX_STREAMS', default=8, cast=int)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Lead, Contact, Note, Reminder, Correspondence, AuditLog
+from .models import Lead, Contact, Note, Reminder, Correspondence, AuditLog, ExportJob, ImportJob, DuplicateCandidate
 
 
 @admin.register(Lead)
@@ -66,3 +66,30 @@ class AuditLogAdmin(admin.ModelAdmin):
         return False
 
 
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'model_name', 'format', 'status', 'completed_chunks', 'total_chunks', 'rows_exported', 'created_at']
+    list_filter = ['model_name', 'format', 'status', 'created_at']
+    date_hierarchy = 'created_at'
+    raw_id_fields = ['user']
+    readonly_fields = ['total_chunks', 'completed_chunks', 'rows_exported', 'file_path', 'error', 'finished_at']
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'file_name', 'format', 'status', 'rows_imported', 'rows_skipped', 'rows_failed', 'created_at']
+    list_filter = ['format', 'status', 'created_at']
+    date_hierarchy = 'created_at'
+    raw_id_fields = ['user']
+    readonly_fields = [
+        'file_path', 'file_size', 'bytes_processed', 'rows_processed', 'rows_imported',
+        'rows_skipped', 'rows_failed', 'errors', 'error', 'finished_at'
+    ]
+
+
+@admin.register(DuplicateCandidate)
+class DuplicateCandidateAdmin(admin.ModelAdmin):
+    list_display = ['lead', 'duplicate', 'score', 'status', 'created_at']
+    list_filter = ['status', 'created_at']
+    raw_id_fields = ['lead', 'duplicate']
+    readonly_fields = ['score', 'reasons']
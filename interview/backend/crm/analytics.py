@@ -0,0 +1,113 @@
+"""
+Daily rollups backing the analytics endpoints.
+
+Writes mark the days they affect as dirty; the `update_analytics_rollups`
+task recomputes only those days, so the endpoints can answer any date
+range from a few small rollup rows instead of scanning Lead and AuditLog.
+"""
+
+from django.db import transaction
+from django.db.models import Count, Sum, OuterRef, Subquery, DecimalField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Lead, AuditLog, LeadDailyRollup, ConversionDailyRollup, RollupDirtyDay
+from .oncommit import collect_on_commit
+
+
+def to_day(value):
+    """Calendar day of an aware datetime in the current time zone."""
+    return timezone.localtime(value).date()
+
+
+def mark_days_dirty(kind, days):
+    """
+    Queue days for recomputation by the next rollup run.
+
+    Within a transaction the days are collected and written once it
+    commits, so a bulk write of many rows marks each day once.
+    """
+    collect_on_commit('dirty_days', {(kind, day) for day in days}, write_dirty_days)
+
+
+def write_dirty_days(days):
+    RollupDirtyDay.objects.bulk_create(
+        [RollupDirtyDay(kind=kind, day=day) for kind, day in days],
+        ignore_conflicts=True
+    )
+
+
+def rollup_leads_for_day(day):
+    rows = (
+        Lead.objects.filter(created_at__date=day)
+        .order_by()
+        .values('status', 'owner')
+        .annotate(leads_created=Count('id'), value_created=Sum('estimated_value'))
+    )
+    LeadDailyRollup.objects.filter(day=day).delete()
+    LeadDailyRollup.objects.bulk_create([
+        LeadDailyRollup(
+            day=day,
+            status=row['status'],
+            owner_id=row['owner'],
+            leads_created=row['leads_created'],
+            value_created=row['value_created'] or 0,
+        )
+        for row in rows
+    ])
+
+
+def rollup_conversions_for_day(day):
+    leads = Lead.objects.filter(id=OuterRef('object_id'))
+    rows = (
+        AuditLog.objects.filter(
+            timestamp__date=day,
+            model_name='Lead',
+            action='update',
+            changes__status__new='converted',
+        )
+        .annotate(
+            owner=Subquery(leads.values('owner')[:1]),
+            value=Coalesce(
+                Subquery(leads.values('estimated_value')[:1]),
+                0,
+                output_field=DecimalField(max_digits=16, decimal_places=2)
+            ),
+        )
+        .order_by()
+        .values('owner')
+        .annotate(conversions=Count('id'), converted_value=Sum('value'))
+    )
+    ConversionDailyRollup.objects.filter(day=day).delete()
+    ConversionDailyRollup.objects.bulk_create([
+        ConversionDailyRollup(
+            day=day,
+            owner_id=row['owner'],
+            conversions=row['conversions'],
+            converted_value=row['converted_value'] or 0,
+        )
+        for row in rows
+    ])
+
+
+ROLLUPS = {
+    'leads': rollup_leads_for_day,
+    'conversions': rollup_conversions_for_day,
+}
+
+
+def update_rollups():
+    """Recompute every dirty day and return how many were processed."""
+    dirty = list(RollupDirtyDay.objects.values_list('id', 'kind', 'day'))
+    for dirty_id, kind, day in dirty:
+        with transaction.atomic():
+            # Claim the day first so writes during the run re-mark it
+            RollupDirtyDay.objects.filter(id=dirty_id).delete()
+            ROLLUPS[kind](day)
+    return len(dirty)
+
+
+def rebuild_rollups():
+    """Mark every day that has data as dirty, for a full rebuild."""
+    mark_days_dirty('leads', Lead.objects.dates('created_at', 'day'))
+    mark_days_dirty('conversions', AuditLog.objects.filter(model_name='Lead', action='update').dates('timestamp', 'day'))
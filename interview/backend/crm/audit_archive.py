@@ -0,0 +1,440 @@
+"""
+Monthly partitioning, retention and cold archiving for the audit log.
+
+On PostgreSQL `crm_auditlog` is range-partitioned by month on `timestamp`
+(see migration 0006), so an expired month is detached in one statement.
+On other backends the month is copied into its own period table and
+removed from `crm_auditlog`, which plays the same role as a detached
+partition. Detached periods are written to gzipped JSON Lines files,
+recorded in AuditLogArchive, and dropped.
+
+Each archive has a sidecar file listing the objects it mentions, so
+per-object audit lookups only decompress archives that can match.
+"""
+
+import gzip
+import json
+from datetime import date, datetime, time, timezone as dt_timezone
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .cache import bump_version
+from .models import AuditLog, AuditLogArchive
+
+
+TABLE = AuditLog._meta.db_table
+COLUMNS = ['id', 'user_id', 'action', 'model_name', 'object_id', 'object_repr', 'changes', 'timestamp', 'ip_address']
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return date(value.year + month // 12, month % 12 + 1, 1)
+
+
+def period_table(period_start):
+    return f'{TABLE}_p{period_start:%Y%m}'
+
+
+def period_bounds(period_start):
+    """Aware datetimes [start, end) covering one month in UTC."""
+    start = datetime.combine(period_start, time.min, tzinfo=dt_timezone.utc)
+    end = datetime.combine(add_months(period_start, 1), time.min, tzinfo=dt_timezone.utc)
+    return start, end
+
+
+def period_params(period_start):
+    """period_bounds() adapted for raw SQL on the current backend."""
+    return [connection.ops.adapt_datetimefield_value(value) for value in period_bounds(period_start)]
+
+
+def is_partitioned():
+    return connection.vendor == 'postgresql'
+
+
+def get_retention_cutoff(retention_months=None):
+    """First month that is still kept in the database."""
+    if retention_months is None:
+        retention_months = settings.AUDIT_LOG_RETENTION_MONTHS
+    return add_months(month_start(timezone.now()), -retention_months)
+
+
+# Partition maintenance (PostgreSQL)
+
+def create_partition(cursor, period_start):
+    cursor.execute(
+        f'CREATE TABLE IF NOT EXISTS "{period_table(period_start)}" '
+        f'PARTITION OF "{TABLE}" FOR VALUES FROM (%s) TO (%s)',
+        period_params(period_start)
+    )
+
+
+def ensure_partitions(months_ahead=None):
+    """Create the monthly partitions for the current month and the next few."""
+    if not is_partitioned():
+        return []
+    if months_ahead is None:
+        months_ahead = settings.AUDIT_LOG_PARTITIONS_AHEAD
+    current = month_start(timezone.now())
+    periods = [add_months(current, offset) for offset in range(months_ahead + 1)]
+    with connection.cursor() as cursor:
+        for period_start in periods:
+            create_partition(cursor, period_start)
+    return periods
+
+
+def attached_partitions(cursor):
+    cursor.execute(
+        """
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+        JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+        WHERE parent.relname = %s
+        """,
+        [TABLE]
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+# Detaching expired periods
+
+def expired_periods(cutoff):
+    """Months before `cutoff` that still have rows in the hot table."""
+    months = AuditLog.objects.filter(timestamp__lt=period_bounds(cutoff)[0]).dates('timestamp', 'month')
+    return [month_start(value) for value in months]
+
+
+def detach_period(period_start):
+    """
+    Move one month out of the hot table into its own detached table and
+    return the table name. On PostgreSQL this detaches the partition; rows
+    that landed in the default partition are moved alongside it.
+    """
+    table = period_table(period_start)
+    params = period_params(period_start)
+    columns = ', '.join(f'"{column}"' for column in COLUMNS)
+    with transaction.atomic(), connection.cursor() as cursor:
+        if is_partitioned() and table in attached_partitions(cursor):
+            cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{table}"')
+        else:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table}" AS SELECT {columns} FROM "{TABLE}" WHERE 1 = 0'
+            )
+        cursor.execute(
+            f'INSERT INTO "{table}" ({columns}) SELECT {columns} FROM "{TABLE}" '
+            f'WHERE "timestamp" >= %s AND "timestamp" < %s',
+            params
+        )
+        cursor.execute(f'DELETE FROM "{TABLE}" WHERE "timestamp" >= %s AND "timestamp" < %s', params)
+    return table
+
+
+def detached_periods():
+    """Period tables left over from a detach whose archive did not finish."""
+    tables = connection.introspection.table_names()
+    prefix = f'{TABLE}_p'
+    attached = set()
+    if is_partitioned():
+        with connection.cursor() as cursor:
+            attached = attached_partitions(cursor)
+    periods = []
+    for table in tables:
+        if table.startswith(prefix) and table not in attached:
+            suffix = table[len(prefix):]
+            if len(suffix) == 6 and suffix.isdigit():
+                periods.append(date(int(suffix[:4]), int(suffix[4:]), 1))
+    return sorted(periods)
+
+
+# Writing archives
+
+def get_archive_paths(period_start):
+    root = Path(settings.AUDIT_ARCHIVE_ROOT)
+    name = f'auditlog-{period_start:%Y-%m}'
+    return root / f'{name}.jsonl.gz', root / f'{name}.keys.json.gz'
+
+
+def normalize_row(row):
+    entry = dict(zip(COLUMNS, row))
+    if isinstance(entry['changes'], str):
+        entry['changes'] = json.loads(entry['changes'])
+    if isinstance(entry['timestamp'], str):
+        entry['timestamp'] = parse_datetime(entry['timestamp'])
+    if timezone.is_naive(entry['timestamp']):
+        entry['timestamp'] = timezone.make_aware(entry['timestamp'], dt_timezone.utc)
+    entry['timestamp'] = entry['timestamp'].isoformat()
+    return entry
+
+
+def archive_period(period_start):
+    """
+    Write a detached period table to a gzipped JSON Lines file, record it
+    and drop the table. Returns the AuditLogArchive row.
+    """
+    table = period_table(period_start)
+    path, keys_path = get_archive_paths(period_start)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp')
+
+    keys = set()
+    count = 0
+    columns = ', '.join(f'"{column}"' for column in COLUMNS)
+    with connection.cursor() as cursor, gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        cursor.execute(f'SELECT {columns} FROM "{table}" ORDER BY "timestamp" DESC, "id" DESC')
+        while True:
+            rows = cursor.fetchmany(2000)
+            if not rows:
+                break
+            for row in rows:
+                entry = normalize_row(row)
+                keys.add(f"{entry['model_name']}:{entry['object_id']}")
+                f.write(json.dumps(entry, separators=(',', ':')))
+                f.write('\n')
+                count += 1
+
+    with gzip.open(keys_path, 'wt', encoding='utf-8') as f:
+        json.dump(sorted(keys), f)
+    tmp_path.replace(path)
+
+    with transaction.atomic():
+        archive, _ = AuditLogArchive.objects.update_or_create(
+            period_start=period_start,
+            defaults={
+                'period_end': add_months(period_start, 1),
+                'path': str(path),
+                'keys_path': str(keys_path),
+                'row_count': count,
+            }
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE "{table}"')
+    return archive
+
+
+def archive_expired(retention_months=None, dry_run=False):
+    """Detach and archive every month older than the retention window."""
+    cutoff = get_retention_cutoff(retention_months)
+    periods = sorted(set(expired_periods(cutoff)) | set(detached_periods()))
+    if dry_run:
+        return periods
+    archives = []
+    for period_start in periods:
+        detach_period(period_start)
+        archives.append(archive_period(period_start))
+    if archives:
+        # The rows left the table without post_delete
+        bump_version('auditlog')
+    return archives
+
+
+def purge_archives(archive_retention_months=None, dry_run=False):
+    """Delete archive files older than AUDIT_ARCHIVE_RETENTION_MONTHS (0 keeps them)."""
+    if archive_retention_months is None:
+        archive_retention_months = settings.AUDIT_ARCHIVE_RETENTION_MONTHS
+    if not archive_retention_months:
+        return []
+    cutoff = add_months(month_start(timezone.now()), -archive_retention_months)
+    expired = list(AuditLogArchive.objects.filter(period_start__lt=cutoff))
+    if not dry_run:
+        for archive in expired:
+            Path(archive.path).unlink(missing_ok=True)
+            Path(archive.keys_path).unlink(missing_ok=True)
+            archive.delete()
+    return expired
+
+
+# Reading archives
+
+@lru_cache(maxsize=64)
+def load_archive_keys(keys_path):
+    with gzip.open(keys_path, 'rt', encoding='utf-8') as f:
+        return frozenset(json.load(f))
+
+
+def iter_archive(archive):
+    path = Path(archive.path)
+    if not path.exists():
+        return
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def to_audit_log(entry):
+    entry = dict(entry)
+    entry['timestamp'] = parse_datetime(entry['timestamp'])
+    return AuditLog(**entry)
+
+
+def attach_users(entries):
+    """Resolve the user of archived entries with one query."""
+    User = get_user_model()
+    user_ids = {entry.user_id for entry in entries if entry.user_id}
+    users = User.objects.in_bulk(user_ids)
+    for entry in entries:
+        entry.user = users.get(entry.user_id)
+    return entries
+
+
+def archived_entries_for_object(model_name, object_id):
+    """Archived entries about one object, newest first."""
+    key = f'{model_name}:{object_id}'
+    entries = []
+    for archive in AuditLogArchive.objects.all():
+        try:
+            if key not in load_archive_keys(archive.keys_path):
+                continue
+        except FileNotFoundError:
+            continue
+        entries.extend(
+            to_audit_log(entry) for entry in iter_archive(archive)
+            if entry['model_name'] == model_name and entry['object_id'] == object_id
+        )
+    return attach_users(entries)
+
+
+class ArchivedEntries:
+    """
+    Archived entries matching the AuditLogViewSet filters, newest first or,
+    with `oldest_first`, oldest first, as a sequence the paginator can count
+    and slice.
+
+    Archives of months outside [start, end) are never opened. Counting an
+    archive wholly inside the range uses its row_count when no other filter
+    applies, and a slice only decompresses the archives it reaches.
+    """
+
+    def __init__(self, user=None, action=None, model_name=None, search=None, start=None, end=None, oldest_first=False):
+        archives = AuditLogArchive.objects.order_by('period_start' if oldest_first else '-period_start')
+        if start:
+            archives = archives.filter(period_end__gt=start.astimezone(dt_timezone.utc).date())
+        if end:
+            archives = archives.filter(period_start__lte=end.astimezone(dt_timezone.utc).date())
+        self.archives = list(archives)
+        self.user = str(user) if user else None
+        self.action = action
+        self.model_name = model_name
+        self.search = search.lower() if search else None
+        self.start = start
+        self.end = end
+        self.oldest_first = oldest_first
+        self.counts = {}
+
+    def is_filtered(self, archive):
+        """Whether some entries of the archive may not match."""
+        if self.user or self.action or self.model_name or self.search:
+            return True
+        period_start, period_end = period_bounds(archive.period_start)
+        return bool(self.start and self.start > period_start or self.end and self.end < period_end)
+
+    def matches(self, entry):
+        if self.user and str(entry['user_id']) != self.user:
+            return False
+        if self.action and entry['action'] != self.action:
+            return False
+        if self.model_name and entry['model_name'] != self.model_name:
+            return False
+        if self.search and self.search not in entry['object_repr'].lower():
+            return False
+        if self.start or self.end:
+            timestamp = parse_datetime(entry['timestamp'])
+            if self.start and timestamp < self.start or self.end and timestamp >= self.end:
+                return False
+        return True
+
+    def iter_matching(self, archive):
+        entries = iter_archive(archive)
+        if self.oldest_first:
+            entries = reversed(list(entries))
+        return (entry for entry in entries if self.matches(entry))
+
+    def count_archive(self, archive):
+        if archive.pk not in self.counts:
+            if self.is_filtered(archive):
+                self.counts[archive.pk] = sum(1 for _ in self.iter_matching(archive))
+            else:
+                self.counts[archive.pk] = archive.row_count
+        return self.counts[archive.pk]
+
+    def __len__(self):
+        return sum(self.count_archive(archive) for archive in self.archives)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        if (index.start or 0) < 0 or (index.stop or 0) < 0:
+            index = slice(*index.indices(len(self))[:2])
+        start = index.start or 0
+        stop = len(self) if index.stop is None else index.stop
+        entries = []
+        offset = 0
+        for archive in self.archives:
+            if offset >= stop:
+                break
+            # Skip archives before the slice without opening them when their count is known
+            if archive.pk in self.counts or not self.is_filtered(archive):
+                count = self.count_archive(archive)
+                if offset + count <= start:
+                    offset += count
+                    continue
+            for entry in self.iter_matching(archive):
+                if offset >= stop:
+                    break
+                if offset >= start:
+                    entries.append(to_audit_log(entry))
+                offset += 1
+        return attach_users(entries)
+
+
+def audit_history(model_name, object_id):
+    """Hot and archived audit entries for one object, newest first."""
+    hot = list(AuditLog.objects.filter(model_name=model_name, object_id=object_id).select_related('user'))
+    return hot + archived_entries_for_object(model_name, object_id)
+
+
+def count_items(items):
+    return items.count() if isinstance(items, QuerySet) else len(items)
+
+
+class ChainedResults:
+    """
+    Read-only sequence of a queryset and archived entries, one after the
+    other, sliceable by the paginator without evaluating either in full.
+    """
+
+    def __init__(self, first, second):
+        self.first = first
+        self.second = second
+        self._first_count = None
+        self._second_count = None
+
+    def first_count(self):
+        if self._first_count is None:
+            self._first_count = count_items(self.first)
+        return self._first_count
+
+    def __len__(self):
+        if self._second_count is None:
+            self._second_count = count_items(self.second)
+        return self.first_count() + self._second_count
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop, _ = index.indices(len(self))
+        split = self.first_count()
+        items = list(self.first[start:min(stop, split)]) if start < split else []
+        if stop > split:
+            items += self.second[max(start - split, 0):stop - split]
+        return items
+
@@ -0,0 +1,94 @@
+"""
+Versioned caching helpers for read-heavy CRM views.
+
+Cached values are keyed on per-model versions. Writes bump the version of
+the model they touch, which makes every key built from the old version
+unreachable without having to find and delete them. Versions must live in
+the cache every worker and Celery task shares, which is why the fallback
+cache is the database rather than per-process memory.
+
+Versions are timestamps rather than counters: a bump is a plain set, so
+concurrent bumps cannot lose one another as a read-and-write increment on
+the database cache could, and a version evicted from the cache is never
+handed out again.
+"""
+
+import time
+import uuid
+
+from django.core.cache import cache
+
+from .oncommit import collect_on_commit
+from .routers import primary_reads
+
+
+VERSION_KEY = 'crm:version:{}'
+
+
+def get_version(name):
+    """Current version of a model name."""
+    key = VERSION_KEY.format(name)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def get_versions(*names):
+    keys = {VERSION_KEY.format(name): name for name in names}
+    found = cache.get_many(keys)
+    return [found.get(VERSION_KEY.format(name)) or get_version(name) for name in names]
+
+
+def bump_version(*names):
+    """Invalidate everything cached against these model names."""
+    version = time.time_ns()
+    cache.set_many({VERSION_KEY.format(name): version for name in names}, timeout=None)
+
+
+def bump_version_on_commit(*names):
+    """
+    Bump these versions once the current transaction commits. Bumping
+    before would let a concurrent read cache the old rows under the new
+    version; bumping after at worst recomputes the new rows once more.
+    """
+    collect_on_commit('versions', names, lambda names: bump_version(*names))
+
+
+def get_or_compute(key, compute, timeout, lock_timeout=30, wait_timeout=10, poll_interval=0.05):
+    """
+    Return the cached value for `key`, computing it at most once at a time.
+
+    Concurrent misses collapse into a single computation: the first caller
+    takes a lock in the shared cache and computes, the others poll for the
+    value it stores. If the winner dies its lock expires and a waiter takes
+    over; after `wait_timeout` waiters stop waiting and compute themselves.
+    Values are computed from the primary database, as one read from a
+    lagging replica would stay cached under the new version.
+    """
+    lock_key = f'{key}:lock'
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + wait_timeout
+    while True:
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if cache.add(lock_key, token, timeout=lock_timeout):
+            try:
+                with primary_reads():
+                    value = compute()
+                cache.set(key, value, timeout=timeout)
+                return value
+            finally:
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(poll_interval)
+
+    with primary_reads():
+        value = compute()
+    cache.set(key, value, timeout=timeout)
+    return value
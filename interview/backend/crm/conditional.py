@@ -0,0 +1,257 @@
+"""
+Conditional GET for the CRM read endpoints.
+
+Responses carry an ETag and a Last-Modified header that change whenever
+what they render may have changed: the rows of the list or the object
+itself, plus the related rows nested in them. A request whose
+If-None-Match or If-Modified-Since still matches is answered with 304 Not
+Modified before the page is fetched or serialized.
+
+When every model rendered has a cache version (crm.cache, bumped by
+crm.signals on each write), the validators are those versions, read in one
+cache lookup, so a plain GET costs no extra query. Views add the versions
+of what they render without a relation the mixin follows, such as the
+`user` version for nested users (bumped by users.signals). Versions are the time
+of the last write, which also gives Last-Modified. Other views fall back
+to the row count and newest `updated_at` of the rows rendered, from
+aggregate queries.
+
+Removing a row lowers the count but does not move the newest `updated_at`
+forward, so lists only answer If-None-Match. If-Modified-Since is honoured
+on detail views, where a removed object is a 404 instead.
+"""
+
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+from functools import partial
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from .cache import get_versions
+from .models import Reminder, AuditLog
+from .performance import timed
+from .serializers import RowSerializer
+from .signals import CACHED_MODELS
+
+
+# Models whose rows are never updated, by the field set when they are written
+MODIFIED_FIELDS = {
+    AuditLog: 'timestamp',
+}
+
+# Aggregates for rendered values that change without a write
+VOLATILE_AGGREGATES = {
+    Reminder: lambda now: {'overdue': Count('pk', filter=Q(status='pending', reminder_date__lt=now))},
+}
+
+
+def modified_field(model):
+    return MODIFIED_FIELDS.get(model, 'updated_at')
+
+
+def row_aggregates(model):
+    aggregates = {'count': Count('pk'), 'modified': Max(modified_field(model))}
+    if model in VOLATILE_AGGREGATES:
+        aggregates.update(VOLATILE_AGGREGATES[model](timezone.now()))
+    return aggregates
+
+
+def get_validators(queryset, parents=(), children=()):
+    """
+    Return (count, parts, last_modified) for the rows of `queryset`.
+    `parents` are forward foreign keys rendered with each row, whose newest
+    modification joins the row aggregates; `children` are reverse foreign
+    keys, aggregated over the children of every row in one query each.
+    """
+    model = queryset.model
+    queryset = queryset.order_by()
+    aggregates = row_aggregates(model)
+    for name in parents:
+        parent = model._meta.get_field(name).related_model
+        aggregates[f'{name}_modified'] = Max(f'{name}__{modified_field(parent)}')
+    values = queryset.aggregate(**aggregates)
+    parts = list(values.items())
+    modified = [value for key, value in values.items() if key.endswith('modified')]
+
+    for name in children:
+        relation = model._meta.get_field(name)
+        child = relation.related_model
+        rows = child.objects.filter(**{f'{relation.field.name}__in': queryset.values('pk')})
+        child_values = rows.order_by().aggregate(**row_aggregates(child))
+        parts.append((name, list(child_values.values())))
+        modified.append(child_values['modified'])
+
+    last_modified = max((value for value in modified if value is not None), default=None)
+    return values['count'], parts, last_modified
+
+
+def version_time(versions):
+    """The time of the latest of `versions`, which are write times in nanoseconds."""
+    return datetime.fromtimestamp(max(versions) / 1e9, tz=dt_timezone.utc)
+
+
+def get_version_validators(queryset, parents=(), children=(), extra_versions=()):
+    """
+    Return (parts, last_modified) for the rows of `queryset` from the cache
+    versions of the models rendered and `extra_versions`, or None if one of
+    the models has none. Values that change without a write are still
+    aggregated.
+    """
+    model = queryset.model
+    relations = [model._meta.get_field(name) for name in (*parents, *children)]
+    models = [model, *(relation.related_model for relation in relations)]
+    if not all(related in CACHED_MODELS for related in models):
+        return None
+    versions = get_versions(*dict.fromkeys([*(related._meta.model_name for related in models), *extra_versions]))
+    parts = [('versions', versions)]
+
+    now = timezone.now()
+    if model in VOLATILE_AGGREGATES:
+        parts.append(('volatile', list(queryset.order_by().aggregate(**VOLATILE_AGGREGATES[model](now)).values())))
+    for name in children:
+        relation = model._meta.get_field(name)
+        child = relation.related_model
+        if child in VOLATILE_AGGREGATES:
+            rows = child.objects.filter(**{f'{relation.field.name}__in': queryset.values('pk')})
+            parts.append((name, list(rows.order_by().aggregate(**VOLATILE_AGGREGATES[child](now)).values())))
+
+    return parts, version_time(versions)
+
+
+def make_etag(request, parts):
+    """Weak ETag for `parts`, varying with the user, URL and media type."""
+    key = repr([
+        request.user.pk,
+        request.get_full_path(),
+        getattr(request, 'accepted_media_type', None),
+        *parts,
+    ])
+    return f'W/"{hashlib.md5(key.encode("utf-8")).hexdigest()}"'
+
+
+def not_modified(request, etag, last_modified=None):
+    """A 304 response if the request's validators still match, else None."""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Clients keep their copy but revalidate it, and each user gets their own
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def conditional_response(request, etag, render, last_modified=None, use_last_modified=True):
+    """
+    Answer with 304 when the client's copy is current, otherwise with
+    `render()`. Successful responses get the validators either way.
+    """
+    response = not_modified(request, etag, last_modified if use_last_modified else None)
+    if response is None:
+        response = render()
+    if response.status_code in (200, 304):
+        set_validators(response, etag, last_modified)
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    ETag and Last-Modified on `list` and `retrieve`.
+    `conditional_parents` and `conditional_children` name the relations the
+    serializer renders for each row, so writes to them change the
+    validators too. Detail views use `conditional_detail_children` if set.
+    `conditional_versions` names further cache versions the rendered data
+    depends on, e.g. `user` for serializers nesting UserSerializer.
+
+    Lists are rendered from `values()` rows by the serializer's
+    RowSerializer when it has one; set `fast_list = False` to opt out.
+    """
+
+    conditional_parents = ()
+    conditional_children = ()
+    conditional_detail_children = None
+    conditional_versions = ()
+    fast_list = True
+
+    def conditional_get(self, request, queryset, render, detail=False):
+        children = self.conditional_children
+        if detail and self.conditional_detail_children is not None:
+            children = self.conditional_detail_children
+        validators = get_version_validators(
+            queryset, self.conditional_parents, children, self.conditional_versions
+        )
+        if validators is not None:
+            parts, last_modified = validators
+        else:
+            count, parts, last_modified = get_validators(queryset, self.conditional_parents, children)
+            if detail and not count:
+                # Let the view answer 404 as usual
+                return render()
+            if self.conditional_versions:
+                versions = get_versions(*self.conditional_versions)
+                parts.append(('versions', versions))
+                last_modified = max(filter(None, [last_modified, version_time(versions)]))
+        etag = make_etag(request, [self.action, *parts])
+        return conditional_response(request, etag, render, last_modified, use_last_modified=detail)
+
+    def conditional_list(self, request, queryset):
+        """Paginated list of `queryset`, or 304 if the client's copy is current."""
+        return self.conditional_get(request, queryset, partial(self.render_list, queryset))
+
+    def get_row_serializer(self):
+        if not self.fast_list:
+            return None
+        return RowSerializer.for_serializer(self.get_serializer_class())
+
+    def get_ordering_columns(self):
+        """Columns keyset pagination may read from the rows."""
+        names = [*(getattr(self, 'ordering_fields', None) or ()), *(getattr(self, 'ordering', None) or ())]
+        opts = self.get_queryset().model._meta
+        columns = [opts.pk.name]
+        for name in names:
+            name = name.lstrip('-')
+            try:
+                field = opts.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.concrete and not field.is_relation:
+                columns.append(name)
+        return columns
+
+    def render_list(self, queryset):
+        row_serializer = self.get_row_serializer()
+        if row_serializer is not None:
+            queryset = row_serializer.values(queryset, self.get_ordering_columns())
+            serialize = row_serializer.serialize
+        else:
+            serialize = lambda rows: self.get_serializer(rows, many=True).data
+        page = self.paginate_queryset(queryset)
+        with timed('serialize'):
+            data = serialize(queryset if page is None else page)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_list(request, self.filter_queryset(self.get_queryset()))
+
+    def retrieve(self, request, *args, **kwargs):
+        render = partial(super().retrieve, request, *args, **kwargs)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        except (TypeError, ValueError, ValidationError):
+            # Malformed lookups are a 404, as in get_object()
+            return render()
+        return self.conditional_get(request, queryset, render, detail=True)
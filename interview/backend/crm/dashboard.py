@@ -0,0 +1,139 @@
+"""
+Dashboard statistics.
+
+Statistics shared by every user and those of one user are computed and
+cached separately, keyed on the version counters of the models they read
+(see crm.cache), so they are recomputed only after a write.
+"""
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .cache import get_versions, get_or_compute
+from .models import Lead, Contact, Note, Reminder, AuditLog
+from .parallel import run_queries
+
+
+def compute_global_dashboard_stats():
+    """
+    Dashboard statistics shared by every user. The queries are independent
+    and run concurrently.
+    """
+    all_leads = Lead.objects.all()
+    
+    def count_by(field):
+        return dict(
+            all_leads.values(field)
+            .annotate(count=Count('id'))
+            .values_list(field, 'count')
+        )
+    
+    (
+        status_distribution, priority_distribution, total_value, recent_activity,
+        total_contacts, total_notes,
+    ) = run_queries(
+        lambda: count_by('status'),
+        lambda: count_by('priority'),
+        # Calculate total estimated value
+        lambda: all_leads.aggregate(total=Sum('estimated_value'))['total'] or 0,
+        # Recent activity (last 10 audit logs)
+        lambda: list(AuditLog.objects.select_related('user').order_by('-timestamp')[:10]),
+        Contact.objects.count,
+        Note.objects.count,
+    )
+    
+    recent_activity_data = [{
+        'id': log.id,
+        'user': log.user.username if log.user else 'System',
+        'action': log.get_action_display(),
+        'model': log.model_name,
+        'object': log.object_repr,
+        'timestamp': log.timestamp
+    } for log in recent_activity]
+    
+    return {
+        'total_leads': sum(status_distribution.values()),
+        'new_leads': status_distribution.get('new', 0),
+        'contacted_leads': status_distribution.get('contacted', 0),
+        'qualified_leads': status_distribution.get('qualified', 0),
+        'converted_leads': status_distribution.get('converted', 0),
+        'lost_leads': status_distribution.get('lost', 0),
+        'total_value': float(total_value),
+        'status_distribution': status_distribution,
+        'priority_distribution': priority_distribution,
+        'recent_activity': recent_activity_data,
+        'total_contacts': total_contacts,
+        'total_notes': total_notes,
+    }
+
+
+def compute_user_dashboard_stats(user):
+    """Dashboard statistics specific to one user, queried concurrently."""
+    now = timezone.now()
+    pending = Reminder.objects.filter(user=user, status='pending')
+    
+    user_leads, upcoming_reminders, overdue_reminders_count = run_queries(
+        lambda: Lead.objects.filter(owner=user).aggregate(
+            count=Count('id'),
+            total=Sum('estimated_value')
+        ),
+        # Upcoming reminders
+        lambda: list(
+            pending.filter(reminder_date__gte=now)
+            .select_related('lead').order_by('reminder_date')[:5]
+        ),
+        # Overdue reminders count
+        pending.filter(reminder_date__lt=now).count,
+    )
+    
+    upcoming_reminders_data = [{
+        'id': reminder.id,
+        'title': reminder.title,
+        'lead': reminder.lead.name,
+        'date': reminder.reminder_date
+    } for reminder in upcoming_reminders]
+    
+    return {
+        'user_total_leads': user_leads['count'],
+        'user_total_value': float(user_leads['total'] or 0),
+        'upcoming_reminders': upcoming_reminders_data,
+        'overdue_reminders_count': overdue_reminders_count,
+    }
+
+
+DASHBOARD_STATS_KEYS = [
+    'total_leads', 'user_total_leads', 'new_leads', 'contacted_leads', 'qualified_leads',
+    'converted_leads', 'lost_leads', 'total_value', 'user_total_value', 'status_distribution',
+    'priority_distribution', 'recent_activity', 'upcoming_reminders', 'overdue_reminders_count',
+    'total_contacts', 'total_notes',
+]
+
+
+def get_global_dashboard_stats():
+    """The cached statistics shared by every user."""
+    # The recent activity shows usernames
+    lead, contact, note, auditlog, user = get_versions('lead', 'contact', 'note', 'auditlog', 'user')
+    return get_or_compute(
+        f'crm:dashboard:global:{lead}:{contact}:{note}:{auditlog}:{user}',
+        compute_global_dashboard_stats,
+        timeout=settings.DASHBOARD_CACHE_TIMEOUT
+    )
+
+
+def get_dashboard_stats(user):
+    """
+    Combine the cached global and per-user dashboard statistics.
+    Keys embed the version counters of the models each part reads, so any
+    write to those models makes the next request recompute.
+    """
+    lead, reminder = get_versions('lead', 'reminder')
+    
+    global_stats = get_global_dashboard_stats()
+    user_stats = get_or_compute(
+        f'crm:dashboard:user:{user.id}:{lead}:{reminder}',
+        lambda: compute_user_dashboard_stats(user),
+        timeout=settings.DASHBOARD_USER_CACHE_TIMEOUT
+    )
+    stats = {**global_stats, **user_stats}
+    return {key: stats[key] for key in DASHBOARD_STATS_KEYS}
@@ -0,0 +1,262 @@
+"""
+A PostgreSQL connection pool shared by the threads of a worker process.
+
+Django keeps one connection per thread. With CONN_MAX_AGE that connection
+outlives the request, but a threaded gunicorn worker then holds a
+connection for every thread, busy or not. The `crm.dbpool` database engine
+(DB_POOL=True) instead hands each request a connection from a pool of at
+most MAX_SIZE per process and takes it back when Django closes it at the
+end of the request, so TLS and authentication are paid once per pooled
+connection rather than once per request.
+
+Connections idle for CHECK_AFTER seconds are pinged before they are handed
+out. A failed ping means the server went away, for instance on a restart,
+so every idle connection is dropped and fresh ones are opened on demand.
+Connections Django gave up on after an error, connections left in a broken
+transaction state, and connections past MAX_LIFETIME or idle for MAX_IDLE
+seconds are closed instead of being reused.
+
+Pools are per process; a process forked from one that used its pool starts
+with an empty pool of its own. `pool_stats()` reports the pools of the
+current process.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from psycopg2 import OperationalError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN
+
+
+logger = logging.getLogger(__name__)
+
+POOL_DEFAULTS = {
+    'MAX_SIZE': 10,
+    'TIMEOUT': 10.0,
+    'CHECK_AFTER': 1.0,
+    'MAX_IDLE': 600,
+    'MAX_LIFETIME': 3600,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(OperationalError):
+    """No connection became free within the pool's TIMEOUT."""
+
+
+class PooledConnection:
+    """An open connection with the times the pool tracks for it."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = self.returned_at = time.monotonic()
+
+
+class ConnectionPool:
+    """
+    Up to `max_size` connections, opened on demand with the callable passed
+    to getconn() and reused most recently returned first, so the spare ones
+    go idle and are closed after `max_idle` seconds.
+    """
+
+    def __init__(self, max_size, timeout, check_after, max_idle, max_lifetime):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.pid = os.getpid()
+        self.condition = threading.Condition()
+        self.idle = []
+        self.in_use = {}
+        self.opening = 0
+        self.waiting = 0
+        self.counters = dict.fromkeys([
+            'connections_opened', 'connections_closed', 'connect_errors', 'checkouts',
+            'waits', 'timeouts', 'health_check_failures',
+        ], 0)
+        self.wait_seconds = 0.0
+
+    def getconn(self, connect):
+        """A connection from the pool, or a new one from `connect()`."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            pooled = self._checkout(deadline)
+            if pooled is None:
+                break
+            if self._healthy(pooled):
+                return pooled.connection
+            self._discard(pooled)
+            with self.condition:
+                self.counters['health_check_failures'] += 1
+            # The server most likely restarted, so the rest are dead too
+            self.flush()
+
+        try:
+            connection = connect()
+        except Exception:
+            with self.condition:
+                self.counters['connect_errors'] += 1
+                self.opening -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.opening -= 1
+            self.in_use[id(connection)] = PooledConnection(connection)
+            self.counters['connections_opened'] += 1
+        return connection
+
+    def putconn(self, connection, discard=False):
+        """Take a connection back, closing it if it cannot be reused."""
+        with self.condition:
+            pooled = self.in_use.pop(id(connection), None)
+        if pooled is None:
+            # Not ours, e.g. checked out before a fork
+            connection.close()
+            return
+
+        now = time.monotonic()
+        if not discard and not connection.closed:
+            status = connection.info.transaction_status
+            if status == TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != TRANSACTION_STATUS_IDLE:
+                try:
+                    connection.rollback()
+                except Exception:
+                    discard = True
+        if discard or connection.closed or now - pooled.created_at >= self.max_lifetime:
+            self._discard(pooled)
+            return
+
+        pooled.returned_at = now
+        with self.condition:
+            self.idle.append(pooled)
+            self.condition.notify()
+
+    def flush(self):
+        """Close every idle connection."""
+        with self.condition:
+            idle, self.idle = self.idle, []
+        for pooled in idle:
+            self._discard(pooled)
+
+    def stats(self):
+        with self.condition:
+            return {
+                'max_size': self.max_size,
+                'size': len(self.idle) + len(self.in_use) + self.opening,
+                'idle': len(self.idle),
+                'in_use': len(self.in_use) + self.opening,
+                'waiting': self.waiting,
+                **self.counters,
+                'wait_seconds': round(self.wait_seconds, 6),
+            }
+
+    def _checkout(self, deadline):
+        """
+        Take an idle connection, or reserve room for a new one and return
+        None.
+        """
+        with self.condition:
+            started = None
+            expired = self._expire_idle()
+            while True:
+                # Threads already waiting go first
+                if started is not None or not self.waiting:
+                    if self.idle:
+                        pooled = self.idle.pop()
+                        self.in_use[id(pooled.connection)] = pooled
+                        break
+                    if len(self.in_use) + self.opening < self.max_size:
+                        self.opening += 1
+                        pooled = None
+                        break
+
+                remaining = deadline - time.monotonic()
+                if started is None:
+                    started = time.monotonic()
+                    self.counters['waits'] += 1
+                if remaining <= 0:
+                    self.counters['timeouts'] += 1
+                    self.wait_seconds += time.monotonic() - started
+                    # Pass on the wake-up this thread may have taken
+                    self.condition.notify()
+                    raise PoolTimeout(f'No database connection became free within {self.timeout} seconds')
+                self.waiting += 1
+                try:
+                    self.condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            if started is not None:
+                self.wait_seconds += time.monotonic() - started
+            self.counters['checkouts'] += 1
+
+        for stale in expired:
+            self._discard(stale)
+        return pooled
+
+    def _expire_idle(self):
+        """Remove the idle connections past MAX_IDLE or MAX_LIFETIME and return them."""
+        now = time.monotonic()
+        expired = [
+            pooled for pooled in self.idle
+            if now - pooled.returned_at >= self.max_idle or now - pooled.created_at >= self.max_lifetime
+        ]
+        if expired:
+            self.idle = [pooled for pooled in self.idle if pooled not in expired]
+        return expired
+
+    def _healthy(self, pooled):
+        if pooled.connection.closed:
+            return False
+        if time.monotonic() - pooled.returned_at < self.check_after:
+            return True
+        try:
+            with pooled.connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not pooled.connection.autocommit:
+                pooled.connection.rollback()
+        except Exception as e:
+            logger.warning('Dropping pooled database connection that failed its health check: %s', e)
+            return False
+        return True
+
+    def _discard(self, pooled):
+        with self.condition:
+            self.in_use.pop(id(pooled.connection), None)
+            self.counters['connections_closed'] += 1
+            self.condition.notify()
+        try:
+            pooled.connection.close()
+        except Exception:
+            pass
+
+
+def get_pool(alias, settings_dict):
+    """The pool of database `alias` in this process, created on first use."""
+    pool = _pools.get(alias)
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None or pool.pid != os.getpid():
+            # Connections inherited from the parent process belong to it
+            options = {**POOL_DEFAULTS, **settings_dict.get('POOL', {})}
+            pool = _pools[alias] = ConnectionPool(
+                max_size=options['MAX_SIZE'],
+                timeout=options['TIMEOUT'],
+                check_after=options['CHECK_AFTER'],
+                max_idle=options['MAX_IDLE'],
+                max_lifetime=options['MAX_LIFETIME'],
+            )
+        return pool
+
+
+def pool_stats():
+    """Usage of the pools of this process, by database alias."""
+    return {alias: pool.stats() for alias, pool in _pools.items() if pool.pid == os.getpid()}
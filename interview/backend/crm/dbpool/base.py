@@ -0,0 +1,28 @@
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+
+from . import get_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    The PostgreSQL backend with connections borrowed from the process's
+    pool instead of opened per thread, and given back when Django closes
+    them.
+    """
+
+    def get_new_connection(self, conn_params):
+        connection = get_pool(self.alias, self.settings_dict).getconn(
+            lambda: super(DatabaseWrapper, self).get_new_connection(conn_params)
+        )
+        # Set by the base class on the connections it opens, needed on reused ones too
+        self.isolation_level = IsolationLevel(
+            self.settings_dict['OPTIONS'].get('isolation_level', IsolationLevel.READ_COMMITTED)
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                # Django only closes a connection with errors once it stopped working
+                get_pool(self.alias, self.settings_dict).putconn(self.connection, discard=self.errors_occurred)
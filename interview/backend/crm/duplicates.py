@@ -0,0 +1,199 @@
+"""
+Duplicate lead detection and merging.
+
+Leads are only compared with leads sharing a match key (see crm.matching),
+looked up through the indexed key columns, so the work grows with the size
+of the blocks rather than with the square of the table. Oversized blocks,
+such as a domain shared by thousands of leads, are skipped.
+"""
+
+from difflib import SequenceMatcher
+from itertools import combinations, groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .cache import bump_version
+from .matching import MATCH_KEY_FIELDS, normalize_email
+from .models import Lead, Contact, Note, Reminder, DuplicateCandidate
+from .signals import collect_tombstones
+from .utils import log_model_change, log_model_changes
+
+
+MATCH_FIELDS = ['id', 'name', 'email', *MATCH_KEY_FIELDS]
+
+# Score added by each kind of match; pairs need DUPLICATE_MIN_SCORE in total
+MATCH_WEIGHTS = {
+    'email': 0.5,
+    'email_domain': 0.2,
+    'phone': 0.35,
+    'company': 0.25,
+    'name': 0.3,
+}
+NAME_SIMILARITY_THRESHOLD = 0.85
+
+# Blank fields of the surviving lead filled in from the merged leads
+MERGE_FILL_FIELDS = ['company', 'phone', 'source', 'owner', 'estimated_value', 'description']
+
+
+def name_similarity(a, b):
+    a, b = ' '.join(a.lower().split()), ' '.join(b.lower().split())
+    if not a or not b:
+        return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def score_pair(a, b):
+    """Score two leads given as dicts of MATCH_FIELDS. Returns (score, reasons)."""
+    reasons = []
+    if a['email_key'] and normalize_email(a['email']) == normalize_email(b['email']):
+        reasons.append('email')
+    elif a['email_key'] and a['email_key'] == b['email_key']:
+        reasons.append('email_domain')
+    if a['phone_key'] and a['phone_key'] == b['phone_key']:
+        reasons.append('phone')
+    if a['company_key'] and a['company_key'] == b['company_key']:
+        reasons.append('company')
+    score = sum(MATCH_WEIGHTS[reason] for reason in reasons)
+
+    similarity = name_similarity(a['name'], b['name'])
+    if similarity >= NAME_SIMILARITY_THRESHOLD:
+        reasons.append('name')
+        score += MATCH_WEIGHTS['name'] * similarity
+    return min(round(score, 4), 1.0), reasons
+
+
+def find_lead_duplicates(lead, limit=None):
+    """
+    Leads that look like duplicates of `lead`, best first, as
+    [(lead dict, score, reasons)].
+    """
+    blocks = Q()
+    for key in MATCH_KEY_FIELDS:
+        value = getattr(lead, key)
+        if value:
+            blocks |= Q(**{key: value})
+    if not blocks:
+        return []
+
+    target = {field: getattr(lead, field) for field in MATCH_FIELDS}
+    others = (
+        Lead.objects.filter(blocks)
+        .exclude(pk=lead.pk)
+        .order_by('-id')
+        .values(*MATCH_FIELDS, 'company', 'phone', 'status')[:settings.DUPLICATE_MAX_BLOCK_SIZE]
+    )
+    matches = []
+    for other in others:
+        score, reasons = score_pair(target, other)
+        if score >= settings.DUPLICATE_MIN_SCORE:
+            matches.append((other, score, reasons))
+    matches.sort(key=lambda match: -match[1])
+    return matches[:limit] if limit else matches
+
+
+def iter_block_pairs(key):
+    """Yield every pair of leads sharing a value of `key`, block by block."""
+    blocks = (
+        Lead.objects.exclude(**{key: ''})
+        .order_by()
+        .values(key)
+        .annotate(size=Count('id'))
+        .filter(size__gt=1, size__lte=settings.DUPLICATE_MAX_BLOCK_SIZE)
+        .values(key)
+    )
+    rows = (
+        Lead.objects.filter(**{f'{key}__in': blocks})
+        .order_by(key, 'id')
+        .values(*MATCH_FIELDS)
+        .iterator(chunk_size=2000)
+    )
+    for _, block in groupby(rows, key=itemgetter(key)):
+        yield from combinations(list(block), 2)
+
+
+def find_all_duplicates():
+    """
+    Score every pair of leads within each block and replace the open
+    DuplicateCandidate rows. Dismissed pairs are kept and not re-raised.
+    Returns the number of candidates found.
+    """
+    seen = set()
+    candidates = []
+    for key in MATCH_KEY_FIELDS:
+        for a, b in iter_block_pairs(key):
+            pair = (a['id'], b['id'])
+            if pair in seen:
+                continue
+            seen.add(pair)
+            score, reasons = score_pair(a, b)
+            if score >= settings.DUPLICATE_MIN_SCORE:
+                candidates.append(DuplicateCandidate(
+                    lead_id=pair[0], duplicate_id=pair[1], score=score, reasons=reasons
+                ))
+
+    with transaction.atomic():
+        dismissed = set(
+            DuplicateCandidate.objects.filter(status='dismissed').values_list('lead_id', 'duplicate_id')
+        )
+        DuplicateCandidate.objects.filter(status='open').delete()
+        DuplicateCandidate.objects.bulk_create(
+            [candidate for candidate in candidates if (candidate.lead_id, candidate.duplicate_id) not in dismissed],
+            batch_size=1000
+        )
+    return len(candidates)
+
+
+def merge_leads(target, duplicate_ids, user=None, request=None):
+    """
+    Merge the leads in `duplicate_ids` into `target` in one transaction.
+    Contacts, notes and reminders move with one UPDATE per table, keeping a
+    single primary contact, blank fields of the target are filled in from
+    the duplicates, and the duplicates are deleted. Returns
+    {relation: rows moved}.
+    """
+    duplicate_ids = sorted(set(duplicate_ids) - {target.pk})
+    now = timezone.now()
+    with transaction.atomic():
+        # Lock every lead involved so concurrent merges cannot interleave
+        locked = {lead.pk: lead for lead in Lead.objects.select_for_update().filter(pk__in=[target.pk, *duplicate_ids])}
+        target = locked[target.pk]
+        duplicates = [locked[pk] for pk in duplicate_ids if pk in locked]
+        ids = [duplicate.pk for duplicate in duplicates]
+
+        # The target keeps one primary contact: its own, or else the first duplicate's
+        demoted = Contact.objects.filter(lead_id__in=ids, is_primary=True)
+        if not Contact.objects.filter(lead=target, is_primary=True).exists():
+            demoted = demoted.exclude(pk=demoted.order_by('lead_id', 'id').values_list('pk', flat=True).first())
+        demoted.update(is_primary=False, updated_at=now)
+
+        moved = {}
+        for name, model in (('contacts', Contact), ('notes', Note), ('reminders', Reminder)):
+            moved[name] = model.objects.filter(lead_id__in=ids).update(lead=target, updated_at=now)
+
+        for field in MERGE_FILL_FIELDS:
+            attname = Lead._meta.get_field(field).attname
+            if getattr(target, attname) in (None, ''):
+                for duplicate in duplicates:
+                    value = getattr(duplicate, attname)
+                    if value not in (None, ''):
+                        setattr(target, attname, value)
+                        break
+        target.save()
+
+        changes = {
+            field: {'old': str(old_value), 'new': str(new_value)}
+            for field, (old_value, new_value) in target.saved_changes.items()
+        }
+        changes['merged_leads'] = {'old': '', 'new': ', '.join(str(pk) for pk in ids)}
+        log_model_change(user=user, action='update', instance=target, changes=changes, request=request)
+        log_model_changes(user=user, action='delete', instances=duplicates, request=request)
+        with collect_tombstones():
+            Lead.objects.filter(pk__in=ids).delete()
+
+    # The moves above bypass post_save
+    bump_version('contact', 'note', 'reminder')
+    return moved
@@ -0,0 +1,302 @@
+"""
+Live events pushed to dashboards over Server-Sent Events.
+
+Dashboards keep `GET /api/events/` open instead of polling the dashboard
+stats and the audit log. Three kinds of event are pushed:
+
+- `activity`: every new audit log entry, as the audit log endpoint renders it;
+- `reminder`: a reminder of the subscribed user that fell due and was sent;
+- `stats`: how the global dashboard counters moved since the last push.
+
+Events are fanned out through the broker named by EVENTS_BROKER:
+RedisBroker uses Redis pub/sub and reaches every web process, InMemoryBroker
+only reaches subscribers in the same process and stands in for it in tests
+and single-process development. Events are published as finished SSE
+frames, so subscribers write them out as they arrive.
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import prefetch_related_objects
+from django.utils.module_loading import import_string
+
+from .dashboard import get_global_dashboard_stats
+from .renderers import json_renderer
+
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY_CHANNEL = 'activity'
+STATS_CHANNEL = 'stats'
+
+# Milliseconds browsers wait before reconnecting once a stream ends
+RECONNECT_DELAY = 3000
+
+# Global dashboard counters pushed in `stats` events
+STATS_COUNTERS = [
+    'total_leads', 'new_leads', 'contacted_leads', 'qualified_leads', 'converted_leads',
+    'lost_leads', 'total_value', 'status_distribution', 'priority_distribution',
+    'total_contacts', 'total_notes',
+]
+STATS_SNAPSHOT_KEY = 'crm:events:stats'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def format_event(event, data):
+    """One SSE frame; the JSON encoding never contains a newline."""
+    return f"event: {event}\ndata: {json_renderer().render(data).decode('utf-8')}\n\n"
+
+
+class BrokerUnavailable(Exception):
+    """The broker could not be reached."""
+
+
+class SubscriptionClosed(BrokerUnavailable):
+    """The broker connection behind a subscription was lost."""
+
+
+class StreamsExhausted(Exception):
+    """This process already serves EVENTS_MAX_STREAMS event streams."""
+
+
+class InMemorySubscription:
+
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = channels
+        self.queue = queue.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            # A stalled client misses events rather than growing the queue
+            pass
+
+    def get(self, timeout):
+        """The next message, or None if none arrived within `timeout` seconds."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InMemoryBroker:
+    """Fan-out within one process, for tests and single-process development."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)
+
+    def publish(self, channel, message):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(message)
+
+    def subscribe(self, channels):
+        subscription = InMemorySubscription(self, channels)
+        with self.lock:
+            for channel in channels:
+                self.subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                self.subscriptions[channel].discard(subscription)
+                if not self.subscriptions[channel]:
+                    del self.subscriptions[channel]
+
+
+class RedisSubscription:
+
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+
+    def get(self, timeout):
+        """The next message, or None if none arrived within `timeout` seconds."""
+        try:
+            message = self.pubsub.get_message(timeout=timeout)
+        except redis.RedisError as e:
+            raise SubscriptionClosed(str(e))
+        if message is None:
+            return None
+        return message['data'].decode('utf-8')
+
+    def close(self):
+        self.pubsub.close()
+
+
+class RedisBroker:
+    """Fan-out across processes through Redis pub/sub."""
+
+    prefix = 'crm:events:'
+
+    def __init__(self, url=None):
+        self.redis = redis.Redis.from_url(url or settings.EVENTS_REDIS_URL)
+
+    def publish(self, channel, message):
+        try:
+            self.redis.publish(self.prefix + channel, message)
+        except redis.RedisError as e:
+            # Live events are best effort; dashboards still load on their own
+            logger.warning('Could not publish %s event: %s', channel, e)
+
+    def subscribe(self, channels):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(*[self.prefix + channel for channel in channels])
+        except redis.RedisError as e:
+            pubsub.close()
+            raise BrokerUnavailable(str(e))
+        return RedisSubscription(pubsub)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.EVENTS_BROKER)()
+
+
+def publish(channel, event, data):
+    get_broker().publish(channel, format_event(event, data))
+
+
+def publish_audit_entries(entries):
+    """Push newly written audit entries to every dashboard."""
+    from .serializers import AuditLogSerializer
+
+    prefetch_related_objects(entries, 'user')
+    for data in AuditLogSerializer(entries, many=True).data:
+        publish(ACTIVITY_CHANNEL, 'activity', data)
+
+
+def publish_reminders_due(reminders):
+    """Push reminders that were just sent to their users, shaped like the dashboard's."""
+    for reminder in reminders:
+        publish(user_channel(reminder.user_id), 'reminder', {
+            'id': reminder.id,
+            'title': reminder.title,
+            'lead': reminder.lead.name,
+            'date': reminder.reminder_date,
+        })
+
+
+def counter_deltas(old, new):
+    """Counters of `new` that differ from `old`, as differences."""
+    deltas = {}
+    for key in STATS_COUNTERS:
+        if isinstance(new[key], dict):
+            changed = {
+                name: new[key].get(name, 0) - old[key].get(name, 0)
+                for name in {*old[key], *new[key]}
+            }
+            changed = {name: delta for name, delta in changed.items() if delta}
+            if changed:
+                deltas[key] = changed
+        elif new[key] != old[key]:
+            deltas[key] = round(new[key] - old[key], 2)
+    return deltas
+
+
+def publish_stats_deltas():
+    """
+    Push how the global dashboard counters moved since the last call.
+    The counters come from the cached dashboard statistics, so nothing is
+    queried unless something was written. Events carry the new values of
+    the counters that moved too, so clients that missed one catch up.
+    Returns the deltas pushed.
+    """
+    stats = get_global_dashboard_stats()
+    counters = {key: stats[key] for key in STATS_COUNTERS}
+    previous = cache.get(STATS_SNAPSHOT_KEY)
+    cache.set(STATS_SNAPSHOT_KEY, counters, timeout=None)
+    if previous is None:
+        return {}
+
+    deltas = counter_deltas(previous, counters)
+    if deltas:
+        publish(STATS_CHANNEL, 'stats', {
+            'deltas': deltas,
+            'values': {key: counters[key] for key in deltas},
+        })
+    return deltas
+
+
+class EventStream:
+    """
+    SSE frames published on `channels` for EVENTS_STREAM_SECONDS, with a
+    comment every EVENTS_HEARTBEAT_SECONDS so proxies keep the connection
+    open. Browsers reconnect by themselves when the stream ends.
+
+    Under WSGI each open stream holds a server thread, so a process serves
+    at most EVENTS_MAX_STREAMS at once and the rest of its threads stay
+    free for ordinary requests. Opening a stream takes a slot and
+    subscribes, raising StreamsExhausted or BrokerUnavailable if either
+    fails; close(), which Django calls when the response ends whether or
+    not it was iterated, gives both back.
+    """
+
+    lock = threading.Lock()
+    open_streams = 0
+
+    def __init__(self, channels, broker=None):
+        with EventStream.lock:
+            if EventStream.open_streams >= settings.EVENTS_MAX_STREAMS:
+                raise StreamsExhausted()
+            EventStream.open_streams += 1
+        self.closed = False
+        try:
+            self.subscription = (broker or get_broker()).subscribe(channels)
+        except BaseException:
+            self.release()
+            raise
+        self.frames = self.generate_frames()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.frames)
+
+    def generate_frames(self):
+        # The stream stays open for minutes without touching the database
+        connections.close_all()
+        yield f'retry: {RECONNECT_DELAY}\n\n'
+        deadline = time.monotonic() + settings.EVENTS_STREAM_SECONDS
+        try:
+            while (remaining := deadline - time.monotonic()) > 0:
+                message = self.subscription.get(timeout=min(settings.EVENTS_HEARTBEAT_SECONDS, remaining))
+                yield ': keepalive\n\n' if message is None else message
+        except SubscriptionClosed as e:
+            # The browser reconnects after RECONNECT_DELAY
+            logger.warning('Event stream lost its broker connection: %s', e)
+
+    def release(self):
+        with EventStream.lock:
+            EventStream.open_streams -= 1
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.frames.close()
+            self.subscription.close()
+        finally:
+            self.release()
@@ -0,0 +1,266 @@
+"""
+Chunked export writers used by the background export jobs.
+
+Each job is split into primary-key ranges. Every range is written to its
+own part file by a separate Celery task, and the parts are stitched into
+the final file once all of them are done. Finished parts are kept on disk,
+so a resumed job only redoes the ranges that had not completed.
+
+A task claims its range before writing it, so each range is written by one
+task at a time. Claims, and jobs, without progress for
+EXPORT_STALLED_SECONDS are presumed dead: their ranges can be claimed
+again and the job resumed.
+"""
+
+import csv
+import io
+import json
+import os
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.db.models import Max, Min
+from django.utils import timezone
+from django_filters.filterset import filterset_factory
+
+from .models import Lead, Contact, Note, Reminder, Correspondence, AuditLog
+
+
+EXPORT_MODELS = {
+    'lead': (Lead, ['status', 'priority', 'owner']),
+    'contact': (Contact, ['lead', 'is_primary']),
+    'note': (Note, ['lead', 'author']),
+    'reminder': (Reminder, ['lead', 'user', 'status']),
+    'correspondence': (Correspondence, ['contact', 'type', 'logged_by']),
+    'auditlog': (AuditLog, ['user', 'action', 'model_name']),
+}
+
+FORMAT_EXTENSIONS = {
+    'csv': 'csv',
+    'jsonl': 'jsonl',
+    'parquet': 'parquet',
+}
+
+
+def get_export_model(model_name):
+    return EXPORT_MODELS[model_name][0]
+
+
+def get_export_fields(model):
+    return list(model._meta.concrete_fields)
+
+
+def clean_export_filters(model_name, filters):
+    """
+    Validate filter values with a FilterSet over the model's filter fields,
+    as the list endpoints do. Returns (filters, errors): the filters as
+    values the ORM takes, primary keys for relations, or the form errors.
+    """
+    model, filter_fields = EXPORT_MODELS[model_name]
+    filterset = filterset_factory(model, fields=filter_fields)(data=filters, queryset=model.objects.none())
+    if not filterset.is_valid():
+        return None, filterset.errors
+    cleaned = {}
+    for key in filters:
+        value = filterset.form.cleaned_data.get(key)
+        if value is None or value == '':
+            # Empty values do not filter, as on the list endpoints
+            continue
+        cleaned[key] = value.pk if isinstance(value, models.Model) else value
+    return cleaned, None
+
+
+def get_export_queryset(job):
+    """Base queryset for a job with its validated filters applied."""
+    model, filter_fields = EXPORT_MODELS[job.model_name]
+    filters = {key: value for key, value in job.filters.items() if key in filter_fields}
+    return model.objects.filter(**filters).order_by()
+
+
+def plan_chunks(job, chunk_size=None):
+    """Return [(start_pk, end_pk)] ranges covering the job's rows."""
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    bounds = get_export_queryset(job).aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return []
+    return [
+        (start, min(start + chunk_size - 1, bounds['last']))
+        for start in range(bounds['first'], bounds['last'] + 1, chunk_size)
+    ]
+
+
+def stalled_since():
+    """Jobs and chunk claims with no progress since then are presumed dead."""
+    return timezone.now() - timedelta(seconds=settings.EXPORT_STALLED_SECONDS)
+
+
+def get_job_dir(job):
+    return Path(settings.EXPORT_ROOT) / str(job.id)
+
+
+def get_chunk_path(job, index):
+    return get_job_dir(job) / f'part-{index:05d}.{FORMAT_EXTENSIONS[job.format]}'
+
+
+def get_output_path(job):
+    return get_job_dir(job) / f'{job.model_name}_export_{job.id}.{FORMAT_EXTENSIONS[job.format]}'
+
+
+def arrow_schema(fields):
+    """Fixed Arrow schema so every part file shares the same column types."""
+    import pyarrow as pa
+
+    columns = []
+    for field in fields:
+        target = field.target_field if field.is_relation else field
+        internal_type = target.get_internal_type()
+        if internal_type in ('AutoField', 'BigAutoField', 'IntegerField', 'BigIntegerField',
+                             'PositiveIntegerField', 'PositiveBigIntegerField', 'SmallIntegerField'):
+            arrow_type = pa.int64()
+        elif internal_type == 'BooleanField':
+            arrow_type = pa.bool_()
+        elif internal_type == 'DateTimeField':
+            arrow_type = pa.timestamp('us', tz='UTC')
+        elif internal_type == 'DecimalField':
+            arrow_type = pa.decimal128(target.max_digits, target.decimal_places)
+        else:
+            arrow_type = pa.string()
+        columns.append(pa.field(field.attname, arrow_type, nullable=True))
+    return pa.schema(columns)
+
+
+def write_chunk(job, chunk):
+    """
+    Write one primary-key range to its part file and return the row count.
+    The file is written under a temporary name of its own and renamed when
+    complete, so an interrupted task never leaves a truncated part behind,
+    and a task still running after its claim was taken over cannot corrupt
+    the part.
+    """
+    model = get_export_model(job.model_name)
+    fields = get_export_fields(model)
+    columns = [field.attname for field in fields]
+    json_columns = {field.attname for field in fields if field.get_internal_type() == 'JSONField'}
+
+    rows = (
+        get_export_queryset(job)
+        .filter(pk__gte=chunk.start_pk, pk__lte=chunk.end_pk)
+        .order_by('pk')
+        .values_list(*columns)
+        .iterator(chunk_size=2000)
+    )
+
+    path = get_chunk_path(job, chunk.index)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f'{path.suffix}.{uuid.uuid4().hex}.tmp')
+
+    if job.format == 'parquet':
+        count = _write_parquet(tmp_path, fields, columns, json_columns, rows)
+    elif job.format == 'jsonl':
+        count = _write_jsonl(tmp_path, columns, rows)
+    else:
+        count = _write_csv(tmp_path, columns, json_columns, rows)
+
+    os.replace(tmp_path, path)
+    return count
+
+
+def _write_csv(path, columns, json_columns, rows):
+    json_indexes = [i for i, column in enumerate(columns) if column in json_columns]
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        for row in rows:
+            if json_indexes:
+                row = list(row)
+                for i in json_indexes:
+                    row[i] = json.dumps(row[i], cls=DjangoJSONEncoder)
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def _write_jsonl(path, columns, rows):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for row in rows:
+            f.write(encoder.encode(dict(zip(columns, row))))
+            f.write('\n')
+            count += 1
+    return count
+
+
+def _write_parquet(path, fields, columns, json_columns, rows, batch_size=10000):
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema(fields)
+    count = 0
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                writer.write_table(_arrow_table(schema, columns, json_columns, batch))
+                count += len(batch)
+                batch = []
+        if batch or not count:
+            writer.write_table(_arrow_table(schema, columns, json_columns, batch))
+            count += len(batch)
+    return count
+
+
+def _arrow_table(schema, columns, json_columns, batch):
+    import pyarrow as pa
+
+    data = {}
+    for i, column in enumerate(columns):
+        values = [row[i] for row in batch]
+        if column in json_columns:
+            values = [json.dumps(value, cls=DjangoJSONEncoder) for value in values]
+        data[column] = values
+    return pa.Table.from_pydict(data, schema=schema)
+
+
+def assemble_output(job, chunk_count):
+    """Concatenate the finished part files into the final export file."""
+    model = get_export_model(job.model_name)
+    fields = get_export_fields(model)
+    output = get_output_path(job)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    tmp_output = output.with_suffix(output.suffix + '.tmp')
+    parts = [get_chunk_path(job, index) for index in range(chunk_count)]
+
+    if job.format == 'parquet':
+        import pyarrow.parquet as pq
+
+        with pq.ParquetWriter(tmp_output, arrow_schema(fields), compression='zstd') as writer:
+            for part in parts:
+                parquet_file = pq.ParquetFile(part)
+                for group in range(parquet_file.num_row_groups):
+                    writer.write_table(parquet_file.read_row_group(group))
+    else:
+        with open(tmp_output, 'wb') as out:
+            if job.format == 'csv':
+                header = io.StringIO()
+                csv.writer(header).writerow([field.attname for field in fields])
+                out.write(header.getvalue().encode('utf-8'))
+            for part in parts:
+                with open(part, 'rb') as f:
+                    while True:
+                        block = f.read(1024 * 1024)
+                        if not block:
+                            break
+                        out.write(block)
+
+    os.replace(tmp_output, output)
+    for part in parts:
+        part.unlink(missing_ok=True)
+    # Left by tasks that died while writing
+    for leftover in get_job_dir(job).glob('part-*.tmp'):
+        leftover.unlink(missing_ok=True)
+    return output
@@ -0,0 +1,292 @@
+"""
+Streaming lead imports from CSV and JSON Lines files.
+
+The file is read one line at a time and handled in chunks of
+IMPORT_CHUNK_SIZE rows: each chunk is validated, checked for leads that
+already exist with one indexed lookup by email, and written with
+bulk_create together with the primary contacts, in its own transaction.
+Only one chunk is held in memory at a time, whatever the size of the file.
+
+Rows are matched on email case-insensitively; rows whose email already
+belongs to a lead, or appeared earlier in the file, are skipped.
+"""
+
+import csv
+import json
+import shutil
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .models import Lead, Contact, ImportJob
+from .signals import bulk_saved
+from .utils import log_model_changes
+
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+LEAD_IMPORT_FIELDS = ['name', 'company', 'email', 'phone', 'status', 'priority', 'source', 'estimated_value', 'description']
+
+# Import column: Contact field of the lead's primary contact
+CONTACT_IMPORT_FIELDS = {
+    'contact_name': 'name',
+    'contact_email': 'email',
+    'contact_phone': 'phone',
+    'contact_position': 'position',
+}
+
+# Import column naming the lead's owner by username
+OWNER_COLUMN = 'owner'
+
+
+def get_import_format(filename, default='csv'):
+    suffix = Path(filename or '').suffix.lower().lstrip('.')
+    if suffix in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    if suffix == 'csv':
+        return 'csv'
+    return default
+
+
+def get_job_path(job):
+    return Path(settings.IMPORT_ROOT) / job.file_path
+
+
+class ByteCountingReader:
+    """Decoded lines of a binary file, counting the bytes read for progress."""
+
+    def __init__(self, f):
+        self.f = f
+        self.bytes_read = 0
+
+    def __iter__(self):
+        first = True
+        for line in self.f:
+            self.bytes_read += len(line)
+            # Spreadsheet exports often start with a byte order mark
+            yield line.decode('utf-8-sig' if first else 'utf-8', errors='replace')
+            first = False
+
+
+def iter_rows(lines, format):
+    """Yield (line number, row dict or None if unparseable) from decoded lines."""
+    if format == 'jsonl':
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield number, row if isinstance(row, dict) else None
+        return
+
+    reader = csv.DictReader(lines)
+    for row in reader:
+        # DictReader files extra cells under None
+        row.pop(None, None)
+        yield reader.line_num, row
+
+
+def clean_values(model, fields, row, errors):
+    """Run each model field's own validation on the raw values of `row`."""
+    values = {}
+    for column, name in fields:
+        field = model._meta.get_field(name)
+        raw = row.get(column)
+        if raw is None:
+            raw = ''
+        if isinstance(raw, str):
+            raw = raw.strip()
+        if raw == '' and (field.has_default() or field.null):
+            # Blank cells fall back to the field default
+            continue
+        try:
+            values[name] = field.clean(raw, None)
+        except ValidationError as e:
+            errors[column] = e.messages
+    return values
+
+
+def validate_row(row):
+    """Return (lead values, contact values or None, errors) for one row."""
+    errors = {}
+    lead_values = clean_values(Lead, [(name, name) for name in LEAD_IMPORT_FIELDS], row, errors)
+
+    contact_values = None
+    if any(str(row.get(column) or '').strip() for column in CONTACT_IMPORT_FIELDS):
+        contact_row = {name: row.get(column) for column, name in CONTACT_IMPORT_FIELDS.items()}
+        # The contact defaults to the lead's own name and email
+        for name in ('name', 'email'):
+            if not str(contact_row.get(name) or '').strip():
+                contact_row[name] = lead_values.get(name, '')
+        contact_errors = {}
+        contact_values = clean_values(Contact, [(name, name) for name in CONTACT_IMPORT_FIELDS.values()], contact_row, contact_errors)
+        errors.update({f'contact_{name}': messages for name, messages in contact_errors.items()})
+    return lead_values, contact_values, errors
+
+
+class LeadImporter:
+    """
+    Import one file of leads chunk by chunk, keeping running totals.
+    `on_progress(importer)` is called after every chunk.
+    """
+
+    def __init__(self, user=None, chunk_size=None, max_errors=None, on_progress=None, request=None):
+        self.user = user
+        self.chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+        self.max_errors = max_errors if max_errors is not None else settings.IMPORT_MAX_ERRORS
+        self.on_progress = on_progress
+        self.request = request
+        self.owners = {}
+        self.rows_processed = 0
+        self.rows_imported = 0
+        self.rows_skipped = 0
+        self.rows_failed = 0
+        self.bytes_read = 0
+        self.errors = []
+
+    def run(self, f, format):
+        """Import every row of the binary file object `f`."""
+        reader = ByteCountingReader(f)
+        rows = iter_rows(reader, format)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            self.import_chunk(chunk)
+            self.bytes_read = reader.bytes_read
+            if self.on_progress:
+                self.on_progress(self)
+        return self
+
+    def add_error(self, line, errors):
+        self.rows_failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def resolve_owners(self, usernames):
+        """Look up owners not seen in earlier chunks with one query."""
+        missing = set(usernames) - set(self.owners)
+        if missing:
+            found = dict(get_user_model().objects.filter(username__in=missing).values_list('username', 'id'))
+            for username in missing:
+                self.owners[username] = found.get(username)
+        return self.owners
+
+    def existing_emails(self, emails):
+        """Lowercased emails among `emails` that already belong to a lead."""
+        return set(
+            Lead.objects.annotate(email_lower=Lower('email'))
+            .filter(email_lower__in=emails)
+            .values_list('email_lower', flat=True)
+        )
+
+    def import_chunk(self, chunk):
+        valid = []
+        for line, row in chunk:
+            self.rows_processed += 1
+            if row is None:
+                self.add_error(line, {'non_field_errors': ['Could not parse row.']})
+                continue
+            lead_values, contact_values, errors = validate_row(row)
+            if errors:
+                self.add_error(line, errors)
+                continue
+            owner = str(row.get(OWNER_COLUMN) or '').strip()
+            valid.append((line, lead_values, contact_values, owner))
+
+        owners = self.resolve_owners(owner for _, _, _, owner in valid if owner)
+        existing = self.existing_emails({values['email'].lower() for _, values, _, _ in valid})
+
+        leads, contacts = [], []
+        for line, lead_values, contact_values, owner in valid:
+            email = lead_values['email'].lower()
+            if email in existing:
+                self.rows_skipped += 1
+                continue
+            if owner and owners.get(owner) is None:
+                self.add_error(line, {OWNER_COLUMN: [f'Unknown user "{owner}".']})
+                continue
+            # Later rows with the same email are duplicates of this one
+            existing.add(email)
+
+            lead = Lead(**lead_values)
+            lead.owner_id = owners[owner] if owner else getattr(self.user, 'id', None)
+            lead.update_derived_fields()
+            leads.append(lead)
+            if contact_values is not None:
+                contacts.append(Contact(lead=lead, is_primary=True, **contact_values))
+
+        if not leads:
+            return
+        with transaction.atomic():
+            Lead.objects.bulk_create(leads)
+            # The contacts pick up their lead's new primary key on save
+            Contact.objects.bulk_create(contacts)
+            log_model_changes(user=self.user, action='create', instances=leads, request=self.request)
+            log_model_changes(user=self.user, action='create', instances=contacts, request=self.request)
+            transaction.on_commit(lambda: (bulk_saved(Lead, leads), bulk_saved(Contact, contacts)))
+        self.rows_imported += len(leads)
+
+    def summary(self):
+        return {
+            'rows_processed': self.rows_processed,
+            'rows_imported': self.rows_imported,
+            'rows_skipped': self.rows_skipped,
+            'rows_failed': self.rows_failed,
+            'errors': self.errors,
+        }
+
+
+def import_leads_file(path, format, user=None, chunk_size=None, on_progress=None, request=None):
+    """Import the leads in the file at `path`. Returns the LeadImporter."""
+    importer = LeadImporter(user=user, chunk_size=chunk_size, on_progress=on_progress, request=request)
+    with open(path, 'rb') as f:
+        return importer.run(f, format)
+
+
+def save_upload(job, upload):
+    """Stream an uploaded file to the job's directory and record its size."""
+    path = Path(settings.IMPORT_ROOT) / str(job.id) / Path(upload.name).name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb') as f:
+        for block in upload.chunks():
+            f.write(block)
+    job.file_path = str(path.relative_to(settings.IMPORT_ROOT))
+    job.file_size = upload.size
+    job.save(update_fields=['file_path', 'file_size', 'updated_at'])
+
+
+def run_import_job(job, request=None):
+    """
+    Import a job's file, saving progress after every chunk. Leads already
+    imported are skipped as duplicates, so a failed job can simply be run
+    again.
+    """
+    ImportJob.objects.filter(id=job.id).update(status='running', error='', updated_at=timezone.now())
+
+    def save_progress(importer):
+        ImportJob.objects.filter(id=job.id).update(bytes_processed=importer.bytes_read, updated_at=timezone.now(), **importer.summary())
+
+    try:
+        importer = import_leads_file(get_job_path(job), job.format, user=job.user, on_progress=save_progress, request=request)
+    except Exception as e:
+        ImportJob.objects.filter(id=job.id).update(status='failed', error=str(e), updated_at=timezone.now())
+        raise
+
+    ImportJob.objects.filter(id=job.id).update(
+        status='completed',
+        bytes_processed=job.file_size,
+        finished_at=timezone.now(),
+        updated_at=timezone.now(),
+        **importer.summary()
+    )
+    shutil.rmtree(get_job_path(job).parent, ignore_errors=True)
+    return importer
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from crm.audit_archive import archive_expired, ensure_partitions, purge_archives
+
+
+class Command(BaseCommand):
+    help = (
+        'Create upcoming audit log partitions, move months older than the '
+        'retention window into compressed archives, and purge expired archives.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-months', type=int, default=None,
+            help='Months of audit log kept in the database (default: AUDIT_LOG_RETENTION_MONTHS).'
+        )
+        parser.add_argument(
+            '--archive-retention-months', type=int, default=None,
+            help='Months of archives kept on disk, 0 keeps them forever (default: AUDIT_ARCHIVE_RETENTION_MONTHS).'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only list what would be archived or purged.')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        if not dry_run:
+            for period_start in ensure_partitions():
+                self.stdout.write(f'Partition ready for {period_start:%Y-%m}')
+
+        archived = archive_expired(options['retention_months'], dry_run=dry_run)
+        for item in archived:
+            if dry_run:
+                self.stdout.write(f'Would archive {item:%Y-%m}')
+            else:
+                self.stdout.write(self.style.SUCCESS(f'Archived {item.period_start:%Y-%m}: {item.row_count} entries -> {item.path}'))
+
+        purged = purge_archives(options['archive_retention_months'], dry_run=dry_run)
+        for archive in purged:
+            verb = 'Would purge' if dry_run else 'Purged'
+            self.stdout.write(f'{verb} archive {archive.period_start:%Y-%m}')
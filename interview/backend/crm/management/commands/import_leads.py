@@ -0,0 +1,56 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.imports import IMPORT_FORMATS, get_import_format, import_leads_file
+
+
+class Command(BaseCommand):
+    help = (
+        'Import leads and their primary contacts from a CSV or JSON Lines file. '
+        'Rows are validated and inserted in chunks; leads whose email already '
+        'exists are skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import.')
+        parser.add_argument(
+            '--format', choices=IMPORT_FORMATS, default=None,
+            help='File format (default: from the file extension, else csv).'
+        )
+        parser.add_argument('--user', default=None, help='Username recorded as owner and in the audit log.')
+        parser.add_argument(
+            '--chunk-size', type=int, default=None,
+            help='Rows validated and inserted per transaction (default: IMPORT_CHUNK_SIZE).'
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"User {options['user']} not found")
+
+        def report(importer):
+            self.stdout.write(
+                f'{importer.rows_processed} rows: {importer.rows_imported} imported, '
+                f'{importer.rows_skipped} duplicates skipped, {importer.rows_failed} failed'
+            )
+
+        try:
+            importer = import_leads_file(
+                options['path'],
+                options['format'] or get_import_format(options['path']),
+                user=user,
+                chunk_size=options['chunk_size'],
+                on_progress=report if options['verbosity'] > 1 else None,
+            )
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for error in importer.errors:
+            self.stderr.write(f"Line {error['line']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {importer.rows_imported} leads from {importer.rows_processed} rows '
+            f'({importer.rows_skipped} duplicates skipped, {importer.rows_failed} failed)'
+        ))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from crm.reminders import run_scheduler
+from crm.tasks import dispatch_reminders
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the reminder scheduler: keep pending reminders in memory, wake '
+        'when the earliest one is due and hand it to the dispatch workers.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--inline', action='store_true',
+            help='Send reminders from this process instead of queueing Celery tasks.'
+        )
+
+    def handle(self, *args, **options):
+        inline = options['inline']
+
+        def dispatch(ids):
+            if inline:
+                dispatch_reminders(ids)
+            else:
+                dispatch_reminders.delay(ids)
+
+        self.stdout.write('Reminder scheduler started')
+        try:
+            run_scheduler(dispatch)
+        except KeyboardInterrupt:
+            self.stdout.write('Reminder scheduler stopped')
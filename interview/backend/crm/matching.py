@@ -0,0 +1,62 @@
+"""
+Normalized match keys for duplicate lead detection.
+
+Leads that share any non-empty key fall into the same block, and only
+leads within a block are ever compared with each other.
+"""
+
+import re
+
+
+# Shared mailbox providers say nothing about the company, so leads using
+# them are blocked on the whole address instead of the domain
+FREE_EMAIL_DOMAINS = {
+    'gmail.com', 'googlemail.com', 'yahoo.com', 'ymail.com', 'hotmail.com',
+    'outlook.com', 'live.com', 'msn.com', 'icloud.com', 'me.com', 'aol.com',
+    'proton.me', 'protonmail.com', 'gmx.com', 'mail.com', 'zoho.com',
+}
+
+COMPANY_SUFFIXES = {
+    'inc', 'incorporated', 'llc', 'llp', 'ltd', 'limited', 'corp', 'corporation',
+    'co', 'company', 'plc', 'gmbh', 'ag', 'sa', 'bv', 'pty', 'group', 'the',
+}
+
+MATCH_KEY_FIELDS = ('email_key', 'company_key', 'phone_key')
+
+
+def normalize_email(email):
+    email = (email or '').strip().lower()
+    if '@' not in email:
+        return ''
+    local, domain = email.rsplit('@', 1)
+    local = local.split('+', 1)[0]
+    if domain in ('gmail.com', 'googlemail.com'):
+        local = local.replace('.', '')
+        domain = 'gmail.com'
+    return f'{local}@{domain}'
+
+
+def email_key(email):
+    """The email's domain, or the whole address for free mail providers."""
+    email = normalize_email(email)
+    if not email:
+        return ''
+    domain = email.rsplit('@', 1)[1]
+    return email if domain in FREE_EMAIL_DOMAINS else domain
+
+
+def company_key(company):
+    """Lowercase company name without punctuation or legal suffixes."""
+    words = re.findall(r'\w+', (company or '').lower())
+    words = [word for word in words if word not in COMPANY_SUFFIXES]
+    return ' '.join(words)
+
+
+def phone_key(phone):
+    """The last ten digits of a phone number, ignoring formatting and country codes."""
+    digits = re.sub(r'\D', '', phone or '')
+    return digits[-10:] if len(digits) >= 7 else ''
+
+
+def match_keys(email, company, phone):
+    return email_key(email), company_key(company), phone_key(phone)
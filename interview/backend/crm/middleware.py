@@ -0,0 +1,164 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.asgi import ASGIRequest
+from django.core.signals import request_finished
+
+from .performance import (
+    RequestMetrics, current_metrics, finish_profile, log_slow_request, start_profile,
+    start_recording_queries,
+)
+from .routers import (
+    REPLICA, SAFE_METHODS, allows_replica, authenticated_user, end_replica_request, replica_request,
+    stick_to_primary,
+)
+from .utils import audit_buffer
+
+
+class AuditBufferMiddleware:
+    """
+    Collect the audit entries logged while handling a request and write
+    them with one bulk INSERT once the response is ready.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        with audit_buffer():
+            return self.get_response(request)
+
+
+class PerformanceMiddleware:
+    """
+    Time the SQL, serialization and rendering of each request, report them
+    in a Server-Timing header, log slow requests with their slowest queries,
+    and profile sampled requests to one route (see crm.performance).
+    """
+    
+    def __init__(self, get_response):
+        if not settings.PERF_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        start_recording_queries()
+    
+    def __call__(self, request):
+        metrics = RequestMetrics(settings.PERF_SLOW_QUERIES)
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+            profiler = request.__dict__.pop('_profiler', None)
+            if profiler is not None:
+                finish_profile(request, profiler)
+        total = time.perf_counter() - metrics.started
+        if settings.PERF_SERVER_TIMING:
+            response['Server-Timing'] = metrics.server_timing(total)
+        if total * 1000 >= settings.PERF_SLOW_REQUEST_MS:
+            log_slow_request(request, response, metrics, total)
+        return response
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if settings.PERF_PROFILE_ROUTE:
+            request._profiler = start_profile(request)
+    
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after this, by the handler
+        metrics = current_metrics.get()
+        sql_before = metrics.sql_time
+        started = time.perf_counter()
+        
+        def rendered(response):
+            metrics.add_phase('render', time.perf_counter() - started - (metrics.sql_time - sql_before))
+        
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Let the reads of safe requests to views that allow it go to the read
+    replica (see crm.routers), and keep users who send a write on the
+    primary for a while.
+    """
+    
+    def __init__(self, get_response):
+        if REPLICA not in settings.DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        request_finished.connect(end_replica_request, dispatch_uid='crm.routers.end_replica_request')
+    
+    def __call__(self, request):
+        replica_request.set(None)
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS:
+            user = authenticated_user(request)
+            if user is not None:
+                stick_to_primary(request, response, user)
+        return response
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method in SAFE_METHODS and allows_replica(view_func):
+            # Left set until the response is finished, so streamed responses read from it too
+            replica_request.set(request)
+
+
+# Bytes of a streamed response read in the request's thread at a time
+STREAM_BATCH_SIZE = 64 * 1024
+
+
+def read_batch(iterator, size):
+    """Items of `iterator` joined up to about `size` bytes; empty once exhausted."""
+    batch = []
+    length = 0
+    for item in iterator:
+        batch.append(item)
+        length += len(item)
+        if length >= size:
+            break
+    return b''.join(batch)
+
+
+async def iterate_in_thread(iterable, batch_size=None):
+    """
+    Iterate over a synchronous iterable of bytes in the request's thread,
+    where its database cursor and connection live. Items are joined into
+    batches of about `batch_size` bytes, each read in one call to that
+    thread, or passed on one at a time when it is None.
+    """
+    iterator = iter(iterable)
+    if batch_size is None:
+        done = object()
+        get_next = sync_to_async(next, thread_sensitive=True)
+        while (item := await get_next(iterator, done)) is not done:
+            yield item
+    else:
+        get_batch = sync_to_async(read_batch, thread_sensitive=True)
+        while batch := await get_batch(iterator, batch_size):
+            yield batch
+
+
+class AsyncStreamingMiddleware:
+    """
+    Under ASGI, Django reads a streaming response with a synchronous
+    iterator to the end before sending any of it, which holds whole exports
+    in memory and never sends the event stream. Give such responses an
+    asynchronous iterator instead, so they stream as they do under WSGI.
+    Event streams are passed on an event at a time, as the next one may be
+    minutes away; other responses in batches.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        response = self.get_response(request)
+        if isinstance(request, ASGIRequest) and response.streaming and not response.is_async:
+            event_stream = response.get('Content-Type', '').startswith('text/event-stream')
+            response.streaming_content = iterate_in_thread(
+                response.streaming_content, None if event_stream else STREAM_BATCH_SIZE
+            )
+        return response
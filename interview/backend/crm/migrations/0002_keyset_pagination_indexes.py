@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['timestamp', 'id'], name='crm_auditlo_timesta_4e1291_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['-is_primary', 'name', 'id'], name='crm_contact_is_prim_65ede3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='correspondence',
+            index=models.Index(fields=['date', 'id'], name='crm_corresp_date_d986ff_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['created_at', 'id'], name='crm_lead_created_645e3c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['updated_at', 'id'], name='crm_lead_updated_e68b38_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['estimated_value', 'id'], name='crm_lead_estimat_048cfd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['status', 'id'], name='crm_lead_status_e3fc97_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['created_at', 'id'], name='crm_note_created_d59b4b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(fields=['reminder_date', 'id'], name='crm_reminde_reminde_bf6e52_idx'),
+        ),
+    ]
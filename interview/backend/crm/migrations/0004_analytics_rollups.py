@@ -0,0 +1,93 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def mark_existing_days_dirty(apps, schema_editor):
+    """Queue every day with existing data so the first rollup run backfills it."""
+    Lead = apps.get_model('crm', 'Lead')
+    AuditLog = apps.get_model('crm', 'AuditLog')
+    RollupDirtyDay = apps.get_model('crm', 'RollupDirtyDay')
+    dirty = [RollupDirtyDay(kind='leads', day=day) for day in Lead.objects.dates('created_at', 'day')]
+    dirty += [
+        RollupDirtyDay(kind='conversions', day=day)
+        for day in AuditLog.objects.filter(model_name='Lead', action='update').dates('timestamp', 'day')
+    ]
+    RollupDirtyDay.objects.bulk_create(dirty, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('crm', '0003_export_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversionDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('conversions', models.PositiveIntegerField(default=0)),
+                ('converted_value', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+            ],
+            options={
+                'ordering': ['day'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LeadDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('new', 'New'), ('contacted', 'Contacted'), ('qualified', 'Qualified'), ('lost', 'Lost'), ('converted', 'Converted')], max_length=20)),
+                ('leads_created', models.PositiveIntegerField(default=0)),
+                ('value_created', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+            ],
+            options={
+                'ordering': ['day'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupDirtyDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('leads', 'Leads'), ('conversions', 'Conversions')], max_length=20)),
+                ('day', models.DateField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='rollupdirtyday',
+            constraint=models.UniqueConstraint(fields=('kind', 'day'), name='unique_rollup_dirty_day'),
+        ),
+        migrations.AddField(
+            model_name='leaddailyrollup',
+            name='owner',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='conversiondailyrollup',
+            name='owner',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='leaddailyrollup',
+            index=models.Index(fields=['day', 'status'], name='crm_leaddai_day_9a411a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaddailyrollup',
+            index=models.Index(fields=['owner', 'day'], name='crm_leaddai_owner_i_e7b65c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversiondailyrollup',
+            index=models.Index(fields=['day'], name='crm_convers_day_73184b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversiondailyrollup',
+            index=models.Index(fields=['owner', 'day'], name='crm_convers_owner_i_83dd93_idx'),
+        ),
+        migrations.RunPython(mark_existing_days_dirty, migrations.RunPython.noop),
+    ]
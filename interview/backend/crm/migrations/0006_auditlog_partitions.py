@@ -0,0 +1,101 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:47
+
+from datetime import date, datetime, time, timezone
+
+from django.db import migrations, models
+
+
+PARTITIONS_AHEAD = 3
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return date(value.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_auditlog(apps, schema_editor):
+    """
+    Rebuild crm_auditlog as a table range-partitioned by month on timestamp.
+    PostgreSQL only; other backends fall back to per-period tables created
+    by the archive_audit_logs command.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes "
+            "WHERE tablename = 'crm_auditlog' AND indexname <> 'crm_auditlog_pkey'"
+        )
+        index_defs = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = 'crm_auditlog'::regclass AND contype = 'f'"
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute('SELECT min("timestamp"), max(id) FROM crm_auditlog')
+        first_timestamp, max_id = cursor.fetchone()
+
+        cursor.execute('ALTER TABLE crm_auditlog RENAME TO crm_auditlog_unpartitioned')
+        cursor.execute(
+            'ALTER TABLE crm_auditlog_unpartitioned '
+            'RENAME CONSTRAINT crm_auditlog_pkey TO crm_auditlog_unpartitioned_pkey'
+        )
+        cursor.execute(
+            'CREATE TABLE crm_auditlog (LIKE crm_auditlog_unpartitioned INCLUDING DEFAULTS) '
+            'PARTITION BY RANGE ("timestamp")'
+        )
+        # The partition key must be part of every unique constraint
+        cursor.execute('ALTER TABLE crm_auditlog ADD CONSTRAINT crm_auditlog_pkey PRIMARY KEY (id, "timestamp")')
+        cursor.execute('CREATE SEQUENCE crm_auditlog_partitioned_id_seq OWNED BY crm_auditlog.id')
+        cursor.execute("SELECT setval('crm_auditlog_partitioned_id_seq', %s, false)", [(max_id or 0) + 1])
+        cursor.execute(
+            "ALTER TABLE crm_auditlog ALTER COLUMN id SET DEFAULT nextval('crm_auditlog_partitioned_id_seq')"
+        )
+
+        cursor.execute('CREATE TABLE crm_auditlog_default PARTITION OF crm_auditlog DEFAULT')
+        today = datetime.now(timezone.utc).date()
+        period = date(first_timestamp.year, first_timestamp.month, 1) if first_timestamp else date(today.year, today.month, 1)
+        last = add_months(date(today.year, today.month, 1), PARTITIONS_AHEAD)
+        while period <= last:
+            cursor.execute(
+                f'CREATE TABLE crm_auditlog_p{period:%Y%m} PARTITION OF crm_auditlog FOR VALUES FROM (%s) TO (%s)',
+                [
+                    datetime.combine(period, time.min, tzinfo=timezone.utc),
+                    datetime.combine(add_months(period, 1), time.min, tzinfo=timezone.utc),
+                ]
+            )
+            period = add_months(period, 1)
+
+        cursor.execute('INSERT INTO crm_auditlog SELECT * FROM crm_auditlog_unpartitioned')
+        cursor.execute('DROP TABLE crm_auditlog_unpartitioned')
+        for index_def in index_defs:
+            cursor.execute(index_def)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE crm_auditlog ADD CONSTRAINT {name} {definition}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0005_auditlog_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditLogArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField(unique=True)),
+                ('period_end', models.DateField()),
+                ('path', models.CharField(max_length=500)),
+                ('keys_path', models.CharField(max_length=500)),
+                ('row_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-period_start'],
+            },
+        ),
+        migrations.RunPython(partition_auditlog, migrations.RunPython.noop),
+    ]
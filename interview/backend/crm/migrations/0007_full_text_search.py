@@ -0,0 +1,118 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:05
+
+from django.db import migrations
+
+
+# table: [(column, weight, text search config)]
+SEARCH_COLUMNS = {
+    'crm_lead': [
+        ('name', 'A', 'english'),
+        ('company', 'A', 'english'),
+        ('email', 'B', 'simple'),
+        ('phone', 'B', 'simple'),
+        ('description', 'C', 'english'),
+    ],
+    'crm_contact': [
+        ('name', 'A', 'english'),
+        ('email', 'B', 'simple'),
+        ('phone', 'B', 'simple'),
+        ('position', 'B', 'english'),
+        ('notes', 'C', 'english'),
+    ],
+    'crm_note': [
+        ('content', 'A', 'english'),
+    ],
+    'crm_correspondence': [
+        ('subject', 'A', 'english'),
+        ('description', 'C', 'english'),
+    ],
+}
+
+
+def postgresql_vector(columns):
+    parts = []
+    for column, weight, config in columns:
+        value = f"coalesce({column}, '')"
+        if config == 'simple':
+            # Split emails and phone numbers into searchable parts
+            value = f"translate({value}, '@.-_+()', '       ')"
+        parts.append(f"setweight(to_tsvector('{config}', {value}), '{weight}')")
+    return ' || '.join(parts)
+
+
+def create_sqlite_triggers(cursor, table):
+    """
+    Keep the FTS5 table of `table` in sync and rebuild its contents.
+    SQLite drops triggers with their table, so migrations that make Django
+    rebuild one of the indexed tables must call this again.
+    """
+    fts = f'{table}_fts'
+    names = [column for column, _, _ in SEARCH_COLUMNS[table]]
+    column_list = ', '.join(names)
+    new_values = ', '.join(f'new.{name}' for name in names)
+    old_values = ', '.join(f'old.{name}' for name in names)
+    for trigger in ('insert', 'delete', 'update'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {fts}_{trigger}')
+    cursor.execute(
+        f'CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN '
+        f'INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END'
+    )
+    cursor.execute(
+        f'CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END"
+    )
+    cursor.execute(
+        f'CREATE TRIGGER {fts}_update AFTER UPDATE OF {column_list} ON {table} BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+        f'INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END'
+    )
+    cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def create_search_indexes(apps, schema_editor):
+    """
+    PostgreSQL: a generated tsvector column with a GIN index per table.
+    SQLite: an external-content FTS5 table kept in sync by triggers.
+    Both are maintained by the database itself, including bulk writes.
+    """
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        for table, columns in SEARCH_COLUMNS.items():
+            names = [column for column, _, _ in columns]
+            if vendor == 'postgresql':
+                cursor.execute(
+                    f'ALTER TABLE {table} ADD COLUMN search_vector tsvector '
+                    f'GENERATED ALWAYS AS ({postgresql_vector(columns)}) STORED'
+                )
+                cursor.execute(f'CREATE INDEX {table}_search_gin ON {table} USING gin (search_vector)')
+            elif vendor == 'sqlite':
+                fts = f'{table}_fts'
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE {fts} USING fts5({', '.join(names)}, "
+                    f"content='{table}', content_rowid='id', tokenize='porter unicode61')"
+                )
+                create_sqlite_triggers(cursor, table)
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        for table in SEARCH_COLUMNS:
+            if vendor == 'postgresql':
+                cursor.execute(f'ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector')
+            elif vendor == 'sqlite':
+                fts = f'{table}_fts'
+                for trigger in ('insert', 'delete', 'update'):
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {fts}_{trigger}')
+                cursor.execute(f'DROP TABLE IF EXISTS {fts}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_auditlog_partitions'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:58
+
+from importlib import import_module
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from crm.matching import match_keys
+
+
+def fill_match_keys(apps, schema_editor):
+    Lead = apps.get_model('crm', 'Lead')
+    batch = []
+    for lead in Lead.objects.only('id', 'email', 'company', 'phone').iterator(chunk_size=2000):
+        lead.email_key, lead.company_key, lead.phone_key = match_keys(lead.email, lead.company, lead.phone)
+        batch.append(lead)
+        if len(batch) >= 2000:
+            Lead.objects.bulk_update(batch, ['email_key', 'company_key', 'phone_key'])
+            batch = []
+    if batch:
+        Lead.objects.bulk_update(batch, ['email_key', 'company_key', 'phone_key'])
+
+
+def restore_search_triggers(apps, schema_editor):
+    """Adding the key columns rebuilt crm_lead on SQLite, dropping its FTS triggers."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    search_migration = import_module('crm.migrations.0007_full_text_search')
+    with schema_editor.connection.cursor() as cursor:
+        search_migration.create_sqlite_triggers(cursor, 'crm_lead')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0007_full_text_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DuplicateCandidate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('reasons', models.JSONField(default=list)),
+                ('status', models.CharField(choices=[('open', 'Open'), ('dismissed', 'Dismissed')], default='open', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-score', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='lead',
+            name='company_key',
+            field=models.CharField(blank=True, editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='lead',
+            name='email_key',
+            field=models.CharField(blank=True, editable=False, max_length=254),
+        ),
+        migrations.AddField(
+            model_name='lead',
+            name='phone_key',
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['email_key'], name='crm_lead_email_k_10d743_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['company_key'], name='crm_lead_company_731991_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['phone_key'], name='crm_lead_phone_k_470f2a_idx'),
+        ),
+        migrations.AddField(
+            model_name='duplicatecandidate',
+            name='duplicate',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='crm.lead'),
+        ),
+        migrations.AddField(
+            model_name='duplicatecandidate',
+            name='lead',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='crm.lead'),
+        ),
+        migrations.AddIndex(
+            model_name='duplicatecandidate',
+            index=models.Index(fields=['status', '-score'], name='crm_duplica_status_7a8960_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='duplicatecandidate',
+            constraint=models.UniqueConstraint(fields=('lead', 'duplicate'), name='unique_duplicate_pair'),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+        migrations.RunPython(fill_match_keys, migrations.RunPython.noop),
+    ]
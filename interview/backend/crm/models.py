@@ -1,9 +1,84 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.conf import settings
 from django.utils import timezone
 
+from .matching import MATCH_KEY_FIELDS, match_keys
 
-class Lead(models.Model):
+
+class ChangeTrackingMixin(models.Model):
+    """
+    Snapshot field values when an instance is loaded from the database so
+    saves only write the columns that changed.
+    After each save `saved_changes` maps field names to (old, new) values.
+    Fields listed in `derived_fields` are computed from other fields by
+    update_derived_fields() before each save; they are written when they
+    change but left out of saved_changes.
+    """
+    
+    untracked_fields = ('id', 'created_at', 'updated_at')
+    derived_fields = ()
+    
+    class Meta:
+        abstract = True
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot = instance._tracked_values()
+        return instance
+    
+    def _tracked_fields(self):
+        return [field for field in self._meta.concrete_fields if field.name not in self.untracked_fields]
+    
+    def _tracked_values(self):
+        # Deferred fields are not in __dict__ and are left out of the snapshot
+        return {
+            field.attname: self.__dict__[field.attname]
+            for field in self._tracked_fields()
+            if field.attname in self.__dict__
+        }
+    
+    def get_changes(self):
+        """Return {field name: (old, new)} for fields changed since loading."""
+        snapshot = getattr(self, '_snapshot', None)
+        if snapshot is None:
+            return {}
+        changes = {}
+        for field in self._tracked_fields():
+            if field.attname not in self.__dict__:
+                continue
+            new_value = self.__dict__[field.attname]
+            old_value = snapshot.get(field.attname, new_value)
+            if field.attname not in snapshot or old_value != new_value:
+                changes[field.name] = (old_value, new_value)
+        return changes
+    
+    def update_derived_fields(self):
+        """Recompute `derived_fields`. Bulk writes that bypass save() call this."""
+    
+    def mark_saved(self):
+        """Start tracking from the current values, e.g. after a bulk write."""
+        self._snapshot = self._tracked_values()
+    
+    def save(self, *args, **kwargs):
+        self.update_derived_fields()
+        if kwargs.get('update_fields') is not None and self.derived_fields:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | set(self.derived_fields)
+        changes = self.get_changes()
+        if (getattr(self, '_snapshot', None) is not None and not self._state.adding
+                and kwargs.get('update_fields') is None and not kwargs.get('force_insert')):
+            if not changes:
+                self.saved_changes = {}
+                return
+            auto_now = [field.name for field in self._meta.concrete_fields if getattr(field, 'auto_now', False)]
+            kwargs['update_fields'] = list(changes) + auto_now
+        super().save(*args, **kwargs)
+        self.saved_changes = {name: change for name, change in changes.items() if name not in self.derived_fields}
+        self.mark_saved()
+
+
+class Lead(ChangeTrackingMixin, models.Model):
     """Model for managing leads."""
     
     STATUS_CHOICES = [
@@ -32,19 +107,39 @@ class Lead(models.Model):
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Normalized keys for duplicate detection, see crm.matching
+    email_key = models.CharField(max_length=254, blank=True, editable=False)
+    company_key = models.CharField(max_length=200, blank=True, editable=False)
+    phone_key = models.CharField(max_length=20, blank=True, editable=False)
+    
+    derived_fields = MATCH_KEY_FIELDS
     
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['status', 'owner']),
             models.Index(fields=['created_at']),
+            # Keyset pagination: ordering field plus the id tie-breaker
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['updated_at', 'id']),
+            models.Index(fields=['estimated_value', 'id']),
+            models.Index(fields=['status', 'id']),
+            # Blocking index for duplicate detection
+            models.Index(fields=['email_key']),
+            models.Index(fields=['company_key']),
+            models.Index(fields=['phone_key']),
+            # Case-insensitive email lookups when importing
+            models.Index(Lower('email'), name='crm_lead_email_lower_idx'),
         ]
     
     def __str__(self):
         return f"{self.name} - {self.company}"
+    
+    def update_derived_fields(self):
+        self.email_key, self.company_key, self.phone_key = match_keys(self.email, self.company, self.phone)
 
 
-class Contact(models.Model):
+class Contact(ChangeTrackingMixin, models.Model):
     """Model for managing contacts linked to leads."""
     
     lead = models.ForeignKey(Lead, on_delete=models.CASCADE, related_name='contacts')
@@ -59,12 +154,16 @@ class Contact(models.Model):
     
     class Meta:
         ordering = ['-is_primary', 'name']
+        indexes = [
+            models.Index(fields=['-is_primary', 'name', 'id']),
+            models.Index(fields=['updated_at', 'id']),
+        ]
     
     def __str__(self):
         return f"{self.name} - {self.lead.company}"
 
 
-class Note(models.Model):
+class Note(ChangeTrackingMixin, models.Model):
     """Model for notes on leads."""
     
     lead = models.ForeignKey(Lead, on_delete=models.CASCADE, related_name='notes')
@@ -75,12 +174,15 @@ class Note(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+        ]
     
     def __str__(self):
         return f"Note by {self.author} on {self.lead}"
 
 
-class Reminder(models.Model):
+class Reminder(ChangeTrackingMixin, models.Model):
     """Model for scheduling reminders for leads."""
     
     STATUS_CHOICES = [
@@ -102,6 +204,7 @@ class Reminder(models.Model):
         ordering = ['reminder_date']
         indexes = [
             models.Index(fields=['reminder_date', 'status']),
+            models.Index(fields=['reminder_date', 'id']),
         ]
     
     def __str__(self):
@@ -112,7 +215,7 @@ class Reminder(models.Model):
         return self.status == 'pending' and self.reminder_date < timezone.now()
 
 
-class Correspondence(models.Model):
+class Correspondence(ChangeTrackingMixin, models.Model):
     """Model for tracking correspondence with contacts."""
     
     TYPE_CHOICES = [
@@ -134,6 +237,9 @@ class Correspondence(models.Model):
     class Meta:
         ordering = ['-date']
         verbose_name_plural = 'Correspondences'
+        indexes = [
+            models.Index(fields=['date', 'id']),
+        ]
     
     def __str__(self):
         return f"{self.get_type_display()} - {self.subject}"
@@ -154,7 +260,8 @@ class AuditLog(models.Model):
     object_id = models.IntegerField()
     object_repr = models.CharField(max_length=200)
     changes = models.JSONField(default=dict, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the change is logged, not when a batched entry is inserted
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     
     class Meta:
@@ -162,8 +269,262 @@ class AuditLog(models.Model):
         indexes = [
             models.Index(fields=['model_name', 'object_id']),
             models.Index(fields=['timestamp']),
+            models.Index(fields=['timestamp', 'id']),
         ]
     
     def __str__(self):
         return f"{self.user} {self.action}d {self.model_name} #{self.object_id}"
 
+
+
+class ExportJob(models.Model):
+    """Background export of one CRM model, split into primary-key range chunks."""
+    
+    MODEL_CHOICES = [
+        ('lead', 'Leads'),
+        ('contact', 'Contacts'),
+        ('note', 'Notes'),
+        ('reminder', 'Reminders'),
+        ('correspondence', 'Correspondence'),
+        ('auditlog', 'Audit Logs'),
+    ]
+    
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('jsonl', 'JSON Lines'),
+        ('parquet', 'Parquet'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('finalizing', 'Finalizing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='export_jobs')
+    model_name = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='csv')
+    filters = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    total_chunks = models.PositiveIntegerField(default=0)
+    completed_chunks = models.PositiveIntegerField(default=0)
+    rows_exported = models.PositiveBigIntegerField(default=0)
+    file_path = models.CharField(max_length=500, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.get_model_name_display()} export #{self.id} ({self.status})"
+    
+    @property
+    def progress(self):
+        if not self.total_chunks:
+            return 100 if self.status == 'completed' else 0
+        return round(100 * self.completed_chunks / self.total_chunks)
+
+
+class ImportJob(models.Model):
+    """Lead import from an uploaded CSV or JSON Lines file."""
+    
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('jsonl', 'JSON Lines'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='import_jobs')
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='csv')
+    file_name = models.CharField(max_length=255, blank=True)
+    file_path = models.CharField(max_length=500, blank=True)
+    file_size = models.PositiveBigIntegerField(default=0)
+    bytes_processed = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    rows_processed = models.PositiveIntegerField(default=0)
+    rows_imported = models.PositiveIntegerField(default=0)
+    rows_skipped = models.PositiveIntegerField(default=0)
+    rows_failed = models.PositiveIntegerField(default=0)
+    # The first IMPORT_MAX_ERRORS failed rows as {'line', 'errors'}
+    errors = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Import #{self.id} {self.file_name} ({self.status})"
+    
+    @property
+    def progress(self):
+        if self.status == 'completed':
+            return 100
+        if not self.file_size:
+            return 0
+        return min(round(100 * self.bytes_processed / self.file_size), 99)
+
+
+class ExportChunk(models.Model):
+    """One primary-key range of an export job, written to its own part file."""
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+    ]
+    
+    job = models.ForeignKey(ExportJob, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    start_pk = models.BigIntegerField()
+    end_pk = models.BigIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    rows = models.PositiveIntegerField(default=0)
+    # When the task writing the chunk claimed it
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['job', 'index']
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'index'], name='unique_export_chunk'),
+        ]
+    
+    def __str__(self):
+        return f"Export #{self.job_id} chunk {self.index} [{self.start_pk}, {self.end_pk}]"
+
+
+class LeadDailyRollup(models.Model):
+    """Leads created per day, by current status and owner."""
+    
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=Lead.STATUS_CHOICES)
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+')
+    leads_created = models.PositiveIntegerField(default=0)
+    value_created = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    
+    class Meta:
+        ordering = ['day']
+        indexes = [
+            models.Index(fields=['day', 'status']),
+            models.Index(fields=['owner', 'day']),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} {self.status}: {self.leads_created}"
+
+
+class ConversionDailyRollup(models.Model):
+    """Leads converted per day and owner, derived from the audit trail."""
+    
+    day = models.DateField()
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+')
+    conversions = models.PositiveIntegerField(default=0)
+    converted_value = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    
+    class Meta:
+        ordering = ['day']
+        indexes = [
+            models.Index(fields=['day']),
+            models.Index(fields=['owner', 'day']),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} {self.owner_id}: {self.conversions}"
+
+
+class RollupDirtyDay(models.Model):
+    """A day whose rollup rows must be recomputed on the next rollup run."""
+    
+    KIND_CHOICES = [
+        ('leads', 'Leads'),
+        ('conversions', 'Conversions'),
+    ]
+    
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    day = models.DateField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'day'], name='unique_rollup_dirty_day'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} {self.day}"
+
+
+class AuditLogArchive(models.Model):
+    """A month of audit log entries moved out of the database into a compressed file."""
+    
+    period_start = models.DateField(unique=True)
+    period_end = models.DateField()
+    path = models.CharField(max_length=500)
+    keys_path = models.CharField(max_length=500)
+    row_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-period_start']
+    
+    def __str__(self):
+        return f"Audit log archive {self.period_start:%Y-%m} ({self.row_count} entries)"
+
+
+class DuplicateCandidate(models.Model):
+    """Pair of leads that look like the same company or person."""
+    
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('dismissed', 'Dismissed'),
+    ]
+    
+    # The pair is stored once, with the lower id as `lead`
+    lead = models.ForeignKey(Lead, on_delete=models.CASCADE, related_name='+')
+    duplicate = models.ForeignKey(Lead, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    reasons = models.JSONField(default=list)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-score', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['lead', 'duplicate'], name='unique_duplicate_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['status', '-score']),
+        ]
+    
+    def __str__(self):
+        return f"Lead #{self.lead_id} ~ Lead #{self.duplicate_id} ({self.score:.2f})"
+
+
+
+class Tombstone(models.Model):
+    """A deleted row, kept so the changes feeds can tell clients to drop it."""
+    
+    model_name = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['model_name', 'deleted_at', 'id']),
+            models.Index(fields=['deleted_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.model_name} #{self.object_id} deleted {self.deleted_at}"
@@ -0,0 +1,50 @@
+"""
+Side effects collected over a transaction and applied once it commits.
+
+Signal receivers run once per row, so a bulk write of a few hundred rows
+would repeat the same cache bump or dirty mark a few hundred times. They
+add their keys to a set kept on the database connection instead, and one
+on_commit callback applies the whole set. Outside a transaction the set is
+applied straight away, as on_commit does.
+"""
+
+from django.db import transaction
+
+
+class PendingBatch:
+    """Keys collected in one transaction for one `apply` function."""
+
+    def __init__(self, apply, savepoint_ids):
+        self.apply = apply
+        self.savepoint_ids = savepoint_ids
+        self.keys = set()
+
+    def flush(self):
+        self.apply(self.keys)
+
+
+def collect_on_commit(name, keys, apply):
+    """
+    Add `keys` to the batch `name` of the current transaction, which is
+    passed to `apply(keys)` once it commits.
+    """
+    keys = set(keys)
+    if not keys:
+        return
+    connection = transaction.get_connection()
+    batches = connection.__dict__.setdefault('pending_batches', {})
+    batch = batches.get(name)
+    savepoint_ids = list(connection.savepoint_ids)
+    # Only join a batch of the same savepoint, so rolling back a savepoint
+    # drops exactly the keys collected in it. A batch whose flush is no
+    # longer queued has run, or was dropped by a rollback.
+    if (
+        batch is not None
+        and batch.savepoint_ids == savepoint_ids
+        and any(func == batch.flush for _, func, _ in connection.run_on_commit)
+    ):
+        batch.keys.update(keys)
+        return
+    batch = batches[name] = PendingBatch(apply, savepoint_ids)
+    batch.keys.update(keys)
+    transaction.on_commit(batch.flush, robust=True)
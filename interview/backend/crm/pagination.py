@@ -0,0 +1,195 @@
+import base64
+import json
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q, QuerySet
+from rest_framework import exceptions
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import PageNumberPagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Keyset pagination over every field of the view's ordering.
+    The primary key is appended as a unique tie-breaker, so rows sharing an
+    `estimated_value` or `status` never get skipped or repeated between pages,
+    and each page is a single indexed range scan with no COUNT(*) or OFFSET.
+
+    NULLs sort as the largest value (PostgreSQL's default), which keeps the
+    ordering identical on SQLite and lets PostgreSQL scan plain b-tree indexes.
+    """
+    invalid_cursor_message = 'Invalid cursor'
+    ranked_search_message = (
+        'Search results ordered by relevance cannot be paged with a cursor; '
+        'pass an explicit ordering or use page numbers.'
+    )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.fields = self.get_keyset(request, queryset, view)
+
+        values, reverse = self.decode_cursor(request)
+        fields = [(field, not desc if reverse else desc) for field, desc in self.fields]
+
+        if values is not None:
+            queryset = queryset.filter(self.after(fields, values))
+        queryset = queryset.order_by(*[self.order_expression(field, desc) for field, desc in fields])
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = values is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = values is not None
+        return self.page
+
+    def get_keyset(self, request, queryset, view):
+        """Return [(field, descending)] for the effective ordering plus the pk."""
+        if queryset.query.order_by[:1] == ('-search_rank',):
+            # The rank is computed per query and is no stable column to seek on
+            raise exceptions.ValidationError({'pagination': [self.ranked_search_message]})
+        ordering = None
+        ordering_filter = next(
+            (backend for backend in getattr(view, 'filter_backends', []) if issubclass(backend, OrderingFilter)),
+            None
+        )
+        if ordering_filter is not None:
+            ordering = ordering_filter().get_ordering(request, queryset, view)
+        if not ordering:
+            ordering = getattr(view, 'ordering', None) or queryset.model._meta.ordering or []
+        if isinstance(ordering, str):
+            ordering = [ordering]
+
+        opts = queryset.model._meta
+        keyset = []
+        for item in ordering:
+            name = item.lstrip('-')
+            if name == 'pk':
+                name = opts.pk.name
+            field = opts.get_field(name)
+            if field.primary_key:
+                break
+            keyset.append((field, item.startswith('-')))
+
+        descending = keyset[-1][1] if keyset else False
+        keyset.append((opts.pk, descending))
+        return keyset
+
+    def order_expression(self, field, desc):
+        if desc:
+            return F(field.attname).desc(nulls_first=True)
+        return F(field.attname).asc(nulls_last=True)
+
+    def after(self, fields, values):
+        """
+        Build (a > x) OR (a = x AND b > y) OR ... for the given direction.
+        """
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (field, desc), value in zip(fields, values):
+            name = field.attname
+            if value is None:
+                # NULLs sort last ascending and first descending
+                greater = Q(**{f'{name}__isnull': False}) if desc else Q(pk__in=[])
+                same = Q(**{f'{name}__isnull': True})
+            else:
+                greater = Q(**{f'{name}__lt' if desc else f'{name}__gt': value})
+                if field.null and not desc:
+                    greater |= Q(**{f'{name}__isnull': True})
+                same = Q(**{name: value})
+            condition |= equal & greater
+            equal &= same
+        return condition
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            raw_values = data['v']
+            reverse = bool(data.get('r'))
+            if len(raw_values) != len(self.fields):
+                raise ValueError
+            values = [
+                None if raw is None else field.to_python(raw)
+                for (field, desc), raw in zip(self.fields, raw_values)
+            ]
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def encode_cursor(self, instance, reverse):
+        if isinstance(instance, dict):
+            # values() rows, keyed by field name
+            instance = SimpleNamespace(**{field.attname: instance[field.name] for field, desc in self.fields})
+        values = []
+        for field, desc in self.fields:
+            value = getattr(instance, field.attname)
+            values.append(None if value is None else field.value_to_string(instance))
+        data = {'v': values}
+        if reverse:
+            data['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+
+class CRMPagination(PageNumberPagination):
+    """
+    Page-number pagination by default, switching to keyset pagination when
+    the client sends `?pagination=cursor` or a `cursor` parameter.
+    """
+    mode_query_param = 'pagination'
+    cursor_class = KeysetPagination
+
+    def use_cursor(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.cursor_class.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor = None
+        # Keyset pagination needs a queryset; other sequences use page numbers
+        if self.use_cursor(request) and isinstance(queryset, QuerySet):
+            self.cursor = self.cursor_class()
+            self.cursor.page_size = self.page_size
+            return self.cursor.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor is not None:
+            return self.cursor.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,82 @@
+"""
+Running independent queries concurrently.
+
+Aggregate-heavy views such as the dashboard stats and the global search
+issue several queries that do not depend on each other. `run_queries`
+runs them at the same time on a thread pool shared by the process, each
+thread with its own database connection, so the response waits for the
+slowest query instead of the sum of all of them.
+
+Pool threads keep their connections like request threads do: they are
+closed once obsolete (CONN_MAX_AGE), or handed back right away with the
+connection pool (crm.dbpool). With the connection pool, the calling thread
+also hands its connection back before waiting on the pool threads, so
+requests waiting on their queries cannot hold every connection the queries
+need. The pool is sized for every request and query thread (settings).
+
+Queries run inline, one after another, when PARALLEL_QUERY_THREADS is
+below 2, on SQLite, which runs queries inside the process so there is no
+waiting on the server to overlap, inside a transaction, whose uncommitted
+rows other connections cannot see, and when called from a pool thread.
+"""
+
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_pool_thread = threading.local()
+
+POOLED_ENGINE = 'crm.dbpool'
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.PARALLEL_QUERY_THREADS,
+                    thread_name_prefix='crm-query',
+                )
+    return _executor
+
+
+def _run(func):
+    _pool_thread.active = True
+    try:
+        return func()
+    finally:
+        close_old_connections()
+
+
+def release_pooled_connections():
+    """Give this thread's pooled connections back to the pool until its next query."""
+    for connection in connections.all(initialized_only=True):
+        if connection.settings_dict['ENGINE'] == POOLED_ENGINE and not connection.in_atomic_block:
+            connection.close()
+
+
+def run_queries(*funcs):
+    """Call `funcs` concurrently and return their results in order."""
+    if (
+        len(funcs) < 2
+        or settings.PARALLEL_QUERY_THREADS < 2
+        or getattr(_pool_thread, 'active', False)
+        or connections[DEFAULT_DB_ALIAS].vendor == 'sqlite'
+        or connections[DEFAULT_DB_ALIAS].in_atomic_block
+    ):
+        return [func() for func in funcs]
+
+    release_pooled_connections()
+    # Copied so the pool threads route reads like the caller (crm.routers)
+    futures = [
+        get_executor().submit(contextvars.copy_context().run, _run, func)
+        for func in funcs
+    ]
+    return [future.result() for future in futures]
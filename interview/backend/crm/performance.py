@@ -0,0 +1,191 @@
+"""
+Per-request performance instrumentation.
+
+PerformanceMiddleware measures every request and, with PERF_SERVER_TIMING,
+reports it in a `Server-Timing` header, which browsers show in their
+network panel:
+
+- `sql`: time spent in database queries, described with their count;
+- `serialize`: time turning rows and model instances into response data
+  (crm.conditional), SQL run meanwhile excluded;
+- `render`: time rendering the response body;
+- `total`: time from the middleware receiving the request to the response.
+
+Queries are recorded by an execute wrapper installed on every database
+connection as it opens, so the queries crm.parallel runs on other threads
+count toward the request that started them. Outside requests the wrapper
+only looks up a context variable; inside, it reads the clock twice and
+keeps the PERF_SLOW_QUERIES slowest queries. Requests taking
+PERF_SLOW_REQUEST_MS or longer are logged with those queries and, for
+SELECTs, their plans. Neither the query string nor the query parameters
+are logged, as they can hold personal data such as searched emails.
+
+With PERF_PROFILE_ROUTE set to a URL name such as `lead-list`, a share of
+PERF_PROFILE_SAMPLE_RATE of its requests runs under cProfile, one at a
+time per process, and the stats are written to PERF_PROFILE_DIR for
+`python -m pstats`.
+"""
+
+import contextvars
+import cProfile
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.backends.signals import connection_created
+
+
+logger = logging.getLogger(__name__)
+
+current_metrics = contextvars.ContextVar('request_metrics', default=None)
+
+# cProfile can only profile one request of a process at a time
+_profile_lock = threading.Lock()
+
+
+def milliseconds(seconds):
+    return f'{seconds * 1000:.1f}'
+
+
+class RequestMetrics:
+    """What one request spent its time on."""
+
+    def __init__(self, keep_queries=0):
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.query_count = 0
+        self.sql_time = 0.0
+        self.phases = {}
+        self.keep_queries = keep_queries
+        # Min-heap of (duration, sequence, alias, sql, params, many)
+        self.slowest_queries = []
+        self.sequence = itertools.count()
+
+    def add_query(self, alias, sql, params, many, duration):
+        with self.lock:
+            self.query_count += 1
+            self.sql_time += duration
+            if not self.keep_queries:
+                return
+            entry = (duration, next(self.sequence), alias, sql, params, many)
+            if len(self.slowest_queries) < self.keep_queries:
+                heapq.heappush(self.slowest_queries, entry)
+            elif duration > self.slowest_queries[0][0]:
+                heapq.heapreplace(self.slowest_queries, entry)
+
+    def add_phase(self, name, duration):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + max(duration, 0.0)
+
+    def server_timing(self, total):
+        entries = [f'sql;dur={milliseconds(self.sql_time)};desc="{self.query_count} queries"']
+        entries += [f'{name};dur={milliseconds(duration)}' for name, duration in self.phases.items()]
+        entries.append(f'total;dur={milliseconds(total)}')
+        return ', '.join(entries)
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper timing the queries of the current request."""
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        # executemany() parameters can be huge, or an iterator, so are not kept
+        metrics.add_query(
+            context['connection'].alias, sql, None if many else params, many, time.perf_counter() - started
+        )
+
+
+def install_query_recorder(sender=None, connection=None, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def start_recording_queries():
+    """Record the queries of every connection opened from now on, and of those open here."""
+    connection_created.connect(install_query_recorder, dispatch_uid='crm.performance.install_query_recorder')
+    for connection in connections.all(initialized_only=True):
+        install_query_recorder(connection=connection)
+
+
+@contextmanager
+def timed(phase):
+    """Count the time spent in the block, less its SQL, toward `phase` of the current request."""
+    metrics = current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    sql_before = metrics.sql_time
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_phase(phase, time.perf_counter() - started - (metrics.sql_time - sql_before))
+
+
+def explain(alias, sql, params):
+    """The plan of a SELECT, or None for other statements."""
+    if sql.lstrip()[:6].upper() != 'SELECT':
+        return None
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+    except DatabaseError as e:
+        return f'(EXPLAIN failed: {e})'
+
+
+def log_slow_request(request, response, metrics, total):
+    lines = [
+        f'Slow request: {request.method} {request.path} answered {response.status_code} '
+        f'in {milliseconds(total)} ms, {metrics.query_count} queries took {milliseconds(metrics.sql_time)} ms'
+    ]
+    if metrics.phases:
+        lines.append('  ' + ', '.join(
+            f'{name} {milliseconds(duration)} ms' for name, duration in metrics.phases.items()
+        ))
+    for duration, _, alias, sql, params, many in sorted(metrics.slowest_queries, reverse=True):
+        lines.append(f'  {milliseconds(duration)} ms on {alias}: {sql}{" (executemany)" if many else ""}')
+        plan = explain(alias, sql, params) if settings.PERF_EXPLAIN_SLOW_QUERIES and not many else None
+        if plan:
+            lines.extend(f'    {line}' for line in plan.splitlines())
+    logger.warning('\n'.join(lines))
+
+
+def start_profile(request):
+    """A running profiler if this request to the profiled route was sampled, else None."""
+    match = request.resolver_match
+    if match is None or match.view_name != settings.PERF_PROFILE_ROUTE:
+        return None
+    if random.random() >= settings.PERF_PROFILE_SAMPLE_RATE or not _profile_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except Exception:
+        _profile_lock.release()
+        raise
+    return profiler
+
+
+def finish_profile(request, profiler):
+    try:
+        profiler.disable()
+    finally:
+        _profile_lock.release()
+    os.makedirs(settings.PERF_PROFILE_DIR, exist_ok=True)
+    name = request.resolver_match.view_name.replace(':', '-')
+    path = os.path.join(settings.PERF_PROFILE_DIR, f'{name}-{time.time_ns()}-{os.getpid()}.prof')
+    profiler.dump_stats(path)
+    logger.info('Profiled %s %s to %s', request.method, request.path, path)
@@ -0,0 +1,235 @@
+"""
+Batched delivery of due reminders.
+
+Due reminders are claimed a batch at a time with row locks that skip rows
+another worker already holds, so several workers can drain the backlog in
+parallel without sending the same reminder twice. Each batch is sent over
+one mail connection and marked sent with a single UPDATE before its locks
+are released.
+
+Reminders are dispatched the moment they fall due by the reminder scheduler
+(`manage.py run_reminder_scheduler`). It keeps every pending reminder in a
+heap ordered by due time, sleeps until the earliest one, and learns about
+creates, edits and cancellations from messages published on a Redis channel
+when reminders are saved, so it never rescans the table while running.
+"""
+
+import heapq
+import json
+import logging
+import time
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .cache import bump_version
+from .events import publish_reminders_due
+from .models import Reminder
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_from_email():
+    return getattr(settings, 'DEFAULT_FROM_EMAIL', None) or 'noreply@crm.local'
+
+
+def build_reminder_message(reminder, connection=None):
+    """Email notifying the reminder's user, sent over `connection` if given."""
+    subject = f"Reminder: {reminder.title}"
+    message = f"""
+    Hi {reminder.user.first_name or reminder.user.username},
+
+    This is a reminder for:
+
+    Title: {reminder.title}
+    Lead: {reminder.lead.name} - {reminder.lead.company}
+    Description: {reminder.description}
+
+    Please take appropriate action.
+
+    Best regards,
+    CRM System
+    """
+    return EmailMessage(subject, message, get_from_email(), [reminder.user.email], connection=connection)
+
+
+def due_reminders(now):
+    return Reminder.objects.filter(status='pending', reminder_date__lte=now)
+
+
+def dispatch_batch(now=None, batch_size=None, connection=None, ids=None):
+    """
+    Claim, send and mark sent one batch of due reminders, limited to `ids`
+    if given. Returns the number sent, 0 once nothing is left to claim.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or settings.REMINDER_BATCH_SIZE
+    queryset = due_reminders(now)
+    if ids is not None:
+        queryset = queryset.filter(id__in=ids)
+    with transaction.atomic():
+        reminders = list(
+            queryset
+            .select_for_update(skip_locked=True, of=('self',))
+            .select_related('user', 'lead')
+            .order_by('reminder_date', 'id')[:batch_size]
+        )
+        if not reminders:
+            return 0
+
+        connection = connection or get_connection(fail_silently=True)
+        connection.send_messages([build_reminder_message(reminder) for reminder in reminders])
+
+        # The rows are still locked, so no other worker can have sent them
+        Reminder.objects.filter(id__in=[reminder.id for reminder in reminders]).update(
+            status='sent',
+            updated_at=timezone.now()
+        )
+    bump_version('reminder')
+    publish_reminders_due(reminders)
+    return len(reminders)
+
+
+def dispatch_due_reminders(now=None, batch_size=None, ids=None):
+    """Send due reminders batch by batch until none are left unclaimed."""
+    now = now or timezone.now()
+    total = 0
+    with get_connection(fail_silently=True) as connection:
+        while True:
+            sent = dispatch_batch(now, batch_size, connection, ids)
+            if not sent:
+                break
+            total += sent
+    return total
+
+
+# Scheduler
+
+@lru_cache(maxsize=None)
+def get_redis():
+    return redis.Redis.from_url(settings.REMINDER_SCHEDULER_URL)
+
+
+def publish_reminder_change(reminder_id, reminder_date=None, status=None):
+    """
+    Tell the scheduler a reminder was created, edited or removed.
+    Anything that is not pending is removed from the schedule.
+    """
+    due = reminder_date.isoformat() if reminder_date and status == 'pending' else None
+    message = json.dumps({'id': reminder_id, 'due': due})
+    try:
+        get_redis().publish(settings.REMINDER_SCHEDULER_CHANNEL, message)
+    except redis.RedisError as e:
+        # The scheduler reloads from the database whenever it reconnects
+        logger.warning('Could not publish reminder %s to the scheduler: %s', reminder_id, e)
+
+
+class ReminderScheduler:
+    """
+    Pending reminders ordered by due time.
+    Rescheduled and cancelled reminders leave stale heap entries behind;
+    they are skipped when they reach the top instead of being searched for.
+    """
+    
+    def __init__(self):
+        self._heap = []
+        self._due = {}
+    
+    def __len__(self):
+        return len(self._due)
+    
+    def load(self):
+        """Rebuild the schedule from the (reminder_date, status) index."""
+        pending = (
+            Reminder.objects.filter(status='pending')
+            .order_by('reminder_date')
+            .values_list('id', 'reminder_date')
+        )
+        self._due = dict(pending.iterator(chunk_size=5000))
+        # Rows arrive sorted by due time, and a sorted list is a valid heap
+        self._heap = [(due, reminder_id) for reminder_id, due in self._due.items()]
+    
+    def schedule(self, reminder_id, due):
+        self._due[reminder_id] = due
+        heapq.heappush(self._heap, (due, reminder_id))
+    
+    def cancel(self, reminder_id):
+        self._due.pop(reminder_id, None)
+    
+    def apply(self, message):
+        """Apply a change published by publish_reminder_change()."""
+        data = json.loads(message)
+        due = parse_datetime(data['due']) if data.get('due') else None
+        if due:
+            self.schedule(data['id'], due)
+        else:
+            self.cancel(data['id'])
+    
+    def next_due(self):
+        """Due time of the earliest pending reminder, or None."""
+        while self._heap:
+            due, reminder_id = self._heap[0]
+            if self._due.get(reminder_id) == due:
+                return due
+            heapq.heappop(self._heap)
+        return None
+    
+    def pop_due(self, now):
+        """Remove and return the ids of reminders due at `now`."""
+        ids = []
+        while True:
+            due = self.next_due()
+            if due is None or due > now:
+                return ids
+            _, reminder_id = heapq.heappop(self._heap)
+            del self._due[reminder_id]
+            ids.append(reminder_id)
+
+
+def run_scheduler(dispatch, pubsub=None, max_sleep=None, should_stop=lambda: False):
+    """
+    Dispatch reminders as they fall due until `should_stop()` is true.
+    `dispatch(ids)` is called with the ids of every batch that became due.
+    """
+    max_sleep = max_sleep if max_sleep is not None else settings.REMINDER_SCHEDULER_MAX_SLEEP
+    scheduler = ReminderScheduler()
+    if pubsub is None:
+        pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+    
+    def subscribe_and_load():
+        # Subscribe before loading so changes made during the load are not lost
+        pubsub.subscribe(settings.REMINDER_SCHEDULER_CHANNEL)
+        scheduler.load()
+        logger.info('Reminder scheduler loaded %s pending reminders', len(scheduler))
+    
+    subscribe_and_load()
+    batch_size = settings.REMINDER_BATCH_SIZE
+    while not should_stop():
+        now = timezone.now()
+        ids = scheduler.pop_due(now)
+        for start in range(0, len(ids), batch_size):
+            dispatch(ids[start:start + batch_size])
+        
+        next_due = scheduler.next_due()
+        timeout = max_sleep if next_due is None else min(max(
+            (next_due - timezone.now()).total_seconds(), 0), max_sleep)
+        try:
+            message = pubsub.get_message(timeout=timeout)
+        except redis.ConnectionError as e:
+            logger.warning('Reminder scheduler lost its Redis connection, reloading: %s', e)
+            time.sleep(1)
+            try:
+                subscribe_and_load()
+            except redis.ConnectionError:
+                pass
+            continue
+        while message is not None:
+            if message['type'] == 'message':
+                scheduler.apply(message['data'])
+            message = pubsub.get_message(timeout=0)
@@ -0,0 +1,110 @@
+"""
+JSON rendering and parsing with orjson.
+
+Drop-in replacements for DRF's JSONRenderer and JSONParser, chosen by the
+FAST_JSON setting. orjson encodes strings, numbers, containers, datetimes
+and UUIDs itself, in the same form as DRF's encoder; anything else, such as
+Decimal or lazy translation strings, goes through DRF's encoder hooks, so
+responses are byte-identical to DRF's. The exception is floats below 1e-4
+or of 1e16 and over, which Python writes as `2e-06` and `1e+16` but orjson
+as `0.000002` or `2e-6` and `1e16`; output that may hold one, such as the
+search ranks of SQLite, is rendered again by DRF. Indented output (the
+browsable API, `indent=` in the Accept header), DRF settings orjson cannot
+honour, and data orjson rejects are handled by DRF's own classes, as is
+everything when orjson is not installed.
+"""
+
+import re
+
+from django.conf import settings
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+RENDER_OPTIONS = (orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+UTF8_ENCODINGS = ('utf-8', 'utf8')
+
+# orjson writes floats below 1e-4 or of 1e16 and over differently from
+# Python. They contain one of these; matches in strings only cost a fallback
+SMALL_FLOAT = b'0.0000'
+EXPONENT = re.compile(rb'e-?\d')
+
+
+def has_divergent_float(ret):
+    if SMALL_FLOAT in ret:
+        return True
+    return any(ret[match.start() - 1:match.start()].isdigit() for match in EXPONENT.finditer(ret))
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    """JSONRenderer that encodes with orjson."""
+
+    def __init__(self):
+        self.default = encoders.JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+
+        try:
+            ret = orjson.dumps(data, default=self.default, option=RENDER_OPTIONS)
+        except orjson.JSONEncodeError:
+            # Integers beyond 64 bits, very deep nesting and the like
+            return super().render(data, accepted_media_type, renderer_context)
+        if has_divergent_float(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Escaped like DRF does, so the output stays a strict JavaScript subset
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class ORJSONParser(parsers.JSONParser):
+    """JSONParser that decodes with orjson."""
+
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        # orjson only reads UTF-8 and always rejects NaN and Infinity
+        if orjson is None or not self.strict or encoding.lower() not in UTF8_ENCODINGS:
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class EventStreamRenderer(renderers.BaseRenderer):
+    """
+    Lets views streaming Server-Sent Events pass content negotiation.
+    The stream itself is not rendered; error responses are sent as JSON.
+    """
+
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json_renderer().render(data)
+
+
+def json_renderer():
+    """The JSON renderer FAST_JSON selects, for output built outside a DRF Response."""
+    return ORJSONRenderer() if settings.FAST_JSON else renderers.JSONRenderer()
@@ -0,0 +1,130 @@
+"""
+Read replica routing.
+
+With DB_REPLICA on, GET, HEAD and OPTIONS requests to the views that allow
+it read from the `replica` database; writes and every other read use
+`default`. View classes allow it with `read_replica = True`, function views
+with the `replica_reads` decorator, and an action opts out with
+`@action(..., read_replica=False)`.
+
+The replica lags behind the primary, so reads stay on the primary:
+
+- for REPLICA_STICKY_SECONDS after the user sent a write, so they see it.
+  The middleware marks the response to the write with a signed cookie, so
+  the mark reaches whichever worker process serves the next request;
+- until the request is authenticated, which covers the user lookup;
+- inside transactions;
+- while computing values cached against model versions (crm.cache), which
+  must not be older than the version they are stored under;
+- for the database cache table, which is written on the primary and read
+  back at once for versions, locks and cached values;
+- outside requests, in tasks and management commands.
+"""
+
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.functional import SimpleLazyObject
+
+
+REPLICA = 'replica'
+# The app label of DatabaseCache's table model
+CACHE_APP_LABEL = 'django_cache'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_COOKIE = 'crm_primary'
+STICKY_SALT = 'crm.routers.sticky'
+
+# The request whose reads may go to the replica, while it is handled
+replica_request = contextvars.ContextVar('replica_request', default=None)
+_primary_only = contextvars.ContextVar('primary_only', default=False)
+
+
+def replica_reads(view):
+    """Let a function view read from the replica; apply it above @api_view."""
+    view.read_replica = True
+    return view
+
+
+def allows_replica(view_func):
+    initkwargs = getattr(view_func, 'initkwargs', {})
+    if 'read_replica' in initkwargs:
+        return initkwargs['read_replica']
+    if hasattr(view_func, 'read_replica'):
+        return view_func.read_replica
+    return getattr(getattr(view_func, 'cls', None), 'read_replica', False)
+
+
+def end_replica_request(**kwargs):
+    replica_request.set(None)
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary inside the block."""
+    token = _primary_only.set(True)
+    try:
+        yield
+    finally:
+        _primary_only.reset(token)
+
+
+def authenticated_user(request):
+    """
+    The user DRF authenticated the request as, or None. Until DRF sets it,
+    request.user is the lazy session user, which is not looked up.
+    """
+    user = request.__dict__.get('user')
+    if user is None or isinstance(user, SimpleLazyObject) or not user.is_authenticated:
+        return None
+    return user
+
+
+def stick_to_primary(request, response, user):
+    """Keep `user` reading from the primary for REPLICA_STICKY_SECONDS, through a cookie on `response`."""
+    secure = request.is_secure()
+    response.set_signed_cookie(
+        STICKY_COOKIE, str(user.pk), salt=STICKY_SALT, max_age=settings.REPLICA_STICKY_SECONDS,
+        # A frontend served from another site only sends SameSite=None cookies, which must be secure
+        secure=secure, httponly=True, samesite='None' if secure else 'Lax',
+    )
+
+
+def is_sticky(request, user):
+    if not hasattr(request, '_primary_sticky'):
+        # The signature's timestamp bounds the mark even if the client keeps the cookie
+        marked = request.get_signed_cookie(
+            STICKY_COOKIE, default=None, salt=STICKY_SALT, max_age=settings.REPLICA_STICKY_SECONDS
+        )
+        request._primary_sticky = marked == str(user.pk)
+    return request._primary_sticky
+
+
+class ReplicaRouter:
+    """Send the reads of replica-enabled requests to the replica."""
+
+    def db_for_read(self, model, **hints):
+        request = replica_request.get()
+        if (
+            request is None
+            or model._meta.app_label == CACHE_APP_LABEL
+            or _primary_only.get()
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        user = authenticated_user(request)
+        if user is None or is_sticky(request, user):
+            return DEFAULT_DB_ALIAS
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both databases hold the same rows
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema from the primary
+        return db != REPLICA
@@ -0,0 +1,115 @@
+"""
+Full-text search over leads, contacts, notes and correspondence.
+
+The indexes are created by migration 0007: a generated `search_vector`
+tsvector column with a GIN index on PostgreSQL, and an external-content
+FTS5 table kept in sync by triggers on SQLite. The database maintains both
+on every write, bulk writes included. Other backends fall back to DRF's
+`icontains` search over the view's `search_fields`.
+
+Every search term is matched as a prefix, so "acm" finds "Acme Corp" as
+the old `icontains` search did, and results are ordered by relevance.
+
+SQLite drops triggers along with their table, so a future migration that
+makes Django rebuild one of these tables must recreate the triggers.
+"""
+
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+from django.db import connections
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter, OrderingFilter
+
+from .models import Lead, Contact, Note, Correspondence
+
+
+# model: column weights for SQLite's bm25(), in FTS5 column order
+SEARCH_INDEXES = {
+    Lead: [10.0, 10.0, 4.0, 4.0, 1.0],
+    Contact: [10.0, 4.0, 4.0, 4.0, 1.0],
+    Note: [10.0],
+    Correspondence: [10.0, 1.0],
+}
+
+MAX_SEARCH_TERMS = 16
+
+
+def search_terms(text):
+    return re.findall(r'\w+', text.lower())[:MAX_SEARCH_TERMS]
+
+
+def is_searchable(queryset):
+    vendor = connections[queryset.db].vendor
+    return queryset.model in SEARCH_INDEXES and vendor in ('postgresql', 'sqlite')
+
+
+def full_text_search(queryset, text):
+    """
+    Filter `queryset` to rows matching every term of `text`, annotated with
+    `search_rank` (higher is more relevant). The queryset is not reordered.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField())).none()
+
+    model = queryset.model
+    table = model._meta.db_table
+    if connections[queryset.db].vendor == 'postgresql':
+        vector = RawSQL(f'"{table}"."search_vector"', [], output_field=SearchVectorField())
+        query = SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw', config='english')
+        return queryset.alias(search_vector=vector).filter(search_vector=query).annotate(
+            search_rank=SearchRank(vector, query)
+        )
+
+    fts = f'{table}_fts'
+    match = ' '.join(f'"{term}"*' for term in terms)
+    weights = ', '.join(str(weight) for weight in SEARCH_INDEXES[model])
+    return queryset.filter(
+        pk__in=RawSQL(f'SELECT rowid FROM "{fts}" WHERE "{fts}" MATCH %s', [match])
+    ).annotate(
+        # bm25() scores better matches lower
+        search_rank=RawSQL(
+            f'SELECT -bm25("{fts}", {weights}) FROM "{fts}" '
+            f'WHERE "{fts}" MATCH %s AND rowid = "{table}"."id"',
+            [match],
+            output_field=FloatField()
+        )
+    )
+
+
+def rank_order(queryset):
+    return queryset.order_by('-search_rank', '-pk')
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    `?search=` backed by the full-text indexes, ranked by relevance unless
+    the client asks for an explicit `?ordering=`.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        text = ' '.join(self.get_search_terms(request))
+        if not text or not is_searchable(queryset):
+            return super().filter_queryset(request, queryset, view)
+        return rank_order(full_text_search(queryset, text))
+
+
+class RankedOrderingFilter(OrderingFilter):
+    """
+    OrderingFilter that keeps search results in relevance order by default,
+    and breaks ties on the primary key as keyset pagination does, so page
+    numbers and cursors page through rows in the same order.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(super().get_ordering(request, queryset, view) or [])
+        if ordering and not any(item.lstrip('-') in ('pk', 'id') for item in ordering):
+            ordering.append('-pk' if ordering[-1].startswith('-') else 'pk')
+        return ordering
+
+    def filter_queryset(self, request, queryset, view):
+        if 'search_rank' in queryset.query.annotations and not request.query_params.get(self.ordering_param):
+            return queryset
+        return super().filter_queryset(request, queryset, view)
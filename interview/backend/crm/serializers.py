@@ -1,5 +1,10 @@
+from types import SimpleNamespace
+
+from django.core.exceptions import FieldDoesNotExist
 from rest_framework import serializers
-from .models import Lead, Contact, Note, Reminder, Correspondence, AuditLog
+from .models import Lead, Contact, Note, Reminder, Correspondence, AuditLog, ExportJob, ImportJob, DuplicateCandidate
+from .exports import EXPORT_MODELS, clean_export_filters
+from .imports import get_import_format
 from users.serializers import UserSerializer
 
 
@@ -66,10 +71,13 @@ class LeadSerializer(serializers.ModelSerializer):
 
 
 class LeadListSerializer(serializers.ModelSerializer):
-    """Lightweight serializer for listing leads."""
+    """
+    Lightweight serializer for listing leads.
+    Expects `contacts_count` and `notes_count` to be annotated on the queryset.
+    """
     owner = UserSerializer(read_only=True)
-    contacts_count = serializers.IntegerField(source='contacts.count', read_only=True)
-    notes_count = serializers.IntegerField(source='notes.count', read_only=True)
+    contacts_count = serializers.IntegerField(read_only=True)
+    notes_count = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Lead
@@ -80,6 +88,21 @@ class LeadListSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
+class LeadSyncSerializer(serializers.ModelSerializer):
+    """
+    Lead as sent by the changes feed: only the lead's own columns, so a
+    change to anything rendered here also moves its `updated_at`.
+    """
+    
+    class Meta:
+        model = Lead
+        fields = [
+            'id', 'name', 'company', 'email', 'phone', 'status', 'priority',
+            'source', 'owner', 'estimated_value', 'description', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
+
+
 class AuditLogSerializer(serializers.ModelSerializer):
     """Serializer for AuditLog model."""
     user = UserSerializer(read_only=True)
@@ -89,3 +112,254 @@ class AuditLogSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'action', 'model_name', 'object_id', 'object_repr', 'changes', 'timestamp', 'ip_address']
         read_only_fields = ['id', 'timestamp']
 
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    """Serializer for background export jobs."""
+    progress = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = ExportJob
+        fields = [
+            'id', 'model_name', 'format', 'filters', 'status', 'progress',
+            'total_chunks', 'completed_chunks', 'rows_exported', 'error',
+            'created_at', 'updated_at', 'finished_at'
+        ]
+        read_only_fields = [
+            'id', 'status', 'total_chunks', 'completed_chunks', 'rows_exported',
+            'error', 'created_at', 'updated_at', 'finished_at'
+        ]
+    
+    def validate(self, attrs):
+        filters = attrs.get('filters') or {}
+        if not isinstance(filters, dict):
+            raise serializers.ValidationError({"filters": "Filters must be an object."})
+        allowed = EXPORT_MODELS[attrs['model_name']][1]
+        unknown = sorted(set(filters) - set(allowed))
+        if unknown:
+            raise serializers.ValidationError({
+                "filters": f"Unsupported filters: {', '.join(unknown)}. Allowed: {', '.join(allowed)}."
+            })
+        attrs['filters'], errors = clean_export_filters(attrs['model_name'], filters)
+        if errors:
+            raise serializers.ValidationError({"filters": errors})
+        if attrs.get('format') == 'parquet':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise serializers.ValidationError({"format": "Parquet export requires pyarrow to be installed."})
+        return attrs
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    """Serializer for lead import jobs. The format defaults to the file's extension."""
+    file = serializers.FileField(write_only=True)
+    format = serializers.ChoiceField(choices=ImportJob.FORMAT_CHOICES, required=False)
+    progress = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'file', 'format', 'file_name', 'file_size', 'status', 'progress',
+            'rows_processed', 'rows_imported', 'rows_skipped', 'rows_failed',
+            'errors', 'error', 'created_at', 'updated_at', 'finished_at'
+        ]
+        read_only_fields = [
+            'id', 'file_name', 'file_size', 'status', 'rows_processed', 'rows_imported',
+            'rows_skipped', 'rows_failed', 'errors', 'error', 'created_at', 'updated_at', 'finished_at'
+        ]
+    
+    def validate(self, attrs):
+        attrs.setdefault('format', get_import_format(attrs['file'].name))
+        return attrs
+
+
+class LeadSummarySerializer(serializers.ModelSerializer):
+    """Compact lead representation used in duplicate candidates."""
+    
+    class Meta:
+        model = Lead
+        fields = ['id', 'name', 'company', 'email', 'phone', 'status']
+        read_only_fields = fields
+
+
+class DuplicateCandidateSerializer(serializers.ModelSerializer):
+    """Serializer for duplicate lead candidates."""
+    lead = LeadSummarySerializer(read_only=True)
+    duplicate = LeadSummarySerializer(read_only=True)
+    
+    class Meta:
+        model = DuplicateCandidate
+        fields = ['id', 'lead', 'duplicate', 'score', 'reasons', 'status', 'created_at', 'updated_at']
+        read_only_fields = fields
+
+
+class LeadMergeSerializer(serializers.Serializer):
+    """Leads to merge into the lead the request is made on."""
+    duplicate_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1,
+        max_length=100
+    )
+    
+    def validate_duplicate_ids(self, value):
+        value = sorted(set(value))
+        found = set(Lead.objects.filter(id__in=value).values_list('id', flat=True))
+        missing = [lead_id for lead_id in value if lead_id not in found]
+        if missing:
+            raise serializers.ValidationError(f"Leads not found: {', '.join(map(str, missing))}.")
+        return value
+
+
+
+# Model properties rendered by list serializers, with the columns they read
+ROW_PROPERTY_COLUMNS = {
+    (Reminder, 'is_overdue'): ['status', 'reminder_date'],
+}
+
+# Fields whose to_representation() returns database values unchanged
+ROW_IDENTITY_FIELDS = (
+    serializers.CharField, serializers.IntegerField, serializers.FloatField,
+    serializers.BooleanField, serializers.ChoiceField, serializers.ReadOnlyField,
+)
+
+
+class RowSerializer:
+    """
+    Read-only fast path for list pages, rendering `values()` rows exactly as
+    `serializer_class` renders model instances.
+    
+    The plan is derived from the serializer's own fields: plain and dotted
+    sources become columns, primary key relations read the foreign key
+    column, and nested serializers such as UserSerializer read the related
+    columns through a join and are rendered once per distinct object.
+    Serializers using anything else (method fields, many=True, ...) have no
+    row serializer and keep the regular path.
+    """
+    
+    _cache = {}
+    
+    def __init__(self, fields):
+        # [(name, kind, source, to_representation or None)] in output order:
+        # 'column' reads a column, 'property' calls (getter, {attr: column}),
+        # 'nested' is (foreign key column, RowSerializer) rendered per object
+        self.fields = fields
+    
+    @classmethod
+    def for_serializer(cls, serializer_class):
+        """The row serializer for `serializer_class`, or None if it has none."""
+        if serializer_class not in cls._cache:
+            cls._cache[serializer_class] = cls.build(serializer_class())
+        return cls._cache[serializer_class]
+    
+    @classmethod
+    def build(cls, serializer, prefix=''):
+        model = serializer.Meta.model
+        fields = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.BaseSerializer):
+                relation = cls.relation(model, field.source)
+                if prefix or relation is None or isinstance(field, serializers.ListSerializer):
+                    return None
+                nested = cls.build(field, f'{field.source}__')
+                if nested is None:
+                    return None
+                fields.append((name, 'nested', (relation.name, nested), None))
+            elif isinstance(field, serializers.PrimaryKeyRelatedField):
+                if cls.relation(model, field.source) is None or field.pk_field is not None:
+                    return None
+                fields.append((name, 'column', prefix + field.source, None))
+            elif isinstance(field, (serializers.RelatedField, serializers.ManyRelatedField,
+                                    serializers.SerializerMethodField, serializers.MultipleChoiceField)):
+                return None
+            elif (model, field.source) in ROW_PROPERTY_COLUMNS:
+                getter = getattr(model, field.source).fget
+                columns = {attr: prefix + attr for attr in ROW_PROPERTY_COLUMNS[(model, field.source)]}
+                fields.append((name, 'property', (getter, columns), cls.converter(field)))
+            else:
+                column = cls.column(model, field.source_attrs)
+                if column is None:
+                    return None
+                fields.append((name, 'column', prefix + column, cls.converter(field)))
+        return cls(fields)
+    
+    @staticmethod
+    def converter(field):
+        if isinstance(field, ROW_IDENTITY_FIELDS):
+            return None
+        if isinstance(field, serializers.JSONField) and not field.binary:
+            return None
+        return field.to_representation
+    
+    @staticmethod
+    def relation(model, name):
+        """The forward foreign key `name` of `model`, if it is one."""
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        return field if field.many_to_one and field.concrete else None
+    
+    @classmethod
+    def column(cls, model, source_attrs):
+        """The values() column for a dotted source, or None if it has none."""
+        *path, name = source_attrs
+        current = model
+        for attr in path:
+            relation = cls.relation(current, attr)
+            # DRF leaves out fields behind a missing object, values() gives None
+            if relation is None or relation.null:
+                return None
+            current = relation.related_model
+        try:
+            field = current._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Properties need ROW_PROPERTY_COLUMNS; anything else must be an
+            # annotation, which values() checks when the query is built
+            return None if path or hasattr(current, name) else name
+        return None if field.is_relation else '__'.join(source_attrs)
+    
+    def columns(self):
+        columns = []
+        for name, kind, source, _ in self.fields:
+            if kind == 'nested':
+                fk, nested = source
+                columns.append(fk)
+                columns.extend(nested.columns())
+            elif kind == 'property':
+                columns.extend(source[1].values())
+            else:
+                columns.append(source)
+        return list(dict.fromkeys(columns))
+    
+    def values(self, queryset, extra_columns=()):
+        """`queryset` as rows holding every column this serializer reads."""
+        return queryset.values(*dict.fromkeys([*self.columns(), *extra_columns]))
+    
+    def serialize(self, rows):
+        rendered = {}
+        return [self.to_representation(row, rendered) for row in rows]
+    
+    def to_representation(self, row, rendered):
+        data = {}
+        for name, kind, source, to_representation in self.fields:
+            if kind == 'nested':
+                fk, nested = source
+                pk = row[fk]
+                if pk is None:
+                    data[name] = None
+                    continue
+                # Each distinct related object is rendered once per response
+                key = (name, pk)
+                if key not in rendered:
+                    rendered[key] = nested.to_representation(row, rendered)
+                data[name] = rendered[key]
+                continue
+            if kind == 'property':
+                getter, columns = source
+                value = getter(SimpleNamespace(**{attr: row[column] for attr, column in columns.items()}))
+            else:
+                value = row[source]
+            data[name] = value if value is None or to_representation is None else to_representation(value)
+        return data
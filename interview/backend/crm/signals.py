@@ -0,0 +1,103 @@
+import contextvars
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .analytics import mark_days_dirty, to_day
+from .cache import bump_version_on_commit
+from .reminders import publish_reminder_change
+from .models import Lead, Contact, Note, Reminder, Correspondence, AuditLog, Tombstone
+
+
+# Models with a cache version, which dashboards and ETags are keyed on
+CACHED_MODELS = (Lead, Contact, Note, Reminder, Correspondence, AuditLog)
+
+# Models with a changes feed, whose deletions are kept as tombstones
+TOMBSTONE_MODELS = (Lead, Contact)
+
+# Tombstones of the rows deleted inside collect_tombstones()
+pending_tombstones = contextvars.ContextVar('pending_tombstones', default=None)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_cached_stats(sender, **kwargs):
+    """Bump the version of any cached model that was written, once committed."""
+    if sender in CACHED_MODELS:
+        bump_version_on_commit(sender._meta.model_name)
+
+
+def bulk_saved(model, instances):
+    """
+    Do what the post_save receivers here would have done, for bulk_create
+    and bulk_update, which do not send post_save.
+    """
+    if model in CACHED_MODELS:
+        bump_version_on_commit(model._meta.model_name)
+    if model is Lead:
+        mark_days_dirty('leads', [to_day(instance.created_at) for instance in instances if instance.created_at])
+    if model is Reminder:
+        for instance in instances:
+            reschedule_reminder(Reminder, instance, signal=post_save)
+
+
+@receiver(post_delete)
+def record_tombstone(sender, instance, **kwargs):
+    """
+    Remember deleted rows for the changes feeds. Queryset deletes and
+    cascades send post_delete for every row, so they are covered too.
+    """
+    if sender in TOMBSTONE_MODELS:
+        tombstone = Tombstone(model_name=sender._meta.model_name, object_id=instance.pk)
+        pending = pending_tombstones.get()
+        if pending is None:
+            tombstone.save()
+        else:
+            pending.append(tombstone)
+
+
+@contextmanager
+def collect_tombstones():
+    """
+    Write the tombstones of the rows deleted in the block with one
+    bulk_create when it exits, rather than one INSERT per row. Use it
+    inside the transaction of the deletes, so both commit together.
+    """
+    pending = []
+    token = pending_tombstones.set(pending)
+    try:
+        yield
+    finally:
+        pending_tombstones.reset(token)
+    Tombstone.objects.bulk_create(pending, batch_size=500)
+
+
+@receiver(post_save, sender=Lead)
+@receiver(post_delete, sender=Lead)
+def mark_lead_rollup_dirty(sender, instance, **kwargs):
+    """A lead write changes the rollup of the day it was created."""
+    if instance.created_at:
+        mark_days_dirty('leads', [to_day(instance.created_at)])
+
+
+@receiver(post_save, sender=AuditLog)
+def mark_conversion_rollup_dirty(sender, instance, created, **kwargs):
+    """Status changes on leads feed the conversion rollup."""
+    if created and instance.model_name == 'Lead' and 'status' in (instance.changes or {}):
+        mark_days_dirty('conversions', [to_day(instance.timestamp)])
+
+
+@receiver(post_save, sender=Reminder)
+@receiver(post_delete, sender=Reminder)
+def reschedule_reminder(sender, instance, **kwargs):
+    """Let the reminder scheduler know once the change is committed."""
+    reminder_id = instance.id
+    if kwargs['signal'] is post_delete:
+        reminder_date, status = None, None
+    else:
+        # The instance may still hold the raw value it was assigned, e.g. a string
+        reminder_date = sender._meta.get_field('reminder_date').to_python(instance.reminder_date)
+        status = instance.status
+    transaction.on_commit(lambda: publish_reminder_change(reminder_id, reminder_date, status))
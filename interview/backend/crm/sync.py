@@ -0,0 +1,204 @@
+"""
+Incremental changes feeds for offline and mobile clients.
+
+`GET /api/<resource>/changes/?updated_since=<cursor>` streams NDJSON: an
+`upsert` line for every row created or updated since the cursor, a
+`delete` line for every row deleted since, and a last `cursor` line holding
+the cursor for the next sync. Without `updated_since` every row is sent, so
+the first sync downloads the table and later ones only what changed.
+
+Rows are read in (updated_at, id) order and tombstones in (deleted_at, id)
+order, both through indexes, at most SYNC_PAGE_SIZE of each per response;
+the cursor line says whether more are waiting. Writes from the last
+SYNC_SETTLE_SECONDS are left for the next sync, so a transaction that
+commits after rows with a later `updated_at` were sent is not skipped.
+Tombstones are purged after SYNC_TOMBSTONE_RETENTION_DAYS, and cursors that
+old are answered with 410 Gone: the client starts again with a full sync.
+"""
+
+import base64
+import json
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, ValidationError
+
+from .models import Tombstone
+from .renderers import json_renderer
+from .serializers import RowSerializer
+
+
+# Rows read from the database and rendered at a time while streaming
+SYNC_CHUNK_SIZE = 1000
+
+
+class CursorExpired(APIException):
+    status_code = 410
+    default_detail = 'The sync cursor has expired. Sync again without updated_since.'
+    default_code = 'cursor_expired'
+
+
+def parse_timestamp(value):
+    timestamp = parse_datetime(value)
+    if timestamp is None:
+        raise ValueError(value)
+    return timestamp
+
+
+def encode_sync_cursor(checked_at, row_position, tombstone_position):
+    """
+    Cursor for the next sync: when this one read up to, and the
+    (timestamp, id) of the last row and tombstone sent.
+    """
+    def position(value):
+        return None if value is None else [value[0].isoformat(), value[1]]
+
+    data = {'t': checked_at.isoformat(), 'u': position(row_position), 'd': position(tombstone_position)}
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def decode_sync_cursor(encoded):
+    """Return (checked_at, row position, tombstone position) of a cursor."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+        positions = [
+            None if data[key] is None else (parse_timestamp(data[key][0]), int(data[key][1]))
+            for key in ('u', 'd')
+        ]
+        return parse_timestamp(data['t']), *positions
+    except (TypeError, ValueError, KeyError, IndexError):
+        raise ValidationError({'updated_since': ['Invalid cursor.']})
+
+
+def after(field, position):
+    """Rows after (timestamp, id) in (field, id) order."""
+    timestamp, pk = position
+    return Q(**{f'{field}__gt': timestamp}) | Q(**{field: timestamp, 'id__gt': pk})
+
+
+def iter_chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def purge_tombstones(batch_size=10000):
+    """Delete tombstones older than any cursor still accepted. Returns the count."""
+    horizon = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+    purged = 0
+    while True:
+        ids = list(Tombstone.objects.filter(deleted_at__lt=horizon).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return purged
+        purged += Tombstone.objects.filter(id__in=ids).delete()[0]
+
+
+class ChangesFeedMixin:
+    """
+    `changes` list action streaming the rows of `get_queryset()` changed
+    since a cursor, rendered with `sync_serializer_class`, and the rows
+    deleted since. Filters are not applied: a row leaving a filter would
+    never be reported as removed.
+    """
+
+    sync_serializer_class = None
+    # Views that read from the replica still answer this action from the
+    # primary: rows a lagging replica had not received yet when the cursor
+    # moved past them would never be sent
+    read_replica = False
+
+    @action(detail=False, methods=['get'], read_replica=False)
+    def changes(self, request):
+        """Rows created, updated and deleted since `updated_since`, as NDJSON."""
+        now = timezone.now()
+        checked_at = now - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+        limit = self.get_sync_limit(request)
+        tombstones = Tombstone.objects.filter(
+            model_name=self.get_queryset().model._meta.model_name,
+            deleted_at__lte=checked_at,
+        )
+
+        encoded = request.query_params.get('updated_since')
+        if encoded:
+            since, row_position, tombstone_position = decode_sync_cursor(encoded)
+            if since < now - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS):
+                raise CursorExpired()
+        else:
+            # A full sync only needs the deletions that happen from now on
+            row_position = None
+            tombstone_position = tombstones.order_by('-deleted_at', '-id').values_list('deleted_at', 'id').first()
+
+        lines = self.sync_lines(checked_at, limit, row_position, tombstones, tombstone_position)
+        response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def get_sync_limit(self, request):
+        limit = request.query_params.get('limit')
+        if limit is None:
+            return settings.SYNC_PAGE_SIZE
+        try:
+            limit = int(limit)
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            raise ValidationError({'limit': ['A positive integer is required.']})
+        return min(limit, settings.SYNC_PAGE_SIZE)
+
+    def sync_lines(self, checked_at, limit, row_position, tombstones, tombstone_position):
+        render = json_renderer().render
+        # Rendered like the serializers render updated_at
+        timestamp = serializers.DateTimeField()
+        more = False
+
+        rows = self.get_queryset().filter(updated_at__lte=checked_at)
+        if row_position is not None:
+            rows = rows.filter(after('updated_at', row_position))
+        rows = rows.order_by('updated_at', 'id')
+        row_serializer = RowSerializer.for_serializer(self.sync_serializer_class)
+        if row_serializer is not None:
+            rows = row_serializer.values(rows, ['updated_at', 'id'])
+
+        sent = 0
+        for chunk in iter_chunks(rows[:limit + 1].iterator(chunk_size=SYNC_CHUNK_SIZE), SYNC_CHUNK_SIZE):
+            if sent + len(chunk) > limit:
+                chunk = chunk[:limit - sent]
+                more = True
+            if not chunk:
+                break
+            sent += len(chunk)
+            if row_serializer is not None:
+                data = row_serializer.serialize(chunk)
+                last = chunk[-1]
+                row_position = (last['updated_at'], last['id'])
+            else:
+                data = self.sync_serializer_class(chunk, many=True).data
+                row_position = (chunk[-1].updated_at, chunk[-1].id)
+            yield b''.join(render({'op': 'upsert', 'data': item}) + b'\n' for item in data)
+
+        if tombstone_position is not None:
+            tombstones = tombstones.filter(after('deleted_at', tombstone_position))
+        deleted = tombstones.order_by('deleted_at', 'id').values_list('deleted_at', 'id', 'object_id')
+        deleted = list(deleted[:limit + 1])
+        if len(deleted) > limit:
+            deleted = deleted[:limit]
+            more = True
+        if deleted:
+            tombstone_position = deleted[-1][:2]
+            yield b''.join(
+                render({'op': 'delete', 'id': object_id, 'deleted_at': timestamp.to_representation(deleted_at)}) + b'\n'
+                for deleted_at, _, object_id in deleted
+            )
+
+        cursor = encode_sync_cursor(checked_at, row_position, tombstone_position)
+        yield render({'op': 'cursor', 'cursor': cursor, 'more': more}) + b'\n'
@@ -1,68 +1,60 @@
 from celery import shared_task
 from django.utils import timezone
-from django.core.mail import send_mail
 from django.conf import settings
-from .models import Reminder
+from django.db.models import F, Q, Sum
+from .models import Reminder, ExportJob, ExportChunk, ImportJob
+from .exports import plan_chunks, write_chunk, assemble_output, stalled_since
+from .analytics import update_rollups, rebuild_rollups
+from .duplicates import find_all_duplicates
+from .events import publish_stats_deltas
+from .imports import run_import_job
+from .sync import purge_tombstones
+from .reminders import build_reminder_message, due_reminders, dispatch_due_reminders, publish_reminder_change
+from .utils import write_audit_entries, deserialize_audit_entry
 
 
 @shared_task
 def check_reminders():
     """
-    Celery task to check for due reminders and send notifications.
-    This task runs periodically to check for reminders that need to be sent.
+    Safety sweep for due reminders the scheduler did not dispatch, e.g. ones
+    saved while Redis was unreachable. Fans the due reminders out to up to
+    REMINDER_DISPATCH_WORKERS dispatch tasks, which claim them in batches.
     """
-    now = timezone.now()
-    
-    # Get all pending reminders that are due
-    due_reminders = Reminder.objects.filter(
-        status='pending',
-        reminder_date__lte=now
-    ).select_related('user', 'lead')
-    
-    count = 0
-    for reminder in due_reminders:
-        # Send notification (in a real app, this would send an email or push notification)
-        send_reminder_notification(reminder)
-        
-        # Update reminder status
-        reminder.status = 'sent'
-        reminder.save()
-        count += 1
+    due = due_reminders(timezone.now()).count()
+    if not due:
+        return "Processed 0 reminders"
     
+    batches = -(-due // settings.REMINDER_BATCH_SIZE)
+    workers = min(batches, settings.REMINDER_DISPATCH_WORKERS)
+    for _ in range(workers):
+        dispatch_reminders.delay()
+    return f"Dispatched {due} reminders to {workers} workers"
+
+
+@shared_task
+def dispatch_reminders(reminder_ids=None):
+    """
+    Send due reminders in batches until none are left to claim, limited to
+    `reminder_ids` when the scheduler hands over the ones that just fell due.
+    Several of these can run at once; locked rows are skipped, not waited on.
+    """
+    count = dispatch_due_reminders(ids=reminder_ids)
     return f"Processed {count} reminders"
 
 
 @shared_task
-def send_reminder_notification(reminder):
+def send_reminder_notification(reminder_id):
     """
     Send a reminder notification to the user.
     In a real application, this would send an email or push notification.
     """
-    subject = f"Reminder: {reminder.title}"
-    message = f"""
-    Hi {reminder.user.first_name or reminder.user.username},
-    
-    This is a reminder for:
-    
-    Title: {reminder.title}
-    Lead: {reminder.lead.name} - {reminder.lead.company}
-    Description: {reminder.description}
-    
-    Please take appropriate action.
-    
-    Best regards,
-    CRM System
-    """
+    try:
+        reminder = Reminder.objects.select_related('user', 'lead').get(id=reminder_id)
+    except Reminder.DoesNotExist:
+        return False
     
     try:
-        # In production, configure email settings in settings.py
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL if hasattr(settings, 'DEFAULT_FROM_EMAIL') else 'noreply@crm.local',
-            [reminder.user.email],
-            fail_silently=True,
-        )
+        build_reminder_message(reminder).send(fail_silently=True)
         return True
     except Exception as e:
         print(f"Error sending reminder notification: {e}")
@@ -73,25 +65,199 @@ def send_reminder_notification(reminder):
 def schedule_reminder(reminder_id):
     """
     Task to schedule a reminder notification.
-    This can be called when a reminder is created to schedule it.
+    Hands the reminder to the reminder scheduler, or sends it now if it is
+    already due. Saving a reminder schedules it automatically; this is for
+    reminders written without going through the ORM.
     """
     try:
         reminder = Reminder.objects.get(id=reminder_id)
-        
-        # Calculate delay until reminder time
-        now = timezone.now()
-        if reminder.reminder_date > now:
-            delay = (reminder.reminder_date - now).total_seconds()
-            # Schedule the notification
-            send_reminder_notification.apply_async((reminder,), countdown=delay)
-            return f"Scheduled reminder {reminder_id} for {reminder.reminder_date}"
-        else:
-            # Reminder is already due, send immediately
-            send_reminder_notification(reminder)
-            reminder.status = 'sent'
-            reminder.save()
-            return f"Sent overdue reminder {reminder_id}"
     except Reminder.DoesNotExist:
         return f"Reminder {reminder_id} not found"
+    
+    if reminder.status == 'pending' and reminder.reminder_date <= timezone.now():
+        # Reminder is already due, send immediately
+        dispatch_due_reminders(ids=[reminder_id])
+        return f"Sent overdue reminder {reminder_id}"
+    
+    publish_reminder_change(reminder.id, reminder.reminder_date, reminder.status)
+    return f"Scheduled reminder {reminder_id} for {reminder.reminder_date}"
+
+
+@shared_task
+def start_export_job(job_id):
+    """
+    Plan an export job into primary-key chunks and dispatch one task per
+    chunk that has not finished yet and is not being written. Calling it
+    again on an interrupted job resumes it from the chunks already written.
+    """
+    try:
+        job = ExportJob.objects.get(id=job_id)
+    except ExportJob.DoesNotExist:
+        return f"Export job {job_id} not found"
+    
+    if job.status == 'completed':
+        return f"Export job {job_id} already completed"
+    
+    if not job.chunks.exists():
+        try:
+            ranges = plan_chunks(job)
+        except Exception as e:
+            ExportJob.objects.filter(id=job_id).update(status='failed', error=str(e), updated_at=timezone.now())
+            raise
+        ExportChunk.objects.bulk_create([
+            ExportChunk(job=job, index=index, start_pk=start, end_pk=end)
+            for index, (start, end) in enumerate(ranges)
+        ], ignore_conflicts=True)
+    
+    # Recompute progress from the chunks already finished
+    ExportJob.objects.filter(id=job_id).update(
+        status='running',
+        error='',
+        total_chunks=job.chunks.count(),
+        completed_chunks=job.chunks.filter(status='done').count(),
+        rows_exported=job.chunks.filter(status='done').aggregate(rows=Sum('rows'))['rows'] or 0,
+        updated_at=timezone.now(),
+    )
+    
+    pending = list(
+        job.chunks.filter(Q(status='pending') | Q(status='running', claimed_at__lt=stalled_since()))
+        .values_list('id', flat=True)
+    )
+    for chunk_id in pending:
+        export_chunk.delay(chunk_id)
+    if not pending:
+        finalize_if_complete(job_id)
+    return f"Dispatched {len(pending)} chunks for export job {job_id}"
+
+
+@shared_task(acks_late=True)
+def export_chunk(chunk_id):
+    """
+    Write one chunk of an export job to its part file. The chunk is claimed
+    first, so duplicate or redelivered tasks skip it while it is written.
+    """
+    claimed_at = timezone.now()
+    claimed = ExportChunk.objects.filter(
+        Q(status='pending') | Q(status='running', claimed_at__lt=stalled_since()),
+        id=chunk_id,
+    ).update(status='running', claimed_at=claimed_at)
+    if not claimed:
+        return f"Export chunk {chunk_id} not found, done or being written"
+    
+    chunk = ExportChunk.objects.select_related('job').get(id=chunk_id)
+    claim = ExportChunk.objects.filter(id=chunk_id, status='running', claimed_at=claimed_at)
+    # The job shows progress while its chunks are written, so it does not look stalled
+    ExportJob.objects.filter(id=chunk.job_id).update(updated_at=claimed_at)
+    try:
+        rows = write_chunk(chunk.job, chunk)
+    except Exception as e:
+        claim.update(status='pending', claimed_at=None)
+        ExportJob.objects.filter(id=chunk.job_id).update(status='failed', error=str(e), updated_at=timezone.now())
+        raise
+    
+    # Only counted if the claim was not taken over meanwhile
+    if claim.update(status='done', rows=rows):
+        ExportJob.objects.filter(id=chunk.job_id).update(
+            completed_chunks=F('completed_chunks') + 1,
+            rows_exported=F('rows_exported') + rows,
+            updated_at=timezone.now(),
+        )
+    finalize_if_complete(chunk.job_id)
+    return f"Exported {rows} rows for chunk {chunk_id}"
 
 
+def finalize_if_complete(job_id):
+    """Hand the job to finalize_export_job once, when its last chunk is done."""
+    claimed = ExportJob.objects.filter(
+        id=job_id,
+        status='running',
+        completed_chunks=F('total_chunks'),
+    ).update(status='finalizing', updated_at=timezone.now())
+    if claimed:
+        finalize_export_job.delay(job_id)
+
+
+@shared_task
+def finalize_export_job(job_id):
+    """Concatenate the part files of a finished job into the download file."""
+    job = ExportJob.objects.get(id=job_id)
+    try:
+        output = assemble_output(job, job.total_chunks)
+    except Exception as e:
+        ExportJob.objects.filter(id=job_id).update(status='failed', error=str(e), updated_at=timezone.now())
+        raise
+    
+    ExportJob.objects.filter(id=job_id).update(
+        status='completed',
+        file_path=str(output.relative_to(settings.EXPORT_ROOT)),
+        finished_at=timezone.now(),
+        updated_at=timezone.now(),
+    )
+    return f"Export job {job_id} completed"
+
+
+@shared_task
+def import_leads(job_id):
+    """Import the uploaded file of an import job, reporting progress per chunk."""
+    try:
+        job = ImportJob.objects.select_related('user').get(id=job_id)
+    except ImportJob.DoesNotExist:
+        return f"Import job {job_id} not found"
+    
+    if job.status == 'completed':
+        return f"Import job {job_id} already completed"
+    
+    importer = run_import_job(job)
+    return f"Imported {importer.rows_imported} of {importer.rows_processed} rows for import job {job_id}"
+
+
+@shared_task
+def update_analytics_rollups(rebuild=False):
+    """
+    Recompute the daily analytics rollups for days touched since the last run.
+    Pass rebuild=True to recompute every day, e.g. after loading existing data.
+    """
+    if rebuild:
+        rebuild_rollups()
+    count = update_rollups()
+    return f"Recomputed {count} rollup days"
+
+
+@shared_task
+def write_audit_logs(entries):
+    """
+    Write a batch of audit entries queued by flush_audit_entries.
+    Entries arrive as plain dicts so they survive the JSON serializer.
+    """
+    write_audit_entries([deserialize_audit_entry(entry) for entry in entries])
+    return f"Wrote {len(entries)} audit entries"
+
+
+@shared_task
+def find_duplicate_leads():
+    """
+    Nightly task that compares leads within each blocking-key group and
+    refreshes the open duplicate candidates.
+    """
+    count = find_all_duplicates()
+    return f"Found {count} duplicate lead candidates"
+
+
+@shared_task
+def purge_sync_tombstones():
+    """
+    Nightly task deleting tombstones of rows deleted longer ago than the
+    changes feeds accept cursors for.
+    """
+    count = purge_tombstones()
+    return f"Purged {count} tombstones"
+
+
+@shared_task
+def push_dashboard_stats():
+    """
+    Push changes of the global dashboard counters to live dashboards.
+    Runs every few seconds; the statistics are only recomputed after writes.
+    """
+    deltas = publish_stats_deltas()
+    return f"Pushed {len(deltas)} changed counters"
@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from crm.analytics import to_day
+from crm.models import Lead, RollupDirtyDay
+
+
+User = get_user_model()
+
+
+class DirtyDayTests(TestCase):
+    """Writes mark each rollup day they affect once, however many rows they touch."""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('agent', password='secret')
+        Lead.objects.bulk_create([Lead(name=f'Lead {i}', company='Acme', owner=owner) for i in range(30)])
+        now = timezone.now()
+        Lead.objects.filter(id__in=Lead.objects.order_by('id').values('id')[:10]).update(
+            created_at=now - timedelta(days=3)
+        )
+        cls.days = {to_day(now), to_day(now - timedelta(days=3))}
+
+    def test_bulk_delete_marks_each_day_once(self):
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            Lead.objects.all().delete()
+        inserts = [query for query in queries if 'crm_rollupdirtyday' in query['sql']]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(set(RollupDirtyDay.objects.values_list('day', flat=True)), self.days)
+
+    def test_rolled_back_marks_are_not_written(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                Lead.objects.filter(created_at__date__lt=min(self.days) + timedelta(days=1)).delete()
+                raise RuntimeError
+            Lead.objects.filter(created_at__date=max(self.days)).first().save()
+        self.assertEqual(list(RollupDirtyDay.objects.values_list('day', flat=True)), [max(self.days)])
@@ -0,0 +1,75 @@
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.test import APIClient
+
+from crm import audit_archive
+from crm.audit_archive import add_months, archive_expired, month_start, period_bounds
+from crm.models import AuditLog
+
+
+User = get_user_model()
+
+
+class ArchivedListTests(TestCase):
+    """The audit log list only opens the archives its date range and page reach."""
+
+    def setUp(self):
+        self.enterContext(override_settings(AUDIT_ARCHIVE_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        self.user = User.objects.create_user('manager', password='secret', role='manager')
+        current = month_start(timezone.now())
+        self.months = [add_months(current, -offset) for offset in (16, 15, 14)]
+        for period_start in self.months:
+            start = period_bounds(period_start)[0]
+            AuditLog.objects.bulk_create([
+                AuditLog(user=self.user, action='update', model_name='Lead', object_id=i,
+                         object_repr=f'Lead {i}', timestamp=start + timedelta(hours=i + 1))
+                for i in range(30)
+            ])
+        AuditLog.objects.bulk_create([
+            AuditLog(user=self.user, action='create', model_name='Lead', object_id=i, object_repr=f'Lead {i}')
+            for i in range(2)
+        ])
+        archive_expired(retention_months=12)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.opened = []
+        iter_archive = audit_archive.iter_archive
+        self.enterContext(mock.patch.object(
+            audit_archive, 'iter_archive',
+            lambda archive: self.opened.append(archive.period_start) or iter_archive(archive)
+        ))
+
+    def test_first_page_opens_newest_archive_only(self):
+        response = self.client.get('/api/audit-logs/', {'include_archived': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 92)
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(self.opened, [self.months[2]])
+
+    def test_date_range_skips_archives_outside_it(self):
+        start = period_bounds(self.months[1])[0]
+        response = self.client.get('/api/audit-logs/', {
+            'include_archived': 'true',
+            'timestamp__gte': start.isoformat(),
+            'timestamp__lt': (start + timedelta(hours=10, minutes=30)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 10)
+        self.assertEqual(parse_datetime(response.data['results'][0]['timestamp']), start + timedelta(hours=10))
+        self.assertEqual(set(self.opened), {self.months[1]})
+
+    def test_oldest_first_opens_oldest_archive_only(self):
+        response = self.client.get('/api/audit-logs/', {'include_archived': 'true', 'ordering': 'timestamp'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 92)
+        self.assertEqual(
+            parse_datetime(response.data['results'][0]['timestamp']),
+            period_bounds(self.months[0])[0] + timedelta(hours=1)
+        )
+        self.assertEqual(self.opened, [self.months[0]])
@@ -0,0 +1,114 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from crm.models import AuditLog, Contact, Lead
+
+
+User = get_user_model()
+
+
+class BulkEndpointTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent = User.objects.create_user('agent', password='secret', role='agent')
+        cls.manager = User.objects.create_user('manager', password='secret', role='manager')
+        cls.leads = Lead.objects.bulk_create([
+            Lead(name=f'Lead {i}', email=f'lead{i}@example.com', owner=cls.agent) for i in range(3)
+        ])
+
+    def setUp(self):
+        # Live events are not under test
+        self.enterContext(mock.patch('crm.utils.publish_audit_entries'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.agent)
+
+    def test_create_reports_invalid_rows_with_207(self):
+        # Audit entries are written once the transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/leads/bulk/', [
+                {'name': 'First', 'email': 'first@example.com'},
+                {'name': 'Bad', 'email': 'not an email'},
+                {'name': 'Second', 'email': 'second@example.com', 'status': 'qualified'},
+            ], format='json')
+        self.assertEqual(response.status_code, 207)
+        created = Lead.objects.filter(email__in=['first@example.com', 'second@example.com'])
+        self.assertEqual(
+            response.data['results'],
+            [{'index': 0, 'id': created.get(name='First').id}, {'index': 2, 'id': created.get(name='Second').id}],
+        )
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+        self.assertIn('email', response.data['errors'][0]['errors'])
+        self.assertEqual(set(created.values_list('owner', flat=True)), {self.agent.id})
+        self.assertEqual(AuditLog.objects.filter(action='create', model_name='Lead').count(), 2)
+
+    def test_atomic_create_writes_nothing_if_a_row_is_invalid(self):
+        response = self.client.post('/api/leads/bulk/?atomic=true', [
+            {'name': 'First', 'email': 'first@example.com'},
+            {'email': 'nameless@example.com'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['results'], [])
+        self.assertEqual(response.data['errors'][0]['index'], 1)
+        self.assertIn('name', response.data['errors'][0]['errors'])
+        self.assertFalse(Lead.objects.filter(email='first@example.com').exists())
+
+    def test_update_reports_missing_ids_per_row(self):
+        first, second, _ = self.leads
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch('/api/leads/bulk/', [
+                {'id': first.id, 'status': 'contacted'},
+                {'id': 0, 'status': 'contacted'},
+                {'id': 'abc', 'status': 'contacted'},
+                {'id': second.id, 'priority': 'urgent'},
+            ], format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data['results'], [{'index': 0, 'id': first.id}])
+        self.assertEqual(response.data['errors'], [
+            {'index': 1, 'errors': {'id': ['Not found.']}},
+            {'index': 2, 'errors': {'id': ['A valid integer is required.']}},
+            {'index': 3, 'errors': {'priority': ['"urgent" is not a valid choice.']}},
+        ])
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'contacted')
+        log = AuditLog.objects.get(action='update', object_id=first.id)
+        self.assertEqual(log.changes, {'status': {'old': 'new', 'new': 'contacted'}})
+
+    def test_atomic_update_writes_nothing_if_an_id_is_missing(self):
+        response = self.client.patch('/api/leads/bulk/?atomic=1', [
+            {'id': self.leads[0].id, 'status': 'contacted'},
+            {'id': 0, 'status': 'contacted'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Lead.objects.filter(status='contacted').exists())
+
+    def test_agents_cannot_bulk_delete(self):
+        response = self.client.delete('/api/leads/bulk/', {'ids': [self.leads[0].id]}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Lead.objects.count(), 3)
+
+    def test_managers_bulk_delete_with_per_row_errors(self):
+        self.client.force_authenticate(self.manager)
+        first, second, third = self.leads
+        Contact.objects.create(lead=first, name='Contact', email='contact@example.com')
+        response = self.client.delete('/api/leads/bulk/', {'ids': [first.id, 0, second.id]}, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data['results'], [{'index': 0, 'id': first.id}, {'index': 2, 'id': second.id}])
+        self.assertEqual(response.data['errors'], [{'index': 1, 'errors': {'id': ['Not found.']}}])
+        self.assertQuerysetEqual(Lead.objects.all(), [third])
+        self.assertFalse(Contact.objects.exists())
+
+        response = self.client.delete('/api/leads/bulk/?atomic=true', {'ids': [third.id, first.id]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(Lead.objects.filter(id=third.id).exists())
+
+    @override_settings(BULK_MAX_ROWS=2)
+    def test_request_must_be_a_short_nonempty_list(self):
+        for body in ([], {'name': 'Lead'}, [{}, {}, {}]):
+            with self.subTest(body=body):
+                response = self.client.post('/api/contacts/bulk/', body, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('detail', response.data)
@@ -0,0 +1,50 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import TestCase
+
+from crm import cache as crm_cache
+from crm.dashboard import get_dashboard_stats
+from crm.models import Lead
+
+
+User = get_user_model()
+
+
+class SharedVersionTests(TestCase):
+    """
+    Versions bumped through one cache client, as by another worker process
+    or a Celery task, are seen through every other client.
+    """
+
+    def setUp(self):
+        # Each client is a separate backend instance, like the one of another process
+        self.worker = caches.create_connection('default')
+        self.other_worker = caches.create_connection('default')
+
+    def test_default_cache_is_shared_between_processes(self):
+        # Local-memory caches of one process share their store, so the
+        # clients below would agree without it being shared at all
+        self.assertNotIsInstance(self.worker, LocMemCache)
+
+    def test_bump_seen_by_other_client(self):
+        with mock.patch.object(crm_cache, 'cache', self.worker):
+            before = crm_cache.get_version('lead')
+        with mock.patch.object(crm_cache, 'cache', self.other_worker):
+            self.assertEqual(crm_cache.get_version('lead'), before)
+            crm_cache.bump_version('lead')
+        with mock.patch.object(crm_cache, 'cache', self.worker):
+            self.assertNotEqual(crm_cache.get_version('lead'), before)
+
+    def test_dashboard_recomputed_after_write_in_other_process(self):
+        user = User.objects.create_user('agent', password='secret')
+        with mock.patch.object(crm_cache, 'cache', self.worker):
+            self.assertEqual(get_dashboard_stats(user)['total_leads'], 0)
+        # Written without signals, then invalidated from another client
+        Lead.objects.bulk_create([Lead(name='Lead', owner=user)])
+        with mock.patch.object(crm_cache, 'cache', self.other_worker):
+            crm_cache.bump_version('lead')
+        with mock.patch.object(crm_cache, 'cache', self.worker):
+            self.assertEqual(get_dashboard_stats(user)['total_leads'], 1)
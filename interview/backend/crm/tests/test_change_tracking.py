@@ -0,0 +1,117 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from crm.models import AuditLog, Contact, Correspondence, Lead, Note, Reminder
+
+
+User = get_user_model()
+
+
+class ChangeTrackingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('agent', password='secret')
+        Lead.objects.create(name='Acme', company='Acme Inc', email='info@acme.com', owner=cls.user)
+
+    def setUp(self):
+        self.lead = Lead.objects.get()
+
+    def save(self, instance, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            instance.save(**kwargs)
+        return [query['sql'] for query in queries]
+
+    def assertUpdates(self, sql, columns):
+        set_clause = sql.split(' SET ', 1)[1].split(' WHERE ', 1)[0]
+        self.assertEqual(sorted(part.split(' = ')[0].strip('"') for part in set_clause.split(', ')), sorted(columns))
+
+    def test_only_changed_columns_are_written(self):
+        self.lead.status = 'contacted'
+        [sql] = self.save(self.lead)
+        self.assertUpdates(sql, ['status', 'updated_at'])
+        self.assertEqual(self.lead.saved_changes, {'status': ('new', 'contacted')})
+
+    def test_unchanged_instance_is_not_saved(self):
+        self.lead.status = 'new'
+        self.assertEqual(self.save(self.lead), [])
+        self.assertEqual(self.lead.saved_changes, {})
+
+    def test_changes_are_tracked_from_the_last_save(self):
+        self.lead.status = 'contacted'
+        self.lead.save()
+        self.lead.status = 'qualified'
+        self.lead.save()
+        self.assertEqual(self.lead.saved_changes, {'status': ('contacted', 'qualified')})
+        self.assertEqual(self.save(self.lead), [])
+
+    def test_derived_fields_are_written_but_not_reported(self):
+        self.lead.email = 'sales@globex.com'
+        [sql] = self.save(self.lead)
+        self.assertUpdates(sql, ['email', 'email_key', 'updated_at'])
+        self.assertEqual(self.lead.saved_changes, {'email': ('info@acme.com', 'sales@globex.com')})
+        self.assertEqual(Lead.objects.get().email_key, 'globex.com')
+
+    def test_derived_fields_join_explicit_update_fields(self):
+        self.lead.company = 'Globex Corp'
+        [sql] = self.save(self.lead, update_fields=['company'])
+        self.assertUpdates(sql, ['company', *Lead.derived_fields])
+        self.assertEqual(Lead.objects.get().company_key, 'globex')
+
+    def test_new_instances_are_inserted(self):
+        lead = Lead(name='Globex', email='sales@globex.com')
+        [sql] = self.save(lead)
+        self.assertTrue(sql.startswith('INSERT'))
+        self.assertEqual(lead.company_key, '')
+        self.assertEqual(self.save(lead), [])
+
+
+class AuditedUpdateTests(TestCase):
+    """Updates through the API are audited with the diff the model tracked."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('agent', password='secret')
+        lead = Lead.objects.create(name='Acme', email='info@acme.com', owner=cls.user)
+        contact = Contact.objects.create(lead=lead, name='Jo', email='jo@acme.com')
+        cls.note = Note.objects.create(lead=lead, author=cls.user, content='First call')
+        cls.reminder = Reminder.objects.create(
+            lead=lead, user=cls.user, title='Call back', reminder_date=timezone.now()
+        )
+        cls.correspondence = Correspondence.objects.create(
+            contact=contact, type='email', subject='Quote', description='Sent the quote', logged_by=cls.user
+        )
+
+    def setUp(self):
+        # Live events and the reminder scheduler are not under test
+        self.enterContext(mock.patch('crm.utils.publish_audit_entries'))
+        self.enterContext(mock.patch('crm.signals.publish_reminder_change'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def update(self, path, instance, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/{path}/{instance.id}/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        return AuditLog.objects.get(action='update', model_name=type(instance).__name__, object_id=instance.id).changes
+
+    def test_note(self):
+        changes = self.update('notes', self.note, {'content': 'Second call'})
+        self.assertEqual(changes, {'content': {'old': 'First call', 'new': 'Second call'}})
+
+    def test_reminder(self):
+        changes = self.update('reminders', self.reminder, {'title': 'Call back', 'status': 'cancelled'})
+        self.assertEqual(changes, {'status': {'old': 'pending', 'new': 'cancelled'}})
+
+    def test_correspondence(self):
+        changes = self.update('correspondences', self.correspondence, {'subject': 'Revised quote'})
+        self.assertEqual(changes, {'subject': {'old': 'Quote', 'new': 'Revised quote'}})
+
+    def test_unchanged_update_logs_no_diff(self):
+        self.assertEqual(self.update('notes', self.note, {'content': 'First call'}), {})
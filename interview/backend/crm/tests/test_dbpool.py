@@ -0,0 +1,166 @@
+import threading
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+from psycopg2 import OperationalError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INERROR, TRANSACTION_STATUS_UNKNOWN
+
+from crm import parallel
+from crm.dbpool import ConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql, params=None):
+        if self.connection.broken:
+            raise OperationalError('server closed the connection unexpectedly')
+
+
+class FakeConnection:
+    """Just what the pool uses of a psycopg2 connection."""
+
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.autocommit = True
+        self.info = SimpleNamespace(transaction_status=TRANSACTION_STATUS_IDLE)
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        if self.broken:
+            raise OperationalError('connection already closed')
+        self.rollbacks += 1
+        self.info.transaction_status = TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def make_pool(self, **options):
+        options = {'max_size': 2, 'timeout': 1.0, 'check_after': 60, 'max_idle': 600, 'max_lifetime': 3600, **options}
+        return ConnectionPool(**options)
+
+    def test_returned_connection_is_reused(self):
+        pool = self.make_pool()
+        connection = pool.getconn(FakeConnection)
+        pool.putconn(connection)
+        self.assertIs(pool.getconn(FakeConnection), connection)
+        stats = pool.stats()
+        self.assertEqual((stats['connections_opened'], stats['checkouts'], stats['in_use']), (1, 2, 1))
+
+    def test_connection_left_in_transaction_is_rolled_back(self):
+        pool = self.make_pool()
+        connection = pool.getconn(FakeConnection)
+        connection.info.transaction_status = TRANSACTION_STATUS_INERROR
+        pool.putconn(connection)
+        self.assertEqual(connection.rollbacks, 1)
+        self.assertIs(pool.getconn(FakeConnection), connection)
+
+    def test_broken_connections_are_discarded(self):
+        pool = self.make_pool(max_size=4)
+        errored, unknown, failed_rollback = [pool.getconn(FakeConnection) for _ in range(3)]
+        # Django saw an error on it
+        pool.putconn(errored, discard=True)
+        # The server went away mid-session
+        unknown.info.transaction_status = TRANSACTION_STATUS_UNKNOWN
+        pool.putconn(unknown)
+        failed_rollback.info.transaction_status = TRANSACTION_STATUS_INERROR
+        failed_rollback.broken = True
+        pool.putconn(failed_rollback)
+
+        self.assertTrue(errored.closed and unknown.closed and failed_rollback.closed)
+        self.assertEqual(pool.stats()['idle'], 0)
+        self.assertEqual(pool.stats()['connections_closed'], 3)
+        self.assertNotIn(pool.getconn(FakeConnection), (errored, unknown, failed_rollback))
+
+    def test_failed_health_check_flushes_idle_connections(self):
+        pool = self.make_pool(check_after=0)
+        first, second = pool.getconn(FakeConnection), pool.getconn(FakeConnection)
+        pool.putconn(first)
+        pool.putconn(second)
+        # As after a server restart
+        first.broken = second.broken = True
+
+        connection = pool.getconn(FakeConnection)
+        self.assertNotIn(connection, (first, second))
+        self.assertTrue(first.closed and second.closed)
+        stats = pool.stats()
+        self.assertEqual((stats['health_check_failures'], stats['idle'], stats['in_use']), (1, 0, 1))
+
+    def test_connect_error_frees_its_slot(self):
+        pool = self.make_pool(max_size=1)
+        with self.assertRaises(OperationalError):
+            pool.getconn(mock.Mock(side_effect=OperationalError('could not connect')))
+        self.assertEqual(pool.stats()['connect_errors'], 1)
+        self.assertIsInstance(pool.getconn(FakeConnection), FakeConnection)
+
+    def test_waits_for_a_connection_and_times_out(self):
+        pool = self.make_pool(max_size=1, timeout=0.05)
+        connection = pool.getconn(FakeConnection)
+        with self.assertRaises(PoolTimeout):
+            pool.getconn(FakeConnection)
+
+        pool.timeout = 5
+        timer = threading.Timer(0.05, pool.putconn, [connection])
+        timer.start()
+        self.assertIs(pool.getconn(FakeConnection), connection)
+        timer.join()
+        stats = pool.stats()
+        self.assertEqual((stats['waits'], stats['timeouts'], stats['connections_opened']), (2, 1, 1))
+
+
+class FakeDatabaseWrapper:
+    """The calling thread's Django connection, holding a connection of `pool`."""
+
+    vendor = 'postgresql'
+    in_atomic_block = False
+    settings_dict = {'ENGINE': parallel.POOLED_ENGINE}
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.connection = pool.getconn(FakeConnection)
+
+    def close(self):
+        if self.connection is not None:
+            self.pool.putconn(self.connection)
+            self.connection = None
+
+
+class FakeConnectionHandler(dict):
+
+    def all(self, initialized_only=False):
+        return list(self.values())
+
+
+class ParallelQueryTests(SimpleTestCase):
+    """Requests waiting on their concurrent queries do not hold the connections those need."""
+
+    def test_caller_releases_its_connection_before_fanning_out(self):
+        pool = ConnectionPool(max_size=1, timeout=0.5, check_after=60, max_idle=600, max_lifetime=3600)
+        caller = FakeDatabaseWrapper(pool)
+
+        def query():
+            connection = pool.getconn(FakeConnection)
+            pool.putconn(connection)
+            return connection
+
+        with mock.patch.object(parallel, 'connections', FakeConnectionHandler(default=caller)):
+            results = parallel.run_queries(query, query)
+        self.assertEqual(len(results), 2)
+        self.assertIsNone(caller.connection)
+        self.assertEqual(pool.stats()['timeouts'], 0)
@@ -0,0 +1,130 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from crm.duplicates import find_all_duplicates, merge_leads
+from crm.models import AuditLog, Contact, DuplicateCandidate, Lead, Note, Reminder
+
+
+User = get_user_model()
+
+
+class FindAllDuplicatesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.acme = Lead.objects.create(name='Jane Doe', email='jane@acme.com', company='Acme Inc')
+        cls.acme_again = Lead.objects.create(name='Jane Doe', email='jane.doe@acme.com', company='ACME')
+        cls.acme_other = Lead.objects.create(name='Bob Stone', email='bob@acme.com', phone='555 010 0199')
+        cls.bob = Lead.objects.create(name='Bob Stone', email='bob.stone@gmail.com', phone='(555) 010-0199')
+
+    def pairs(self, **filters):
+        return list(DuplicateCandidate.objects.filter(**filters).order_by('lead_id').values_list('lead', 'duplicate'))
+
+    def test_pairs_sharing_a_block_are_scored(self):
+        self.assertEqual(find_all_duplicates(), 2)
+        candidate = DuplicateCandidate.objects.get(lead=self.acme, duplicate=self.acme_again)
+        self.assertEqual(candidate.reasons, ['email_domain', 'company', 'name'])
+        self.assertEqual(candidate.score, 0.75)
+        # A shared domain alone is below DUPLICATE_MIN_SCORE
+        self.assertFalse(DuplicateCandidate.objects.filter(duplicate=self.acme_other, lead=self.acme).exists())
+        self.assertEqual(self.pairs(), [
+            (self.acme.id, self.acme_again.id), (self.acme_other.id, self.bob.id),
+        ])
+
+    def test_dismissed_pairs_are_not_raised_again(self):
+        find_all_duplicates()
+        DuplicateCandidate.objects.filter(lead=self.acme).update(status='dismissed')
+        self.bob.phone = ''
+        self.bob.save()
+        self.assertEqual(find_all_duplicates(), 1)
+        self.assertEqual(self.pairs(status='dismissed'), [(self.acme.id, self.acme_again.id)])
+        self.assertEqual(self.pairs(status='open'), [])
+
+
+class MergeLeadsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('manager', password='secret', role='manager')
+        cls.target = Lead.objects.create(name='Acme', email='info@acme.com', owner=cls.user)
+        cls.first = Lead.objects.create(name='Acme', email='sales@acme.com', phone='555-0100', estimated_value=Decimal('10'))
+        cls.second = Lead.objects.create(name='ACME', email='ops@acme.com', phone='555-0199', source='web')
+        for lead in (cls.first, cls.second):
+            Contact.objects.create(lead=lead, name=f'{lead.email} primary', email=lead.email, is_primary=True)
+            Contact.objects.create(lead=lead, name=f'{lead.email} other', email=lead.email)
+            Note.objects.create(lead=lead, author=cls.user, content='Note')
+        Reminder.objects.create(lead=cls.second, user=cls.user, title='Call', reminder_date='2030-01-01T09:00Z')
+
+    def setUp(self):
+        # Live events are not under test
+        self.enterContext(mock.patch('crm.utils.publish_audit_entries'))
+
+    def merge(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return merge_leads(self.target, [self.second.id, self.first.id, self.target.id], user=self.user, **kwargs)
+
+    def test_children_move_and_blank_fields_are_filled(self):
+        self.assertEqual(self.merge(), {'contacts': 4, 'notes': 2, 'reminders': 1})
+        self.assertQuerysetEqual(Lead.objects.all(), [self.target])
+        self.target.refresh_from_db()
+        self.assertEqual((self.target.phone, self.target.source), ('555-0100', 'web'))
+        self.assertEqual(self.target.estimated_value, Decimal('10'))
+        self.assertEqual(self.target.owner, self.user)
+        self.assertEqual(self.target.contacts.count(), 4)
+        self.assertEqual(self.target.notes.count(), 2)
+        self.assertEqual(self.target.reminders.count(), 1)
+        log = AuditLog.objects.get(action='update', object_id=self.target.id)
+        self.assertEqual(log.changes['merged_leads'], {'old': '', 'new': f'{self.first.id}, {self.second.id}'})
+        self.assertEqual(AuditLog.objects.filter(action='delete', model_name='Lead').count(), 2)
+
+    def test_first_duplicate_primary_contact_is_kept(self):
+        self.merge()
+        self.assertEqual(
+            list(self.target.contacts.filter(is_primary=True).values_list('name', flat=True)),
+            ['sales@acme.com primary'],
+        )
+
+    def test_target_primary_contact_is_kept(self):
+        Contact.objects.create(lead=self.target, name='Own', email='info@acme.com', is_primary=True)
+        self.merge()
+        self.assertEqual(list(self.target.contacts.filter(is_primary=True).values_list('name', flat=True)), ['Own'])
+
+
+class MergeEndpointTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent = User.objects.create_user('agent', password='secret', role='agent')
+        cls.manager = User.objects.create_user('manager', password='secret', role='manager')
+        cls.target = Lead.objects.create(name='Acme', email='info@acme.com')
+        cls.duplicate = Lead.objects.create(name='Acme', email='sales@acme.com', company='Acme')
+
+    def setUp(self):
+        self.enterContext(mock.patch('crm.utils.publish_audit_entries'))
+        self.client = APIClient()
+
+    def merge(self, user, duplicate_ids):
+        self.client.force_authenticate(user)
+        return self.client.post(f'/api/leads/{self.target.id}/merge/', {'duplicate_ids': duplicate_ids}, format='json')
+
+    def test_agents_cannot_merge(self):
+        self.assertEqual(self.merge(self.agent, [self.duplicate.id]).status_code, 403)
+        self.assertTrue(Lead.objects.filter(pk=self.duplicate.pk).exists())
+
+    def test_unknown_leads_are_rejected(self):
+        response = self.merge(self.manager, [self.duplicate.id, 0, 999999])
+        self.assertEqual(response.status_code, 400)
+        response = self.merge(self.manager, [self.duplicate.id, 999999])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['duplicate_ids'], ['Leads not found: 999999.'])
+
+    def test_managers_merge(self):
+        response = self.merge(self.manager, [self.duplicate.id])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['lead']['company'], 'Acme')
+        self.assertEqual(response.data['moved'], {'contacts': 0, 'notes': 0, 'reminders': 0})
+        self.assertFalse(Lead.objects.filter(pk=self.duplicate.pk).exists())
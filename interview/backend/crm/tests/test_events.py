@@ -0,0 +1,48 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from crm.events import EventStream, InMemoryBroker, RedisBroker, SubscriptionClosed
+
+
+User = get_user_model()
+
+
+class LiveEventsTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('agent', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.broker = InMemoryBroker()
+        self.enterContext(mock.patch('crm.events.get_broker', return_value=self.broker))
+        self.enterContext(override_settings(EVENTS_MAX_STREAMS=1, EVENTS_STREAM_SECONDS=1, EVENTS_HEARTBEAT_SECONDS=1))
+
+    def test_streams_per_process_are_capped(self):
+        first = self.client.get('/api/events/')
+        self.assertEqual(first.status_code, 200)
+        second = self.client.get('/api/events/')
+        self.assertEqual(second.status_code, 503)
+        self.assertEqual(second['Retry-After'], '3')
+        # Closing a response gives its slot back, even if it was never read
+        first.close()
+        self.assertFalse(self.broker.subscriptions)
+        third = self.client.get('/api/events/')
+        self.assertEqual(third.status_code, 200)
+        third.close()
+
+    def test_unreachable_broker(self):
+        with mock.patch('crm.events.get_broker', return_value=RedisBroker('redis://127.0.0.1:1/0')):
+            response = self.client.get('/api/events/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(EventStream.open_streams, 0)
+
+    def test_lost_subscription_ends_stream(self):
+        stream = EventStream(['activity'])
+        self.assertEqual(next(stream), 'retry: 3000\n\n')
+        with mock.patch.object(stream.subscription, 'get', side_effect=SubscriptionClosed('gone')):
+            self.assertEqual(list(stream), [])
+        stream.close()
+        self.assertEqual(EventStream.open_streams, 0)
@@ -0,0 +1,123 @@
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from crm.exports import get_job_dir
+from crm.models import ExportChunk, ExportJob, Lead
+from crm.tasks import export_chunk, finalize_export_job, start_export_job
+
+
+User = get_user_model()
+
+
+class ExportJobCreateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('agent', password='secret')
+        Lead.objects.create(name='Lead', owner=cls.user, status='new')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.delay = self.enterContext(mock.patch('crm.views.start_export_job.delay'))
+
+    def create(self, filters):
+        return self.client.post('/api/exports/', {'model_name': 'lead', 'filters': filters}, format='json')
+
+    def test_invalid_filter_values_are_rejected(self):
+        for filters in ({'owner': 'abc'}, {'owner': 0}, {'status': 'unknown'}):
+            response = self.create(filters)
+            self.assertEqual(response.status_code, 400, filters)
+            self.assertIn('filters', response.data)
+        self.assertFalse(ExportJob.objects.exists())
+        self.delay.assert_not_called()
+
+    def test_filter_values_are_stored_for_the_orm(self):
+        response = self.create({'owner': str(self.user.pk), 'status': 'new', 'priority': ''})
+        self.assertEqual(response.status_code, 201)
+        job = ExportJob.objects.get()
+        self.assertEqual(job.filters, {'owner': self.user.pk, 'status': 'new'})
+        self.delay.assert_called_once_with(job.id)
+
+    def test_planning_error_fails_the_job(self):
+        job = ExportJob.objects.create(user=self.user, model_name='lead', filters={'owner': 'abc'})
+        with self.assertRaises(ValueError):
+            start_export_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('abc', job.error)
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2, EXPORT_STALLED_SECONDS=60)
+class ExportJobResumeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('agent', password='secret')
+        for i in range(5):
+            Lead.objects.create(name=f'Lead {i}', owner=cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        export_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(EXPORT_ROOT=export_root))
+        for target in ('crm.views.start_export_job.delay', 'crm.tasks.export_chunk.delay',
+                       'crm.tasks.finalize_export_job.delay'):
+            self.enterContext(mock.patch(target))
+        self.job = ExportJob.objects.create(user=self.user, model_name='lead')
+        start_export_job(self.job.id)
+
+    def age(self, queryset, seconds):
+        queryset.update(**{
+            'updated_at' if queryset.model is ExportJob else 'claimed_at': timezone.now() - timedelta(seconds=seconds)
+        })
+
+    def resume(self):
+        return self.client.post(f'/api/exports/{self.job.id}/resume/')
+
+    def test_running_job_is_not_resumed(self):
+        response = self.resume()
+        self.assertEqual(response.status_code, 409)
+        start_export_job.delay.assert_not_called()
+
+    def test_failed_or_stalled_job_is_resumed(self):
+        ExportJob.objects.filter(id=self.job.id).update(status='failed')
+        self.assertEqual(self.resume().status_code, 202)
+        start_export_job(self.job.id)
+        self.age(ExportJob.objects.filter(id=self.job.id), 120)
+        self.assertEqual(self.resume().status_code, 202)
+        self.assertEqual(start_export_job.delay.call_count, 2)
+
+    def test_chunk_is_written_by_one_task_at_a_time(self):
+        chunk = self.job.chunks.get(index=0)
+        with mock.patch('crm.tasks.write_chunk', return_value=2) as write:
+            ExportChunk.objects.filter(id=chunk.id).update(status='running', claimed_at=timezone.now())
+            export_chunk(chunk.id)
+            write.assert_not_called()
+            # Resuming leaves the claimed chunk alone until its claim is stale
+            export_chunk.delay.reset_mock()
+            start_export_job(self.job.id)
+            self.assertNotIn(mock.call(chunk.id), export_chunk.delay.call_args_list)
+            self.age(ExportChunk.objects.filter(id=chunk.id), 120)
+            start_export_job(self.job.id)
+            self.assertIn(mock.call(chunk.id), export_chunk.delay.call_args_list)
+            export_chunk(chunk.id)
+            export_chunk(chunk.id)
+        write.assert_called_once()
+        chunk.refresh_from_db()
+        self.assertEqual((chunk.status, chunk.rows), ('done', 2))
+
+    def test_export_completes(self):
+        for chunk_id in self.job.chunks.values_list('id', flat=True):
+            export_chunk(chunk_id)
+        finalize_export_job(self.job.id)
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.rows_exported, self.job.total_chunks), ('completed', 5, 3))
+        self.assertEqual(sorted(p.name for p in get_job_dir(self.job).iterdir()), [f'lead_export_{self.job.id}.csv'])
@@ -0,0 +1,123 @@
+import io
+import json
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from crm.imports import LeadImporter
+from crm.models import Contact, ImportJob, Lead
+
+
+User = get_user_model()
+
+
+def csv_file(*rows, header='name,email,company,owner,contact_name,contact_phone'):
+    return io.BytesIO('\n'.join([header, *rows]).encode() + b'\n')
+
+
+class LeadImporterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('agent', password='secret')
+        cls.owner = User.objects.create_user('owner', password='secret')
+        Lead.objects.create(name='Existing', email='Existing@Example.com', owner=cls.user)
+
+    def run_import(self, f, format='csv', **kwargs):
+        progress = []
+        importer = LeadImporter(
+            user=self.user,
+            on_progress=lambda importer: progress.append((importer.rows_processed, importer.bytes_read)),
+            **kwargs
+        )
+        importer.run(f, format)
+        return importer, progress
+
+    def test_rows_are_imported_in_chunks_with_progress(self):
+        f = csv_file(*[f'Lead {i},lead{i}@example.com,,,,' for i in range(5)])
+        with self.assertNumQueries(3 * 4):
+            importer, progress = self.run_import(f, chunk_size=2)
+        self.assertEqual(importer.summary()['rows_imported'], 5)
+        self.assertEqual([rows for rows, _ in progress], [2, 4, 5])
+        byte_counts = [read for _, read in progress]
+        self.assertEqual(byte_counts, sorted(byte_counts))
+        self.assertEqual(byte_counts[-1], len(f.getvalue()))
+        self.assertEqual(Lead.objects.filter(owner=self.user, email__startswith='lead').count(), 5)
+
+    def test_duplicate_emails_are_skipped(self):
+        importer, _ = self.run_import(csv_file(
+            'Again,existing@example.COM,,,,',
+            'New,new@example.com,,,,',
+            'New again,NEW@example.com,,,,',
+        ), chunk_size=2)
+        self.assertEqual(importer.summary(), {
+            'rows_processed': 3, 'rows_imported': 1, 'rows_skipped': 2, 'rows_failed': 0, 'errors': [],
+        })
+        names = Lead.objects.filter(email__iendswith='@example.com').order_by('id').values_list('name', flat=True)
+        self.assertEqual(list(names), ['Existing', 'New'])
+
+    def test_primary_contact_defaults_to_the_lead(self):
+        self.run_import(csv_file(
+            'With contact,with@example.com,Acme,,,555-0100',
+            'Named contact,named@example.com,Acme,,Jo,',
+            'Without,without@example.com,Acme,,,',
+        ))
+        contacts = Contact.objects.order_by('id')
+        self.assertEqual(
+            [(c.lead.name, c.name, c.email, c.phone, c.is_primary) for c in contacts],
+            [
+                ('With contact', 'With contact', 'with@example.com', '555-0100', True),
+                ('Named contact', 'Jo', 'named@example.com', '', True),
+            ],
+        )
+
+    def test_owners_are_looked_up_by_username(self):
+        importer, _ = self.run_import(csv_file(
+            'Owned,owned@example.com,,owner,,',
+            'Unowned,unowned@example.com,,nobody,,',
+        ))
+        self.assertEqual(Lead.objects.get(email='owned@example.com').owner, self.owner)
+        self.assertFalse(Lead.objects.filter(email='unowned@example.com').exists())
+        self.assertEqual(importer.errors, [{'line': 3, 'errors': {'owner': ['Unknown user "nobody".']}}])
+
+    def test_invalid_rows_fail_and_errors_are_capped(self):
+        lines = [json.dumps({'name': 'Bad', 'email': f'not an email {i}'}) for i in range(3)]
+        lines.append('{broken')
+        importer, _ = self.run_import(io.BytesIO('\n'.join(lines).encode()), format='jsonl', max_errors=2)
+        self.assertEqual(importer.rows_failed, 4)
+        self.assertEqual(importer.rows_imported, 0)
+        self.assertEqual([error['line'] for error in importer.errors], [1, 2])
+        self.assertIn('email', importer.errors[0]['errors'])
+
+
+class ImportJobCreateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('agent', password='secret')
+
+    def setUp(self):
+        self.enterContext(override_settings(IMPORT_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, content, name='leads.csv'):
+        return self.client.post('/api/imports/', {'file': SimpleUploadedFile(name, content)}, format='multipart')
+
+    def test_small_upload_is_imported_in_the_request(self):
+        response = self.upload(b'name,email\nLead,lead@example.com\n')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['status'], 'completed')
+        self.assertEqual(response.data['rows_imported'], 1)
+        self.assertTrue(Lead.objects.filter(email='lead@example.com', owner=self.user).exists())
+
+    def test_malformed_upload_returns_the_failed_job(self):
+        # A quoted field that never ends outgrows csv's field size limit
+        response = self.upload(b'name,email\n"' + b'x' * 200000 + b'\n')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['status'], 'failed')
+        self.assertIn('field larger than field limit', response.data['error'])
+        self.assertEqual(ImportJob.objects.get().status, 'failed')
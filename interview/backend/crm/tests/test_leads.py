@@ -0,0 +1,84 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import update_last_login
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from crm.cache import get_versions
+from crm.models import Lead, Note
+
+
+User = get_user_model()
+
+
+class LeadQueryCountTests(TestCase):
+    """The lead endpoints take a fixed number of queries, however many children a lead has."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('agent', password='secret')
+        authors = [User.objects.create_user(f'author{i}', password='secret') for i in range(10)]
+        cls.lead = Lead.objects.create(name='Lead', company='Acme', email='lead@example.com', owner=cls.user)
+        Note.objects.bulk_create([
+            Note(lead=cls.lead, author=authors[i % 10], content=f'Note {i}') for i in range(60)
+        ])
+        for i in range(5):
+            Lead.objects.create(name=f'Other {i}', company='Acme', owner=authors[i])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Versions exist once anything was written, so ETags cost one cache read
+        get_versions('lead', 'contact', 'note', 'reminder', 'user')
+
+    def test_list(self):
+        # Versions for the ETag, COUNT(*) and the page
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/leads/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 6)
+
+    def test_retrieve(self):
+        # Versions and overdue reminders for the ETag, the lead and its three children
+        with self.assertNumQueries(6):
+            response = self.client.get(f'/api/leads/{self.lead.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['notes']), 50)
+
+    def test_partial_update(self):
+        # The cache version and the rollup day are updated on commit, after these
+        with self.assertNumQueries(6):
+            response = self.client.patch(f'/api/leads/{self.lead.id}/', {'status': 'contacted'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'contacted')
+        self.assertEqual(len(response.data['notes']), 50)
+
+    def test_not_modified(self):
+        etag = self.client.get('/api/leads/')['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/leads/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_write_changes_etag(self):
+        etag = self.client.get(f'/api/leads/{self.lead.id}/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Note.objects.create(lead=self.lead, author=self.user, content='New note')
+        response = self.client.get(f'/api/leads/{self.lead.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['notes'][0]['content'], 'New note')
+
+    def test_renamed_owner_changes_etag(self):
+        etag = self.client.get('/api/leads/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Renamed'
+            self.user.save()
+        response = self.client.get('/api/leads/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        owners = {row['owner']['first_name'] for row in response.data['results'] if row['id'] == self.lead.id}
+        self.assertEqual(owners, {'Renamed'})
+
+    def test_login_keeps_etag(self):
+        etag = self.client.get('/api/leads/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            update_last_login(None, self.user)
+        self.assertEqual(self.client.get('/api/leads/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
@@ -0,0 +1,51 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from crm.models import Lead
+from crm.pagination import CRMPagination
+
+
+User = get_user_model()
+
+
+class CursorPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('agent', password='secret')
+        for i in range(7):
+            Lead.objects.create(
+                name=f'Acme {i}', company='Acme Acme' if i % 2 else 'Other', owner=cls.user,
+                estimated_value=i % 3,
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def collect(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row['id'] for row in response.data['results']])
+            url = response.data['next']
+        return pages
+
+    def test_cursor_pages_match_offset_pages(self):
+        # Pages of 2 split the rows tied on estimated_value, so the pk tie-break decides
+        self.enterContext(mock.patch.object(CRMPagination, 'page_size', 2))
+        query = 'search=acme&ordering=-estimated_value'
+        cursor_pages = self.collect(f'/api/leads/?pagination=cursor&{query}')
+        self.assertEqual(cursor_pages, self.collect(f'/api/leads/?{query}'))
+        self.assertEqual(len(cursor_pages), 4)
+        self.assertEqual(sorted(sum(cursor_pages, [])), sorted(Lead.objects.values_list('id', flat=True)))
+
+    def test_cursor_rejected_for_relevance_order(self):
+        response = self.client.get('/api/leads/?pagination=cursor&search=acme')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('pagination', response.data)
+        self.assertEqual(self.client.get('/api/leads/?search=acme').status_code, 200)
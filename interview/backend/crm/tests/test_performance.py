@@ -0,0 +1,47 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from crm.models import Lead
+
+
+User = get_user_model()
+
+
+@override_settings(PERF_INSTRUMENTATION=True, PERF_SLOW_REQUEST_MS=60000, PERF_PROFILE_ROUTE='')
+class PerformanceMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('agent', password='secret')
+        Lead.objects.create(name='Jane Doe', email='jane@example.com', owner=cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @override_settings(PERF_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self.client.get('/api/leads/')
+        self.assertEqual(response.status_code, 200)
+        entries = [entry.split(';')[0] for entry in response['Server-Timing'].split(', ')]
+        self.assertEqual(entries[0], 'sql')
+        self.assertEqual(entries[-1], 'total')
+        self.assertIn('render', entries)
+        self.assertRegex(response['Server-Timing'], r'^sql;dur=[\d.]+;desc="\d+ queries"')
+
+    @override_settings(PERF_SERVER_TIMING=False)
+    def test_server_timing_can_be_left_out(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/leads/'))
+
+    @override_settings(PERF_SLOW_REQUEST_MS=0, PERF_SLOW_QUERIES=2, PERF_EXPLAIN_SLOW_QUERIES=True)
+    def test_slow_request_log_leaves_out_personal_data(self):
+        with self.assertLogs('crm.performance', 'WARNING') as logs:
+            response = self.client.get('/api/leads/', {'search': 'jane@example.com'})
+        self.assertEqual(response.status_code, 200)
+        [message] = logs.output
+        self.assertIn('Slow request: GET /api/leads/ answered 200', message)
+        self.assertEqual(message.count(' ms on default: '), 2)
+        self.assertNotIn('jane', message)
+        # The plans are still read with the parameters
+        self.assertNotIn('EXPLAIN failed', message)
@@ -0,0 +1,172 @@
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from crm import reminders
+from crm.models import Lead, Reminder
+from crm.reminders import ReminderScheduler, dispatch_batch, dispatch_due_reminders, run_scheduler
+
+
+User = get_user_model()
+
+
+def change(reminder_id, due):
+    """A message as publish_reminder_change() sends it."""
+    return json.dumps({'id': reminder_id, 'due': due.isoformat() if due else None})
+
+
+class FakePubSub:
+    """Hands out the queued messages, then nothing."""
+
+    def __init__(self, messages=()):
+        self.messages = [{'type': 'message', 'data': message} for message in messages]
+
+    def subscribe(self, channel):
+        pass
+
+    def get_message(self, timeout=0):
+        return self.messages.pop(0) if self.messages else None
+
+
+class ReminderSchedulerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('agent', password='secret')
+        cls.lead = Lead.objects.create(name='Lead', owner=cls.user)
+        cls.now = timezone.now()
+
+    def create(self, minutes, status='pending'):
+        return Reminder.objects.create(
+            lead=self.lead, user=self.user, title='Call', status=status,
+            reminder_date=self.now + timedelta(minutes=minutes),
+        )
+
+    def test_load_keeps_pending_reminders_in_due_order(self):
+        later, sooner = self.create(10), self.create(-5)
+        self.create(-10, status='sent')
+        scheduler = ReminderScheduler()
+        scheduler.load()
+        self.assertEqual(len(scheduler), 2)
+        self.assertEqual(scheduler.next_due(), sooner.reminder_date)
+        self.assertEqual(scheduler.pop_due(self.now), [sooner.id])
+        self.assertEqual(scheduler.pop_due(self.now + timedelta(minutes=10)), [later.id])
+        self.assertIsNone(scheduler.next_due())
+
+    def test_rescheduled_reminder_fires_at_its_new_time_only(self):
+        scheduler = ReminderScheduler()
+        scheduler.schedule(1, self.now)
+        scheduler.apply(change(1, self.now + timedelta(minutes=5)))
+        self.assertEqual(scheduler.pop_due(self.now), [])
+        self.assertEqual(scheduler.pop_due(self.now + timedelta(minutes=5)), [1])
+        self.assertEqual(len(scheduler), 0)
+
+    def test_cancelled_reminder_is_dropped(self):
+        scheduler = ReminderScheduler()
+        scheduler.schedule(1, self.now)
+        scheduler.schedule(2, self.now + timedelta(minutes=1))
+        scheduler.apply(change(1, None))
+        self.assertEqual(scheduler.next_due(), self.now + timedelta(minutes=1))
+        self.assertEqual(scheduler.pop_due(self.now + timedelta(minutes=1)), [2])
+
+    def test_run_dispatches_loaded_and_published_reminders(self):
+        due = self.create(-1)
+        self.create(60)
+        published = self.now - timedelta(seconds=1)
+        pubsub = FakePubSub([change(999, published)])
+        batches = []
+        loops = iter([False, False, True])
+        run_scheduler(batches.append, pubsub, max_sleep=0, should_stop=lambda: next(loops))
+        # The published reminder is dispatched on the loop after it arrived
+        self.assertEqual(batches, [[due.id], [999]])
+
+
+class RescheduleReminderTests(TestCase):
+    """Saving or deleting a reminder tells the scheduler once committed."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('agent', password='secret')
+        cls.lead = Lead.objects.create(name='Lead', owner=cls.user)
+
+    def setUp(self):
+        self.publish = self.enterContext(mock.patch('crm.signals.publish_reminder_change'))
+
+    def test_create_with_string_date(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            reminder = Reminder.objects.create(
+                lead=self.lead, user=self.user, title='Call', reminder_date='2030-01-01T09:00Z'
+            )
+        due = datetime(2030, 1, 1, 9, tzinfo=dt_timezone.utc)
+        self.publish.assert_called_once_with(reminder.id, due, 'pending')
+
+    def test_status_change_and_delete(self):
+        reminder = Reminder.objects.create(
+            lead=self.lead, user=self.user, title='Call', reminder_date=timezone.now()
+        )
+        reminder_id = reminder.id
+        with self.captureOnCommitCallbacks(execute=True):
+            reminder.status = 'cancelled'
+            reminder.save()
+            reminder.delete()
+        self.assertEqual(self.publish.call_args_list, [
+            mock.call(reminder_id, reminder.reminder_date, 'cancelled'),
+            mock.call(reminder_id, None, None),
+        ])
+
+    def test_nothing_published_before_commit(self):
+        with self.captureOnCommitCallbacks():
+            Reminder.objects.create(lead=self.lead, user=self.user, title='Call', reminder_date=timezone.now())
+        self.publish.assert_not_called()
+
+
+class DispatchTests(TestCase):
+    """Due reminders are claimed in locked batches and sent over one mail connection."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('agent', email='agent@example.com', password='secret')
+        lead = Lead.objects.create(name='Lead', owner=cls.user)
+        now = timezone.now()
+        Reminder.objects.bulk_create([
+            Reminder(lead=lead, user=cls.user, title=f'Due {i}', reminder_date=now - timedelta(minutes=i))
+            for i in range(5)
+        ] + [
+            Reminder(lead=lead, user=cls.user, title='Later', reminder_date=now + timedelta(hours=1)),
+            Reminder(lead=lead, user=cls.user, title='Sent', reminder_date=now, status='sent'),
+        ])
+
+    def setUp(self):
+        # Live events are not under test
+        self.enterContext(mock.patch.object(reminders, 'publish_reminders_due'))
+
+    def test_batch_is_claimed_skipping_locked_rows_and_marked_with_one_update(self):
+        select_for_update = QuerySet.select_for_update
+        with mock.patch.object(
+            QuerySet, 'select_for_update', autospec=True, side_effect=select_for_update
+        ) as claim, CaptureQueriesContext(connection) as queries:
+            self.assertEqual(dispatch_batch(batch_size=3), 3)
+        claim.assert_called_once_with(mock.ANY, skip_locked=True, of=('self',))
+        updates = [query for query in queries if query['sql'].startswith('UPDATE "crm_reminder"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Reminder.objects.filter(status='sent').count(), 4)
+        # The oldest reminders go first
+        self.assertEqual([message.subject for message in mail.outbox], [
+            'Reminder: Due 4', 'Reminder: Due 3', 'Reminder: Due 2',
+        ])
+
+    def test_batches_share_one_connection(self):
+        with mock.patch.object(reminders, 'get_connection', wraps=reminders.get_connection) as get_connection:
+            self.assertEqual(dispatch_due_reminders(batch_size=2), 5)
+        get_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].to, ['agent@example.com'])
+        self.assertFalse(Reminder.objects.filter(status='pending', title__startswith='Due').exists())
+        self.assertEqual(dispatch_due_reminders(), 0)
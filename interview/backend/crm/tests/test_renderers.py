@@ -0,0 +1,25 @@
+from unittest import SkipTest
+
+from django.test import SimpleTestCase
+from rest_framework.renderers import JSONRenderer
+
+from crm.renderers import ORJSONRenderer, orjson
+
+
+class ORJSONRendererTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        if orjson is None:
+            raise SkipTest('orjson is not installed')
+        super().setUpClass()
+
+    def assertRendersLikeDRF(self, data):
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_floats(self):
+        for value in [0.5, 1e-4, 2.5e-5, 2.095238095238095e-6, -1e-12, 1e15, 1e16, 1.5e300]:
+            with self.subTest(value=value):
+                self.assertRendersLikeDRF({'rank': value, 'ranks': [1.0, value]})
+
+    def test_exponent_like_strings(self):
+        self.assertRendersLikeDRF({'name': 'Type 2e-3 at 0.0000', 'score': 0.25})
@@ -0,0 +1,69 @@
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache.backends.db import DatabaseCache
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from crm.middleware import ReplicaRoutingMiddleware
+from crm.models import Lead
+from crm.routers import REPLICA, STICKY_COOKIE, ReplicaRouter, replica_request
+
+
+User = get_user_model()
+
+
+class StickyPrimaryTests(SimpleTestCase):
+    """
+    A write marks its response with a cookie that keeps the user's next
+    reads on the primary, whichever worker process serves them.
+    """
+
+    def setUp(self):
+        self.enterContext(mock.patch.dict(settings.DATABASES, {REPLICA: settings.DATABASES['default']}))
+        self.factory = RequestFactory()
+        self.user = User(pk=1, username='agent')
+        self.addCleanup(replica_request.set, None)
+
+    def write(self, user):
+        request = self.factory.post('/api/leads/')
+        request.user = user
+        return ReplicaRoutingMiddleware(lambda request: HttpResponse(status=201))(request)
+
+    def read_database(self, user, cookies=None, model=Lead):
+        request = self.factory.get('/api/leads/')
+        request.COOKIES.update(cookies or {})
+        request.user = user
+        replica_request.set(request)
+        return ReplicaRouter().db_for_read(model)
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.read_database(self.user), REPLICA)
+
+    def test_cache_reads_stay_on_primary(self):
+        # The cache is written on the primary, and versions and locks must be read back at once
+        cache_model = DatabaseCache('crm_cache', {}).cache_model_class
+        self.assertEqual(self.read_database(self.user, model=cache_model), 'default')
+
+    def test_write_keeps_user_on_primary(self):
+        response = self.write(self.user)
+        cookie = response.cookies[STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_STICKY_SECONDS)
+        self.assertTrue(cookie['httponly'])
+        self.assertEqual(self.read_database(self.user, {STICKY_COOKIE: cookie.value}), 'default')
+
+    def test_mark_only_applies_to_its_user(self):
+        cookie = self.write(self.user).cookies[STICKY_COOKIE]
+        other = User(pk=2, username='other')
+        self.assertEqual(self.read_database(other, {STICKY_COOKIE: cookie.value}), REPLICA)
+
+    def test_forged_mark_is_ignored(self):
+        self.assertEqual(self.read_database(self.user, {STICKY_COOKIE: '1'}), REPLICA)
+
+    def test_mark_expires(self):
+        cookie = self.write(self.user).cookies[STICKY_COOKIE]
+        later = time.time() + settings.REPLICA_STICKY_SECONDS + 1
+        with mock.patch('time.time', return_value=later):
+            self.assertEqual(self.read_database(self.user, {STICKY_COOKIE: cookie.value}), REPLICA)
@@ -0,0 +1,106 @@
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from crm.models import Contact, Lead, Note
+from crm.search import full_text_search, rank_order
+
+
+User = get_user_model()
+
+
+def search(model, text):
+    return list(rank_order(full_text_search(model.objects.all(), text)).values_list('name', flat=True))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite full-text indexes')
+class SQLiteFullTextSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.acme = Lead.objects.create(name='Acme Corp', email='info@acme.com', description='Pricing for offers')
+        cls.globex = Lead.objects.create(name='Globex', email='sales@globex.com', description='Runs on Acme hardware')
+        cls.initech = Lead.objects.create(name='Initech', email='hello@initech.com', phone='555-0100')
+
+    def test_terms_match_as_prefixes(self):
+        self.assertEqual(search(Lead, 'acm'), ['Acme Corp', 'Globex'])
+        self.assertEqual(search(Lead, 'ini'), ['Initech'])
+        self.assertEqual(search(Lead, 'acme corp'), ['Acme Corp'])
+        self.assertEqual(search(Lead, 'acme nothing'), [])
+        # Text without words matches nothing, but can still be ranked
+        self.assertEqual(search(Lead, '...'), [])
+
+    def test_words_match_by_stem(self):
+        self.assertEqual(search(Lead, 'offering'), ['Acme Corp'])
+        self.assertEqual(search(Lead, 'running'), ['Globex'])
+
+    def test_emails_and_phones_are_searchable(self):
+        self.assertEqual(search(Lead, 'globex.com'), ['Globex'])
+        self.assertEqual(search(Lead, '0100'), ['Initech'])
+
+    def test_name_matches_rank_above_description_matches(self):
+        results = rank_order(full_text_search(Lead.objects.all(), 'acme')).values_list('name', 'search_rank')
+        (first, first_rank), (second, second_rank) = results
+        self.assertEqual((first, second), ('Acme Corp', 'Globex'))
+        self.assertGreater(first_rank, second_rank)
+
+    def test_index_follows_queryset_update_and_delete(self):
+        Lead.objects.filter(pk=self.initech.pk).update(name='Umbrella', email='hello@umbrella.com')
+        self.assertEqual(search(Lead, 'initech'), [])
+        self.assertEqual(search(Lead, 'umbrella'), ['Umbrella'])
+        Lead.objects.filter(pk=self.initech.pk).delete()
+        self.assertEqual(search(Lead, 'umbrella'), [])
+
+    def test_lead_triggers_survive_the_table_rebuild(self):
+        # 0008 added columns to crm_lead, which SQLite does by rebuilding the table
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'crm_lead'")
+            triggers = {name for name, in cursor.fetchall()}
+        self.assertEqual(triggers, {'crm_lead_fts_insert', 'crm_lead_fts_delete', 'crm_lead_fts_update'})
+        Lead.objects.bulk_create([Lead(name='Hooli', email='hi@hooli.com')])
+        self.assertEqual(search(Lead, 'hooli'), ['Hooli'])
+
+
+class GlobalSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('agent', password='secret')
+        cls.lead = Lead.objects.create(name='Acme Corp', email='info@acme.com', owner=cls.user)
+        Lead.objects.create(name='Globex', email='sales@globex.com', owner=cls.user)
+        Contact.objects.create(lead=cls.lead, name='Wile Coyote', email='wile@acme.com')
+        Note.objects.create(lead=cls.lead, author=cls.user, content='Acme wants a quote')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_results_are_grouped_by_type(self):
+        response = self.client.get('/api/search/', {'q': 'acme'})
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual(list(results), ['leads', 'contacts', 'notes', 'correspondences'])
+        self.assertEqual([lead['name'] for lead in results['leads']], ['Acme Corp'])
+        self.assertEqual([contact['name'] for contact in results['contacts']], ['Wile Coyote'])
+        self.assertEqual([note['content'] for note in results['notes']], ['Acme wants a quote'])
+        self.assertEqual(results['correspondences'], [])
+        self.assertIn('rank', results['leads'][0])
+
+    def test_types_and_limit(self):
+        Lead.objects.create(name='Acme East', email='east@acme.com')
+        response = self.client.get('/api/search/', {'q': 'acme', 'types': 'leads,notes', 'limit': 1})
+        self.assertEqual(list(response.data['results']), ['leads', 'notes'])
+        self.assertEqual(len(response.data['results']['leads']), 1)
+
+    def test_text_without_words_finds_nothing(self):
+        response = self.client.get('/api/search/', {'q': '...'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any(response.data['results'].values()))
+
+    def test_invalid_requests(self):
+        for params in ({}, {'q': ' '}, {'q': 'acme', 'types': 'leads,users'}, {'q': 'acme', 'limit': 'x'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/search/', params).status_code, 400)
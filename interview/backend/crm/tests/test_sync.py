@@ -0,0 +1,141 @@
+import json
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from crm.models import Contact, Lead, Tombstone
+from crm.sync import encode_sync_cursor
+
+
+User = get_user_model()
+
+
+class TombstoneTests(TestCase):
+    """Deletes leave one tombstone per row, written with one INSERT."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', password='secret', role='manager')
+        leads = Lead.objects.bulk_create([Lead(name=f'Lead {i}', company='Acme', owner=cls.manager) for i in range(20)])
+        Contact.objects.bulk_create([Contact(lead=lead, name=f'Contact {lead.pk}') for lead in leads])
+        cls.lead_ids = [lead.pk for lead in leads]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def tombstone_inserts(self, queries):
+        return [query for query in queries if query['sql'].startswith('INSERT INTO "crm_tombstone"')]
+
+    def test_bulk_destroy(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete('/api/leads/bulk/', {'ids': self.lead_ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.tombstone_inserts(queries)), 1)
+        # The leads and the contacts deleted with them
+        self.assertEqual(Tombstone.objects.filter(model_name='lead').count(), 20)
+        self.assertEqual(Tombstone.objects.filter(model_name='contact').count(), 20)
+
+    def test_destroy_with_cascade(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(f'/api/leads/{self.lead_ids[0]}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(len(self.tombstone_inserts(queries)), 1)
+        self.assertEqual(
+            sorted(Tombstone.objects.values_list('model_name', flat=True)), ['contact', 'lead']
+        )
+
+
+@override_settings(SYNC_SETTLE_SECONDS=5)
+class ChangesFeedTests(TestCase):
+    """The NDJSON feed of rows changed and deleted since a cursor."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('agent', password='secret')
+        cls.leads = Lead.objects.bulk_create([Lead(name=f'Lead {i}', owner=cls.user) for i in range(5)])
+        cls.past = timezone.now() - timedelta(minutes=10)
+        # Every row settled, in id order within one timestamp
+        Lead.objects.update(updated_at=cls.past)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sync(self, cursor=None, **params):
+        if cursor:
+            params['updated_since'] = cursor
+        response = self.client.get('/api/leads/changes/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        *changes, last = lines
+        self.assertEqual(last['op'], 'cursor')
+        return changes, last['cursor'], last['more']
+
+    def upserted(self, changes):
+        return [change['data']['id'] for change in changes if change['op'] == 'upsert']
+
+    def test_full_sync_then_only_changes(self):
+        changes, cursor, more = self.sync()
+        self.assertEqual(self.upserted(changes), [lead.id for lead in self.leads])
+        self.assertFalse(more)
+
+        changes, cursor, _ = self.sync(cursor)
+        self.assertEqual(changes, [])
+
+        lead = self.leads[1]
+        Lead.objects.filter(pk=lead.pk).update(name='Renamed', updated_at=timezone.now() - timedelta(minutes=1))
+        changes, cursor, _ = self.sync(cursor)
+        self.assertEqual(self.upserted(changes), [lead.id])
+        self.assertEqual(changes[0]['data']['name'], 'Renamed')
+        self.assertEqual(self.sync(cursor)[0], [])
+
+    def test_limit_pages_through_rows(self):
+        ids, cursor, pages = [], None, 0
+        while True:
+            changes, cursor, more = self.sync(cursor, limit=2)
+            self.assertLessEqual(len(changes), 2)
+            ids += self.upserted(changes)
+            pages += 1
+            if not more:
+                break
+        self.assertEqual(ids, [lead.id for lead in self.leads])
+        self.assertEqual(pages, 3)
+
+    def test_recent_writes_wait_for_the_settle_window(self):
+        _, cursor, _ = self.sync()
+        lead = self.leads[0]
+        lead.name = 'Just now'
+        lead.save()
+        self.assertEqual(self.sync(cursor)[0], [])
+        with override_settings(SYNC_SETTLE_SECONDS=0):
+            changes, _, _ = self.sync(cursor)
+        self.assertEqual(self.upserted(changes), [lead.id])
+
+    def test_deletes_since_the_cursor(self):
+        Tombstone.objects.create(model_name='lead', object_id=999, deleted_at=self.past)
+        # A full sync does not report earlier deletes
+        changes, cursor, _ = self.sync()
+        self.assertNotIn('delete', [change['op'] for change in changes])
+
+        lead_id = self.leads[2].id
+        Lead.objects.filter(pk=lead_id).delete()
+        Tombstone.objects.filter(object_id=lead_id).update(deleted_at=timezone.now() - timedelta(minutes=1))
+        changes, cursor, _ = self.sync(cursor)
+        self.assertEqual([(change['op'], change['id']) for change in changes], [('delete', lead_id)])
+        self.assertEqual(self.sync(cursor)[0], [])
+
+    def test_expired_and_invalid_cursors(self):
+        expired = encode_sync_cursor(timezone.now() - timedelta(days=91), None, None)
+        response = self.client.get('/api/leads/changes/', {'updated_since': expired})
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(response.data['detail'].code, 'cursor_expired')
+        for params in ({'updated_since': 'garbage'}, {'limit': '0'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/leads/changes/', params).status_code, 400)
@@ -2,8 +2,11 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     LeadViewSet, ContactViewSet, NoteViewSet, 
-    ReminderViewSet, CorrespondenceViewSet, AuditLogViewSet,
-    dashboard_stats, export_leads_csv
+    ReminderViewSet, CorrespondenceViewSet, AuditLogViewSet, ExportJobViewSet,
+    ImportJobViewSet, DuplicateCandidateViewSet,
+    dashboard_stats, live_events, database_pool_stats, export_leads_csv,
+    analytics_leads_created, analytics_value_by_status, analytics_conversions,
+    global_search
 )
 
 router = DefaultRouter()
@@ -13,11 +16,20 @@ router.register(r'notes', NoteViewSet, basename='note')
 router.register(r'reminders', ReminderViewSet, basename='reminder')
 router.register(r'correspondences', CorrespondenceViewSet, basename='correspondence')
 router.register(r'audit-logs', AuditLogViewSet, basename='auditlog')
+router.register(r'exports', ExportJobViewSet, basename='exportjob')
+router.register(r'imports', ImportJobViewSet, basename='importjob')
+router.register(r'duplicates', DuplicateCandidateViewSet, basename='duplicatecandidate')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('dashboard/stats/', dashboard_stats, name='dashboard-stats'),
+    path('events/', live_events, name='live-events'),
+    path('metrics/db-pool/', database_pool_stats, name='database-pool-stats'),
     path('leads/export/csv/', export_leads_csv, name='export-leads-csv'),
+    path('analytics/leads-created/', analytics_leads_created, name='analytics-leads-created'),
+    path('analytics/value-by-status/', analytics_value_by_status, name='analytics-value-by-status'),
+    path('analytics/conversions/', analytics_conversions, name='analytics-conversions'),
+    path('search/', global_search, name='global-search'),
 ]
 
 
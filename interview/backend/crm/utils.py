@@ -1,10 +1,59 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
 from .models import AuditLog
+from .analytics import mark_days_dirty, to_day
+from .cache import bump_version_on_commit
+from .events import publish_audit_entries
+
+
+# Entries collected by the innermost active audit_buffer(), if any
+_audit_buffer = ContextVar('audit_buffer', default=None)
+
+# Relations each model's __str__ reads, loaded in one query for bulk logging
+AUDIT_REPR_RELATED = {
+    'Contact': ['lead'],
+    'Note': ['author', 'lead'],
+}
+
+
+def get_client_ip(request):
+    """Return the client IP address of a request, honouring X-Forwarded-For."""
+    if not request:
+        return None
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if x_forwarded_for:
+        return x_forwarded_for.split(',')[0]
+    return request.META.get('REMOTE_ADDR')
+
+
+def build_audit_entry(user, action, instance, changes=None, ip_address=None):
+    return AuditLog(
+        user=user,
+        action=action,
+        model_name=instance.__class__.__name__,
+        object_id=instance.id,
+        object_repr=str(instance),
+        changes=changes or {},
+        ip_address=ip_address,
+        timestamp=timezone.now(),
+    )
 
 
 def log_model_change(user, action, instance, changes=None, request=None):
     """
     Utility function to log model changes to the audit trail.
-    
+
+    The entry is written once the surrounding transaction commits. Inside an
+    audit_buffer() it is batched with the other entries of the request or
+    task and written with a single bulk INSERT.
+
     Args:
         user: The user who made the change
         action: The action performed (create, update, delete)
@@ -12,22 +61,101 @@ def log_model_change(user, action, instance, changes=None, request=None):
         changes: Dictionary of field changes (for updates)
         request: The HTTP request object (to get IP address)
     """
-    ip_address = None
-    if request:
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip_address = x_forwarded_for.split(',')[0]
-        else:
-            ip_address = request.META.get('REMOTE_ADDR')
-    
-    AuditLog.objects.create(
-        user=user,
-        action=action,
-        model_name=instance.__class__.__name__,
-        object_id=instance.id,
-        object_repr=str(instance),
-        changes=changes or {},
-        ip_address=ip_address
-    )
+    entry = build_audit_entry(user, action, instance, changes, get_client_ip(request))
+    queue_audit_entries([entry])
+
+
+def log_model_changes(user, action, instances, changes=None, request=None):
+    """
+    Log the same action for many instances at once, for bulk write paths.
+
+    Args:
+        changes: Optional dict mapping instance id to its field changes
+    """
+    instances = list(instances)
+    if not instances:
+        return
+    related = AUDIT_REPR_RELATED.get(instances[0].__class__.__name__)
+    if related:
+        prefetch_related_objects(instances, *related)
+    ip_address = get_client_ip(request)
+    changes = changes or {}
+    queue_audit_entries([
+        build_audit_entry(user, action, instance, changes.get(instance.id), ip_address)
+        for instance in instances
+    ])
+
+
+def queue_audit_entries(entries):
+    """Hand entries to the active buffer, or write them, after commit."""
+    buffer = _audit_buffer.get()
+    if buffer is not None:
+        transaction.on_commit(lambda: buffer.extend(entries))
+    else:
+        transaction.on_commit(lambda: flush_audit_entries(entries))
+
+
+@contextmanager
+def audit_buffer():
+    """
+    Collect audit entries logged inside the block and write them together.
+    Entries only join the buffer once their own transaction commits, so
+    rolled-back changes are never logged. Nested buffers join the outer one.
+    """
+    if _audit_buffer.get() is not None:
+        yield _audit_buffer.get()
+        return
+
+    entries = []
+    token = _audit_buffer.set(entries)
+    try:
+        yield entries
+    finally:
+        _audit_buffer.reset(token)
+        transaction.on_commit(lambda: flush_audit_entries(entries))
+
+
+def flush_audit_entries(entries):
+    """Write entries now, or queue them for a worker if AUDIT_LOG_ASYNC is set."""
+    if not entries:
+        return
+    if getattr(settings, 'AUDIT_LOG_ASYNC', False):
+        from .tasks import write_audit_logs
+        write_audit_logs.delay([serialize_audit_entry(entry) for entry in entries])
+    else:
+        write_audit_entries(entries)
+
+
+def write_audit_entries(entries):
+    """
+    Insert audit entries with one bulk_create.
+    bulk_create skips post_save signals, so cache versions and analytics
+    rollups that depend on the audit trail are updated here instead, and
+    the entries are pushed to live dashboards once committed.
+    """
+    AuditLog.objects.bulk_create(entries)
+    transaction.on_commit(lambda: publish_audit_entries(entries))
+    bump_version_on_commit('auditlog')
+    mark_days_dirty('conversions', [
+        to_day(entry.timestamp) for entry in entries
+        if entry.model_name == 'Lead' and 'status' in entry.changes
+    ])
+
+
+def serialize_audit_entry(entry):
+    return {
+        'user_id': entry.user_id,
+        'action': entry.action,
+        'model_name': entry.model_name,
+        'object_id': entry.object_id,
+        'object_repr': entry.object_repr,
+        'changes': entry.changes,
+        'ip_address': entry.ip_address,
+        'timestamp': entry.timestamp.isoformat(),
+    }
 
 
+def deserialize_audit_entry(data):
+    data = dict(data)
+    data['timestamp'] = parse_datetime(data['timestamp'])
+    return AuditLog(**data)
@@ -1,38 +1,369 @@
-from rest_framework import viewsets, status, filters
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework import viewsets, mixins, status, filters
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes, renderer_classes
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from django.utils import timezone
-from django.db.models import Count, Sum, Q
-from django.http import HttpResponse
+from django.db.models import Count, Sum, Q, F, Prefetch, OuterRef, Subquery, IntegerField, Window
+from django.db.models.functions import Coalesce, RowNumber, TruncWeek
+from django.utils.dateparse import parse_date
+from django.http import StreamingHttpResponse, FileResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.conf import settings
+from django.db import transaction
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from users.authentication import QueryParamJWTAuthentication
 import csv
-from .models import Lead, Contact, Note, Reminder, Correspondence, AuditLog
+import json
+import os
+import zlib
+from functools import partial
+from pathlib import Path
+from .models import (
+    Lead, Contact, Note, Reminder, Correspondence, AuditLog, ExportJob, ImportJob,
+    LeadDailyRollup, ConversionDailyRollup, DuplicateCandidate
+)
 from .serializers import (
     LeadSerializer, LeadListSerializer, ContactSerializer, 
-    NoteSerializer, ReminderSerializer, CorrespondenceSerializer, AuditLogSerializer
+    NoteSerializer, ReminderSerializer, CorrespondenceSerializer, AuditLogSerializer,
+    ExportJobSerializer, ImportJobSerializer, DuplicateCandidateSerializer, LeadMergeSerializer,
+    LeadSyncSerializer
+)
+from .permissions import IsManagerOrReadOnly, IsManager
+from .utils import log_model_change, log_model_changes, AUDIT_REPR_RELATED
+from .signals import bulk_saved, collect_tombstones
+from .tasks import start_export_job, import_leads
+from .exports import stalled_since
+from .imports import save_upload, run_import_job
+from .dashboard import get_dashboard_stats
+from .dbpool import pool_stats
+from .routers import replica_reads
+from .parallel import run_queries
+from .events import (
+    ACTIVITY_CHANNEL, STATS_CHANNEL, RECONNECT_DELAY, BrokerUnavailable, EventStream, StreamsExhausted, user_channel
 )
-from .permissions import IsManagerOrReadOnly
-from .utils import log_model_change
+from .renderers import EventStreamRenderer
+from .audit_archive import audit_history, ArchivedEntries, ChainedResults
+from .duplicates import find_lead_duplicates, merge_leads
+from .conditional import ConditionalGetMixin, conditional_response, make_etag
+from .sync import ChangesFeedMixin
+from .search import FullTextSearchFilter, RankedOrderingFilter, full_text_search, is_searchable, rank_order
+
+
+def child_count(model, fk='lead'):
+    """
+    Correlated COUNT subquery of `model` rows pointing at the outer row,
+    so counts come back in the same query instead of one query per row.
+    """
+    counts = (
+        model.objects.filter(**{fk: OuterRef('pk')})
+        .order_by()
+        .values(fk)
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def first_per_lead(queryset, ordering, limit):
+    """
+    Limit a child queryset to the first `limit` rows per lead.
+    Uses a ROW_NUMBER() window so it works both for a single lead and for
+    a page of leads inside a Prefetch.
+    """
+    order_by = [F(field[1:]).desc() if field.startswith('-') else F(field).asc() for field in ordering]
+    return (
+        queryset.annotate(_rank=Window(RowNumber(), partition_by=F('lead'), order_by=order_by))
+        .filter(_rank__lte=limit)
+        .order_by(*ordering)
+    )
+
+
+class AuditedModelMixin:
+    """
+    Log creates, updates and deletes to the audit trail.
+    Update diffs come from the change tracking the model does while saving,
+    so the instance is not fetched a second time.
+    """
+    
+    def get_create_kwargs(self, validated_data):
+        """Extra attributes to set on newly created instances."""
+        return {}
+    
+    def perform_create(self, serializer):
+        serializer.save(**self.get_create_kwargs(serializer.validated_data))
+        # Log the creation
+        log_model_change(
+            user=self.request.user,
+            action='create',
+            instance=serializer.instance,
+            request=self.request
+        )
+    
+    def perform_update(self, serializer):
+        serializer.save()
+        changes = {
+            field: {'old': str(old_value), 'new': str(new_value)}
+            for field, (old_value, new_value) in serializer.instance.saved_changes.items()
+        }
+        # Log the update
+        log_model_change(
+            user=self.request.user,
+            action='update',
+            instance=serializer.instance,
+            changes=changes,
+            request=self.request
+        )
+    
+    def perform_destroy(self, instance):
+        # Log the deletion
+        log_model_change(
+            user=self.request.user,
+            action='delete',
+            instance=instance,
+            request=self.request
+        )
+        # Deleting a lead cascades to its contacts, each needing a tombstone
+        with transaction.atomic(), collect_tombstones():
+            instance.delete()
+
+
+class BulkModelMixin:
+    """
+    Bulk create, update and delete on `<resource>/bulk/`.
+    
+    - POST takes a list of objects to create.
+    - PATCH takes a list of partial objects, each with its `id`.
+    - DELETE takes `{"ids": [...]}` and follows the view's permissions, so
+      IsManagerOrReadOnly still limits it to managers.
+    
+    Every row is validated, valid rows are written with one bulk query in a
+    single transaction and audited in bulk, and invalid rows are reported by
+    index. Pass `?atomic=true` to write nothing if any row is invalid.
+    """
+    
+    def get_bulk_rows(self, request, key=None):
+        """Return (rows, error_response) for a bulk request body."""
+        rows = request.data.get(key) if key and isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list) or not rows:
+            expected = f'"{key}" must be a non-empty list.' if key else 'Expected a non-empty list.'
+            return None, Response({'detail': expected}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > settings.BULK_MAX_ROWS:
+            return None, Response(
+                {'detail': f'At most {settings.BULK_MAX_ROWS} rows per request.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return rows, None
+    
+    def bulk_response(self, results, errors, success_status):
+        """Per-row outcome: 207 Multi-Status when only some rows succeeded."""
+        if errors and not results:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif errors:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = success_status
+        return Response({'results': results, 'errors': errors}, status=response_status)
+    
+    def is_atomic(self, request):
+        return request.query_params.get('atomic') in ('1', 'true', 'True')
+    
+    def validate_rows(self, rows, partial=False):
+        """Validate each row, returning ([(index, validated_data)], errors)."""
+        serializer = self.get_serializer(partial=partial)
+        valid, errors = [], []
+        for index, row in enumerate(rows):
+            try:
+                valid.append((index, serializer.run_validation(row)))
+            except ValidationError as exc:
+                errors.append({'index': index, 'errors': exc.detail})
+        return valid, errors
+    
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request):
+        """Create many objects in one request."""
+        rows, error = self.get_bulk_rows(request)
+        if error:
+            return error
+        valid, errors = self.validate_rows(rows)
+        if errors and self.is_atomic(request):
+            return self.bulk_response([], errors, status.HTTP_201_CREATED)
+        
+        model = self.get_queryset().model
+        instances = []
+        for _, validated_data in valid:
+            instance = model(**validated_data, **self.get_create_kwargs(validated_data))
+            instance.update_derived_fields()
+            instances.append(instance)
+        
+        with transaction.atomic():
+            model.objects.bulk_create(instances, batch_size=500)
+            for instance in instances:
+                instance.mark_saved()
+            log_model_changes(user=request.user, action='create', instances=instances, request=request)
+            transaction.on_commit(lambda: bulk_saved(model, instances))
+        
+        results = [{'index': index, 'id': instance.id} for (index, _), instance in zip(valid, instances)]
+        return self.bulk_response(results, errors, status.HTTP_201_CREATED)
+    
+    @bulk_create.mapping.patch
+    def bulk_update(self, request):
+        """Update many objects in one request; each row needs its `id`."""
+        rows, error = self.get_bulk_rows(request)
+        if error:
+            return error
+        
+        model = self.get_queryset().model
+        ids = [row.get('id') for row in rows if isinstance(row, dict) and isinstance(row.get('id'), int)]
+        related = AUDIT_REPR_RELATED.get(model.__name__, [])
+        existing = self.get_queryset().select_related(*related).in_bulk(ids)
+        
+        valid, errors = self.validate_rows(rows, partial=True)
+        updates = []
+        for index, validated_data in valid:
+            pk = rows[index].get('id')
+            instance = existing.get(pk) if isinstance(pk, int) else None
+            if instance is None:
+                message = 'Not found.' if isinstance(pk, int) else 'A valid integer is required.'
+                errors.append({'index': index, 'errors': {'id': [message]}})
+                continue
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.update_derived_fields()
+            updates.append((index, instance))
+        errors.sort(key=lambda error: error['index'])
+        if errors and self.is_atomic(request):
+            return self.bulk_response([], errors, status.HTTP_200_OK)
+        
+        now = timezone.now()
+        changed, changes, fields = [], {}, set()
+        for _, instance in updates:
+            instance_changes = instance.get_changes()
+            if instance_changes:
+                fields.update(instance_changes)
+                instance.updated_at = now
+                changed.append(instance)
+                changes[instance.id] = {
+                    field: {'old': str(old_value), 'new': str(new_value)}
+                    for field, (old_value, new_value) in instance_changes.items()
+                    if field not in instance.derived_fields
+                }
+        
+        with transaction.atomic():
+            if changed:
+                model.objects.bulk_update(changed, [*fields, 'updated_at'], batch_size=500)
+                transaction.on_commit(lambda: bulk_saved(model, changed))
+            for _, instance in updates:
+                instance.mark_saved()
+            log_model_changes(
+                user=request.user,
+                action='update',
+                instances=[instance for _, instance in updates],
+                changes=changes,
+                request=request
+            )
+        
+        results = [{'index': index, 'id': instance.id} for index, instance in updates]
+        return self.bulk_response(results, errors, status.HTTP_200_OK)
+    
+    @bulk_create.mapping.delete
+    def bulk_destroy(self, request):
+        """Delete many objects in one request."""
+        ids, error = self.get_bulk_rows(request, key='ids')
+        if error:
+            return error
+        
+        model = self.get_queryset().model
+        related = AUDIT_REPR_RELATED.get(model.__name__, [])
+        valid_ids = [pk for pk in ids if isinstance(pk, int)]
+        existing = self.get_queryset().select_related(*related).in_bulk(valid_ids)
+        errors = [
+            {'index': index, 'errors': {'id': ['Not found.']}}
+            for index, pk in enumerate(ids) if not isinstance(pk, int) or pk not in existing
+        ]
+        if errors and self.is_atomic(request):
+            return self.bulk_response([], errors, status.HTTP_200_OK)
+        
+        instances = list(existing.values())
+        with transaction.atomic(), collect_tombstones():
+            log_model_changes(user=request.user, action='delete', instances=instances, request=request)
+            # Sends post_delete for every object, so caches and rollups follow
+            model.objects.filter(pk__in=existing).delete()
+        
+        results = [
+            {'index': index, 'id': pk}
+            for index, pk in enumerate(ids) if isinstance(pk, int) and pk in existing
+        ]
+        return self.bulk_response(results, errors, status.HTTP_200_OK)
 
 
-class LeadViewSet(viewsets.ModelViewSet):
+class LeadViewSet(ConditionalGetMixin, ChangesFeedMixin, BulkModelMixin, AuditedModelMixin, viewsets.ModelViewSet):
     """
     ViewSet for Lead model with CRUD operations.
     Supports filtering by status, owner, and date.
     """
-    queryset = Lead.objects.all().select_related('owner').prefetch_related('contacts', 'notes', 'reminders')
+    queryset = Lead.objects.all().select_related('owner')
     permission_classes = [IsAuthenticated, IsManagerOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    read_replica = True
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, RankedOrderingFilter]
     filterset_fields = ['status', 'priority', 'owner']
     search_fields = ['name', 'company', 'email', 'phone', 'description']
     ordering_fields = ['created_at', 'updated_at', 'estimated_value', 'status']
     ordering = ['-created_at']
     
+    # Maximum number of nested children rendered on the detail view
+    detail_contacts_limit = 50
+    detail_notes_limit = 50
+    detail_reminders_limit = 50
+    
+    list_actions = ('list', 'my_leads')
+    detail_actions = ('retrieve',)
+    
+    # Children rendered as counts on lists and in full on the detail view
+    conditional_children = ('contacts', 'notes')
+    conditional_detail_children = ('contacts', 'notes', 'reminders')
+    # Owners, note authors and reminder users are rendered nested
+    conditional_versions = ('user',)
+    
+    sync_serializer_class = LeadSyncSerializer
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.list_actions:
+            # List rows only need counts, computed by the database
+            return queryset.annotate(
+                contacts_count=child_count(Contact),
+                notes_count=child_count(Note),
+            )
+        if self.action in self.detail_actions:
+            return self.prefetch_detail_children(queryset)
+        return queryset
+    
+    def prefetch_detail_children(self, queryset):
+        """Prefetch the first contacts, notes and reminders of each lead, with their users."""
+        return queryset.prefetch_related(
+            Prefetch('contacts', queryset=first_per_lead(
+                Contact.objects.all(), ['-is_primary', 'name'], self.detail_contacts_limit
+            )),
+            Prefetch('notes', queryset=first_per_lead(
+                Note.objects.select_related('author'), ['-created_at'], self.detail_notes_limit
+            )),
+            Prefetch('reminders', queryset=first_per_lead(
+                Reminder.objects.select_related('user'), ['reminder_date'], self.detail_reminders_limit
+            )),
+        )
+    
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        # The update is answered with the lead as retrieve renders it. Fetched
+        # again rather than prefetched up front, as DRF drops the prefetched
+        # children of the instance it saved
+        serializer.instance = self.prefetch_detail_children(self.get_queryset()).get(pk=serializer.instance.pk)
+    
     def get_serializer_class(self):
-        if self.action == 'list':
+        if self.action in self.list_actions:
             return LeadListSerializer
         return LeadSerializer
     
@@ -63,124 +394,73 @@ class LeadViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
     
-    def perform_create(self, serializer):
+    def get_create_kwargs(self, validated_data):
         # Set the current user as owner if not specified
-        if not serializer.validated_data.get('owner_id'):
-            serializer.save(owner=self.request.user)
-        else:
-            serializer.save()
-        # Log the creation
-        log_model_change(
-            user=self.request.user,
-            action='create',
-            instance=serializer.instance,
-            request=self.request
-        )
-    
-    def perform_update(self, serializer):
-        old_instance = self.get_object()
-        # Track changes
-        changes = {}
-        for field in ['name', 'company', 'status', 'priority', 'estimated_value']:
-            old_value = getattr(old_instance, field)
-            new_value = serializer.validated_data.get(field, old_value)
-            if old_value != new_value:
-                changes[field] = {'old': str(old_value), 'new': str(new_value)}
-        
-        serializer.save()
-        
-        # Log the update
-        log_model_change(
-            user=self.request.user,
-            action='update',
-            instance=serializer.instance,
-            changes=changes,
-            request=self.request
-        )
-    
-    def perform_destroy(self, instance):
-        # Log the deletion
-        log_model_change(
-            user=self.request.user,
-            action='delete',
-            instance=instance,
-            request=self.request
-        )
-        instance.delete()
+        if not validated_data.get('owner_id'):
+            return {'owner': self.request.user}
+        return {}
     
     @action(detail=True, methods=['get'])
     def audit_log(self, request, pk=None):
         """Get audit log for a specific lead."""
         lead = self.get_object()
-        logs = AuditLog.objects.filter(model_name='Lead', object_id=lead.id)
+        logs = audit_history('Lead', lead.id)
         serializer = AuditLogSerializer(logs, many=True)
         return Response(serializer.data)
     
+    @action(detail=True, methods=['get'])
+    def duplicates(self, request, pk=None):
+        """Get leads that look like duplicates of this lead, best match first."""
+        lead = self.get_object()
+        matches = find_lead_duplicates(lead, limit=50)
+        return Response([{
+            'id': other['id'],
+            'name': other['name'],
+            'company': other['company'],
+            'email': other['email'],
+            'phone': other['phone'],
+            'status': other['status'],
+            'score': score,
+            'reasons': reasons,
+        } for other, score, reasons in matches])
+    
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsManager])
+    def merge(self, request, pk=None):
+        """
+        Merge other leads into this one (managers only).
+        Their contacts, notes and reminders move here and they are deleted.
+        """
+        lead = self.get_object()
+        serializer = LeadMergeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        moved = merge_leads(lead, serializer.validated_data['duplicate_ids'], user=request.user, request=request)
+        lead.refresh_from_db()
+        return Response({
+            'lead': LeadSerializer(lead).data,
+            'moved': moved,
+        })
+    
     @action(detail=False, methods=['get'])
     def my_leads(self, request):
         """Get leads owned by the current user."""
-        leads = self.queryset.filter(owner=request.user)
-        page = self.paginate_queryset(leads)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(leads, many=True)
-        return Response(serializer.data)
+        leads = self.get_queryset().filter(owner=request.user)
+        return self.conditional_list(request, leads)
 
 
-class ContactViewSet(viewsets.ModelViewSet):
+class ContactViewSet(ConditionalGetMixin, ChangesFeedMixin, BulkModelMixin, AuditedModelMixin, viewsets.ModelViewSet):
     """
     ViewSet for Contact model with CRUD operations.
     """
     queryset = Contact.objects.all().select_related('lead')
     serializer_class = ContactSerializer
     permission_classes = [IsAuthenticated, IsManagerOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    read_replica = True
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, RankedOrderingFilter]
     filterset_fields = ['lead', 'is_primary']
     search_fields = ['name', 'email', 'phone', 'position']
     ordering_fields = ['created_at', 'name']
     ordering = ['-is_primary', 'name']
-    
-    def perform_create(self, serializer):
-        serializer.save()
-        # Log the creation
-        log_model_change(
-            user=self.request.user,
-            action='create',
-            instance=serializer.instance,
-            request=self.request
-        )
-    
-    def perform_update(self, serializer):
-        old_instance = self.get_object()
-        # Track changes
-        changes = {}
-        for field in ['name', 'email', 'phone', 'position', 'is_primary']:
-            old_value = getattr(old_instance, field)
-            new_value = serializer.validated_data.get(field, old_value)
-            if old_value != new_value:
-                changes[field] = {'old': str(old_value), 'new': str(new_value)}
-        
-        serializer.save()
-        
-        # Log the update
-        log_model_change(
-            user=self.request.user,
-            action='update',
-            instance=serializer.instance,
-            changes=changes,
-            request=self.request
-        )
-    
-    def perform_destroy(self, instance):
-        # Log the deletion
-        log_model_change(
-            user=self.request.user,
-            action='delete',
-            instance=instance,
-            request=self.request
-        )
-        instance.delete()
+    sync_serializer_class = ContactSerializer
     
     @action(detail=True, methods=['get'])
     def correspondences(self, request, pk=None):
@@ -194,59 +474,57 @@ class ContactViewSet(viewsets.ModelViewSet):
     def audit_log(self, request, pk=None):
         """Get audit log for a specific contact."""
         contact = self.get_object()
-        logs = AuditLog.objects.filter(model_name='Contact', object_id=contact.id)
+        logs = audit_history('Contact', contact.id)
         serializer = AuditLogSerializer(logs, many=True)
         return Response(serializer.data)
 
 
-class NoteViewSet(viewsets.ModelViewSet):
+class NoteViewSet(ConditionalGetMixin, AuditedModelMixin, viewsets.ModelViewSet):
     """
     ViewSet for Note model with CRUD operations.
     """
     queryset = Note.objects.all().select_related('lead', 'author')
     serializer_class = NoteSerializer
+    conditional_versions = ('user',)
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    read_replica = True
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, RankedOrderingFilter]
     filterset_fields = ['lead', 'author']
     search_fields = ['content']
     ordering_fields = ['created_at']
     ordering = ['-created_at']
     
-    def perform_create(self, serializer):
+    def get_create_kwargs(self, validated_data):
         # Set the current user as author
-        serializer.save(author=self.request.user)
+        return {'author': self.request.user}
 
 
-class ReminderViewSet(viewsets.ModelViewSet):
+class ReminderViewSet(ConditionalGetMixin, AuditedModelMixin, viewsets.ModelViewSet):
     """
     ViewSet for Reminder model with CRUD operations.
     """
     queryset = Reminder.objects.all().select_related('lead', 'user')
     serializer_class = ReminderSerializer
+    conditional_versions = ('user',)
+    read_replica = True
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, RankedOrderingFilter]
     filterset_fields = ['lead', 'user', 'status']
     search_fields = ['title', 'description']
     ordering_fields = ['reminder_date', 'created_at']
     ordering = ['reminder_date']
     
-    def perform_create(self, serializer):
+    def get_create_kwargs(self, validated_data):
         # Set the current user if not specified
-        if not serializer.validated_data.get('user_id'):
-            serializer.save(user=self.request.user)
-        else:
-            serializer.save()
+        if not validated_data.get('user_id'):
+            return {'user': self.request.user}
+        return {}
     
     @action(detail=False, methods=['get'])
     def my_reminders(self, request):
         """Get reminders for the current user."""
         reminders = self.queryset.filter(user=request.user, status='pending')
-        page = self.paginate_queryset(reminders)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(reminders, many=True)
-        return Response(serializer.data)
+        return self.conditional_list(request, reminders)
     
     @action(detail=False, methods=['get'])
     def overdue(self, request):
@@ -255,146 +533,502 @@ class ReminderViewSet(viewsets.ModelViewSet):
             status='pending',
             reminder_date__lt=timezone.now()
         )
-        page = self.paginate_queryset(reminders)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(reminders, many=True)
-        return Response(serializer.data)
+        return self.conditional_list(request, reminders)
 
 
-class CorrespondenceViewSet(viewsets.ModelViewSet):
+class CorrespondenceViewSet(ConditionalGetMixin, AuditedModelMixin, viewsets.ModelViewSet):
     """
     ViewSet for Correspondence model with CRUD operations.
     """
     queryset = Correspondence.objects.all().select_related('contact', 'logged_by')
     serializer_class = CorrespondenceSerializer
+    read_replica = True
+    conditional_parents = ('contact',)
+    conditional_versions = ('user',)
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, RankedOrderingFilter]
     filterset_fields = ['contact', 'type', 'logged_by']
     search_fields = ['subject', 'description']
     ordering_fields = ['date', 'created_at']
     ordering = ['-date']
     
-    def perform_create(self, serializer):
+    def get_create_kwargs(self, validated_data):
         # Set the current user as logged_by
-        serializer.save(logged_by=self.request.user)
+        return {'logged_by': self.request.user}
 
 
-class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
+class AuditLogViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet for AuditLog model (read-only).
+    Filter by date with `timestamp__gte` and `timestamp__lt`; pass
+    `include_archived=true` to continue the list into archived months.
     """
     queryset = AuditLog.objects.all().select_related('user')
     serializer_class = AuditLogSerializer
+    conditional_versions = ('user',)
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['user', 'action', 'model_name']
+    read_replica = True
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, RankedOrderingFilter]
+    filterset_fields = {
+        'user': ['exact'],
+        'action': ['exact'],
+        'model_name': ['exact'],
+        'timestamp': ['gte', 'lt'],
+    }
     search_fields = ['object_repr']
     ordering_fields = ['timestamp']
     ordering = ['-timestamp']
+    
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('include_archived') not in ('1', 'true', 'True'):
+            return super().list(request, *args, **kwargs)
+        
+        queryset = self.filter_queryset(self.get_queryset())
+        # Valid by now: filter_queryset() rejects the request otherwise
+        filterset = DjangoFilterBackend().get_filterset(request, self.get_queryset(), self)
+        filterset.is_valid()
+        # Archived months are always older than the rows still in the table
+        oldest_first = request.query_params.get('ordering') == 'timestamp'
+        archived = ArchivedEntries(
+            user=request.query_params.get('user'),
+            action=request.query_params.get('action'),
+            model_name=request.query_params.get('model_name'),
+            search=request.query_params.get('search'),
+            start=filterset.form.cleaned_data.get('timestamp__gte'),
+            end=filterset.form.cleaned_data.get('timestamp__lt'),
+            oldest_first=oldest_first,
+        )
+        if oldest_first:
+            results = ChainedResults(archived, queryset)
+        else:
+            results = ChainedResults(queryset, archived)
+        
+        page = self.paginate_queryset(results)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(list(results), many=True)
+        return Response(serializer.data)
+
+
+class DuplicateCandidateViewSet(ConditionalGetMixin,
+                                mixins.ListModelMixin,
+                                mixins.RetrieveModelMixin,
+                                viewsets.GenericViewSet):
+    """
+    ViewSet for duplicate lead candidates found by the nightly job.
+    Merge a pair through the lead's `merge` action, or dismiss it.
+    """
+    queryset = DuplicateCandidate.objects.all().select_related('lead', 'duplicate')
+    serializer_class = DuplicateCandidateSerializer
+    conditional_parents = ('lead', 'duplicate')
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['status', 'lead', 'duplicate']
+    ordering_fields = ['score', 'created_at']
+    ordering = ['-score', 'id']
+    
+    @action(detail=True, methods=['post'])
+    def dismiss(self, request, pk=None):
+        """Mark a pair as not duplicates so the nightly job stops raising it."""
+        candidate = self.get_object()
+        candidate.status = 'dismissed'
+        candidate.save(update_fields=['status', 'updated_at'])
+        return Response(self.get_serializer(candidate).data)
+
+
+class ExportJobViewSet(ConditionalGetMixin,
+                       mixins.CreateModelMixin,
+                       mixins.ListModelMixin,
+                       mixins.RetrieveModelMixin,
+                       viewsets.GenericViewSet):
+    """
+    ViewSet for background export jobs.
+    Create a job, poll it for progress, then download the finished file.
+    """
+    serializer_class = ExportJobSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['model_name', 'format', 'status']
+    ordering_fields = ['created_at']
+    ordering = ['-created_at']
+    
+    def get_queryset(self):
+        return ExportJob.objects.filter(user=self.request.user)
+    
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+        start_export_job.delay(serializer.instance.id)
+    
+    @action(detail=True, methods=['post'])
+    def resume(self, request, pk=None):
+        """
+        Resume a failed export, or one that stalled without progress for
+        EXPORT_STALLED_SECONDS, from its last finished chunk.
+        """
+        job = self.get_object()
+        if job.status == 'completed':
+            return Response({'detail': 'Export already completed.'}, status=status.HTTP_400_BAD_REQUEST)
+        # Taken over in one UPDATE, so concurrent resumes start the job once
+        resumed = ExportJob.objects.filter(
+            Q(status='failed') | Q(updated_at__lt=stalled_since()),
+            id=job.id,
+        ).exclude(status='completed').update(status='pending', updated_at=timezone.now())
+        if not resumed:
+            return Response({'detail': 'Export is still running.'}, status=status.HTTP_409_CONFLICT)
+        start_export_job.delay(job.id)
+        job.refresh_from_db()
+        return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Download the finished export file."""
+        job = self.get_object()
+        if job.status != 'completed':
+            return Response({'detail': 'Export is not finished yet.'}, status=status.HTTP_409_CONFLICT)
+        path = Path(settings.EXPORT_ROOT) / job.file_path
+        if not path.exists():
+            return Response({'detail': 'Export file is no longer available.'}, status=status.HTTP_410_GONE)
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name)
+
+
+class ImportJobViewSet(ConditionalGetMixin,
+                       mixins.CreateModelMixin,
+                       mixins.ListModelMixin,
+                       mixins.RetrieveModelMixin,
+                       viewsets.GenericViewSet):
+    """
+    ViewSet for lead imports from CSV or JSON Lines uploads.
+    Small files are imported within the request; larger ones are handed to
+    a Celery worker and can be polled for progress.
+    """
+    serializer_class = ImportJobSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['format', 'status']
+    ordering_fields = ['created_at']
+    ordering = ['-created_at']
+    
+    def get_queryset(self):
+        return ImportJob.objects.filter(user=self.request.user)
+    
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.validated_data.pop('file')
+        job = serializer.save(user=request.user, file_name=upload.name[:255])
+        save_upload(job, upload)
+        
+        if job.file_size <= settings.IMPORT_SYNC_MAX_BYTES:
+            try:
+                run_import_job(job, request=request)
+            except Exception:
+                # A malformed file fails the job, which records the error
+                pass
+            job.refresh_from_db()
+            return Response(self.get_serializer(job).data, status=status.HTTP_201_CREATED)
+        import_leads.delay(job.id)
+        return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=True, methods=['post'])
+    def retry(self, request, pk=None):
+        """Run a failed import again; rows imported the first time are skipped."""
+        job = self.get_object()
+        if job.status != 'failed':
+            return Response({'detail': 'Only failed imports can be retried.'}, status=status.HTTP_400_BAD_REQUEST)
+        import_leads.delay(job.id)
+        return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)
 
 
+@replica_reads
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def dashboard_stats(request):
     """
     Get dashboard statistics for the current user.
     Returns counts, values, and distributions of leads.
+    The ETag is a digest of the cached statistics, so unchanged stats are
+    answered with 304 without being rendered again.
     """
-    # Get all leads for statistics
-    all_leads = Lead.objects.all()
-    user_leads = all_leads.filter(owner=request.user)
-    
-    # Basic counts
-    total_leads = all_leads.count()
-    user_total_leads = user_leads.count()
-    
-    # Status distribution
-    status_distribution = dict(
-        all_leads.values('status')
-        .annotate(count=Count('id'))
-        .values_list('status', 'count')
+    stats = get_dashboard_stats(request.user)
+    etag = make_etag(request, [json.dumps(stats, sort_keys=True, cls=DjangoJSONEncoder)])
+    return conditional_response(request, etag, lambda: Response(stats))
+
+
+@api_view(['GET'])
+@authentication_classes([QueryParamJWTAuthentication])
+@permission_classes([IsAuthenticated])
+@renderer_classes([EventStreamRenderer])
+def live_events(request):
+    """
+    Server-Sent Events stream of new activity, the current user's due
+    reminders and dashboard counter changes, replacing polling.
+    EventSource cannot send headers, so the access token may be passed as
+    `?token=`. The stream ends after a few minutes and the browser
+    reconnects; fetch the dashboard stats again when it does.
+    Answers 503 with Retry-After when the process already serves
+    EVENTS_MAX_STREAMS streams or the broker is down; EventSource does not
+    retry those by itself.
+    """
+    channels = [ACTIVITY_CHANNEL, STATS_CHANNEL, user_channel(request.user.id)]
+    try:
+        stream = EventStream(channels)
+    except StreamsExhausted:
+        detail = 'Too many live event streams are open, try again later.'
+    except BrokerUnavailable:
+        detail = 'Live events are unavailable, try again later.'
+    else:
+        detail = None
+    if detail:
+        return Response(
+            {'detail': detail},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={'Retry-After': str(RECONNECT_DELAY // 1000)}
+        )
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsManager])
+def database_pool_stats(request):
+    """
+    Usage of the database connection pools (DB_POOL=True) of the worker
+    process that answers: open, idle and in use connections, threads
+    waiting for one, and running totals of checkouts, waits, timeouts and
+    failed health checks. Each worker has its own pools.
+    """
+    return Response({'pid': os.getpid(), 'pools': pool_stats()})
+
+
+def parse_analytics_params(request):
+    """
+    Read `start`, `end` (YYYY-MM-DD, inclusive), `interval` (day or week)
+    and `owner` from the query string. Returns (params, error_response).
+    """
+    params = {}
+    for name in ('start', 'end'):
+        value = request.GET.get(name)
+        params[name] = parse_date(value) if value else None
+        if value and params[name] is None:
+            return None, Response({'detail': f'Invalid {name} date, expected YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+    params['interval'] = request.GET.get('interval', 'day')
+    if params['interval'] not in ('day', 'week'):
+        return None, Response({'detail': 'interval must be day or week.'}, status=status.HTTP_400_BAD_REQUEST)
+    params['owner'] = request.GET.get('owner')
+    return params, None
+
+
+def rollup_series(queryset, params, group_by, metrics):
+    """Aggregate rollup rows into one entry per period and group."""
+    if params['start']:
+        queryset = queryset.filter(day__gte=params['start'])
+    if params['end']:
+        queryset = queryset.filter(day__lte=params['end'])
+    if params['owner']:
+        queryset = queryset.filter(owner_id=params['owner'])
+    period = TruncWeek('day') if params['interval'] == 'week' else F('day')
+    rows = (
+        queryset.annotate(period=period)
+        .order_by()
+        .values('period', *group_by)
+        .annotate(**{name: Sum(field) for name, field in metrics.items()})
+        .order_by('period', *group_by)
     )
+    return list(rows)
+
+
+@replica_reads
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def analytics_leads_created(request):
+    """
+    Leads created per day or week, read from the daily rollups.
+    """
+    params, error = parse_analytics_params(request)
+    if error:
+        return error
+    rows = rollup_series(LeadDailyRollup.objects.all(), params, [], {
+        'leads_created': 'leads_created',
+        'value_created': 'value_created',
+    })
+    return Response(rows)
+
+
+@replica_reads
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def analytics_value_by_status(request):
+    """
+    Count and estimated value of created leads per period, by current status.
+    """
+    params, error = parse_analytics_params(request)
+    if error:
+        return error
+    rows = rollup_series(LeadDailyRollup.objects.all(), params, ['status'], {
+        'leads': 'leads_created',
+        'value': 'value_created',
+    })
+    return Response(rows)
+
+
+@replica_reads
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def analytics_conversions(request):
+    """
+    Conversions per period and owner, read from the daily rollups.
+    """
+    params, error = parse_analytics_params(request)
+    if error:
+        return error
+    rows = rollup_series(ConversionDailyRollup.objects.all(), params, ['owner', 'owner__username'], {
+        'conversions': 'conversions',
+        'converted_value': 'converted_value',
+    })
+    return Response(rows)
+
+
+# Result type: (viewset whose search_fields are the fallback, fields returned)
+GLOBAL_SEARCH_TYPES = {
+    'leads': (LeadViewSet, ['id', 'name', 'company', 'email', 'status']),
+    'contacts': (ContactViewSet, ['id', 'lead', 'name', 'email', 'position']),
+    'notes': (NoteViewSet, ['id', 'lead', 'author', 'content', 'created_at']),
+    'correspondences': (CorrespondenceViewSet, ['id', 'contact', 'type', 'subject', 'date']),
+}
+GLOBAL_SEARCH_MAX_LIMIT = 50
+
+
+def search_results(viewset, fields, text, limit):
+    queryset = viewset.queryset.model.objects.all()
+    if is_searchable(queryset):
+        queryset = rank_order(full_text_search(queryset, text)).values(*fields, 'search_rank')
+    else:
+        query = Q()
+        for field in viewset.search_fields:
+            query |= Q(**{f'{field}__icontains': text})
+        queryset = queryset.filter(query).order_by('-pk').values(*fields)
+    results = list(queryset[:limit])
+    for result in results:
+        result['rank'] = result.pop('search_rank', None)
+    return results
+
+
+@replica_reads
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def global_search(request):
+    """
+    Search leads, contacts, notes and correspondence at once.
+    Takes `q`, an optional comma-separated `types` and `limit` per type
+    (default 5, at most 50), and returns the best matches grouped by type.
+    """
+    text = request.GET.get('q', '').strip()
+    if not text:
+        return Response({'detail': 'q is required.'}, status=status.HTTP_400_BAD_REQUEST)
+    types = request.GET.get('types')
+    types = types.split(',') if types else list(GLOBAL_SEARCH_TYPES)
+    unknown = [name for name in types if name not in GLOBAL_SEARCH_TYPES]
+    if unknown:
+        return Response({'detail': f'Unknown types: {", ".join(unknown)}.'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = min(max(int(request.GET.get('limit', 5)), 1), GLOBAL_SEARCH_MAX_LIMIT)
+    except ValueError:
+        return Response({'detail': 'limit must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # The searches are independent, so they run concurrently
+    found = run_queries(*[
+        partial(search_results, *GLOBAL_SEARCH_TYPES[name], text, limit)
+        for name in types
+    ])
+    results = dict(zip(types, found))
+    return Response({'query': text, 'results': results})
+
+
+class Echo:
+    """Pseudo-buffer whose write() returns the value, for streaming csv.writer output."""
     
-    # Priority distribution
-    priority_distribution = dict(
-        all_leads.values('priority')
-        .annotate(count=Count('id'))
-        .values_list('priority', 'count')
-    )
+    def write(self, value):
+        return value
+
+
+def gzip_stream(chunks):
+    """Gzip an iterable of strings on the fly, yielding compressed bytes."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+LEAD_EXPORT_HEADER = [
+    'ID',
+    'Name',
+    'Company',
+    'Email',
+    'Phone',
+    'Status',
+    'Priority',
+    'Source',
+    'Owner',
+    'Estimated Value (KES)',
+    'Description',
+    'Created Date',
+    'Last Updated'
+]
+
+LEAD_EXPORT_COLUMNS = [
+    'id', 'name', 'company', 'email', 'phone', 'status', 'priority', 'source',
+    'owner__username', 'estimated_value', 'description', 'created_at', 'updated_at'
+]
+
+
+def lead_csv_rows(leads, chunk_size=2000):
+    """
+    Yield CSV lines for the given leads, reading plain tuples in chunks.
+    On PostgreSQL iterator() uses a server-side cursor, so memory stays flat
+    no matter how many leads are exported.
+    """
+    writer = csv.writer(Echo())
+    status_labels = dict(Lead.STATUS_CHOICES)
+    priority_labels = dict(Lead.PRIORITY_CHOICES)
     
-    # Calculate total estimated value
-    total_value = all_leads.aggregate(
-        total=Sum('estimated_value')
-    )['total'] or 0
-    
-    user_total_value = user_leads.aggregate(
-        total=Sum('estimated_value')
-    )['total'] or 0
-    
-    # Recent activity (last 10 audit logs)
-    recent_activity = AuditLog.objects.select_related('user').order_by('-timestamp')[:10]
-    recent_activity_data = [{
-        'id': log.id,
-        'user': log.user.username if log.user else 'System',
-        'action': log.get_action_display(),
-        'model': log.model_name,
-        'object': log.object_repr,
-        'timestamp': log.timestamp
-    } for log in recent_activity]
-    
-    # Upcoming reminders
-    upcoming_reminders = Reminder.objects.filter(
-        user=request.user,
-        status='pending',
-        reminder_date__gte=timezone.now()
-    ).order_by('reminder_date')[:5]
-    
-    upcoming_reminders_data = [{
-        'id': reminder.id,
-        'title': reminder.title,
-        'lead': reminder.lead.name,
-        'date': reminder.reminder_date
-    } for reminder in upcoming_reminders]
-    
-    # Overdue reminders count
-    overdue_reminders_count = Reminder.objects.filter(
-        user=request.user,
-        status='pending',
-        reminder_date__lt=timezone.now()
-    ).count()
-    
-    stats = {
-        'total_leads': total_leads,
-        'user_total_leads': user_total_leads,
-        'new_leads': status_distribution.get('new', 0),
-        'contacted_leads': status_distribution.get('contacted', 0),
-        'qualified_leads': status_distribution.get('qualified', 0),
-        'converted_leads': status_distribution.get('converted', 0),
-        'lost_leads': status_distribution.get('lost', 0),
-        'total_value': float(total_value),
-        'user_total_value': float(user_total_value),
-        'status_distribution': status_distribution,
-        'priority_distribution': priority_distribution,
-        'recent_activity': recent_activity_data,
-        'upcoming_reminders': upcoming_reminders_data,
-        'overdue_reminders_count': overdue_reminders_count,
-        'total_contacts': Contact.objects.count(),
-        'total_notes': Note.objects.count(),
-    }
+    yield writer.writerow(LEAD_EXPORT_HEADER)
     
-    return Response(stats)
+    rows = leads.order_by('-created_at').values_list(*LEAD_EXPORT_COLUMNS).iterator(chunk_size=chunk_size)
+    for (lead_id, name, company, email, phone, status, priority, source,
+         owner, estimated_value, description, created_at, updated_at) in rows:
+        yield writer.writerow([
+            lead_id,
+            name,
+            company,
+            email,
+            phone,
+            status_labels.get(status, status),
+            priority_labels.get(priority, priority),
+            source,
+            owner or 'N/A',
+            estimated_value if estimated_value else 0,
+            description,
+            created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            updated_at.strftime('%Y-%m-%d %H:%M:%S')
+        ])
 
 
+@replica_reads
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def export_leads_csv(request):
     """
     Export leads to CSV format.
+    The file is streamed as rows are read; pass `compress=gzip` to receive
+    a gzipped file compressed on the fly.
     """
-    # Get filtered leads based on query parameters
-    leads = Lead.objects.all().select_related('owner')
+    leads = Lead.objects.all()
     
     # Apply filters if provided
     status = request.GET.get('status')
@@ -408,48 +1042,13 @@ def export_leads_csv(request):
     if owner:
         leads = leads.filter(owner_id=owner)
     
-    # Create HTTP response with CSV content type
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="leads_export.csv"'
-    
-    # Create CSV writer
-    writer = csv.writer(response)
-    
-    # Write header row
-    writer.writerow([
-        'ID',
-        'Name',
-        'Company',
-        'Email',
-        'Phone',
-        'Status',
-        'Priority',
-        'Source',
-        'Owner',
-        'Estimated Value (KES)',
-        'Description',
-        'Created Date',
-        'Last Updated'
-    ])
+    rows = lead_csv_rows(leads)
     
-    # Write data rows
-    for lead in leads:
-        writer.writerow([
-            lead.id,
-            lead.name,
-            lead.company,
-            lead.email,
-            lead.phone,
-            lead.get_status_display(),
-            lead.get_priority_display(),
-            lead.source,
-            lead.owner.username if lead.owner else 'N/A',
-            lead.estimated_value if lead.estimated_value else 0,
-            lead.description,
-            lead.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            lead.updated_at.strftime('%Y-%m-%d %H:%M:%S')
-        ])
+    if request.GET.get('compress') == 'gzip':
+        response = StreamingHttpResponse(gzip_stream(rows), content_type='application/gzip')
+        response['Content-Disposition'] = 'attachment; filename="leads_export.csv.gz"'
+    else:
+        response = StreamingHttpResponse(rows, content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="leads_export.csv"'
     
     return response
-
-
@@ -8,6 +8,7 @@ echo "PostgreSQL started"
 
 echo "Running migrations..."
 python manage.py migrate --noinput
+python manage.py createcachetable
 
 echo "Creating superuser if not exists..."
 python manage.py shell << END
@@ -0,0 +1,103 @@
+"""
+Load test a running server: `--clients` clients each send GET requests for
+`--seconds` seconds, one at a time, and the requests per second and p50/p99
+latencies are reported per path. Start the servers to compare as
+start_prod.sh does, on a database with data, e.g.
+    gunicorn config.wsgi:application --bind 127.0.0.1:8101 --workers 2 --threads 16
+    APP_SERVER=asgi gunicorn config.asgi:application --bind 127.0.0.1:8102 --workers 2 \\
+        --worker-class uvicorn.workers.UvicornWorker
+then run this against each:
+    python scripts/bench_app_servers.py http://127.0.0.1:8101 --username agent --password secret
+
+Unlike the other benchmarks, this one uses the server's own database.
+"""
+
+import argparse
+import http.client
+import json
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+PATHS = ['/api/dashboard/stats/', '/api/search/?q=offer', '/api/leads/']
+
+
+def log_in(host, port, username, password):
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    connection.request(
+        'POST', '/api/auth/login/', json.dumps({'username': username, 'password': password}),
+        {'Content-Type': 'application/json'},
+    )
+    response = connection.getresponse()
+    body = response.read()
+    assert response.status == 200, f'login failed: {response.status} {body[:200]}'
+    return json.loads(body)['access']
+
+
+def load(host, port, path, headers, clients, seconds):
+    """Latencies of the successful requests in seconds, the failures and the elapsed time."""
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+    stop = time.monotonic() + seconds
+
+    def client():
+        connection = http.client.HTTPConnection(host, port, timeout=30)
+        mine = []
+        while time.monotonic() < stop:
+            started = time.perf_counter()
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException) as e:
+                failures.append(repr(e))
+                connection = http.client.HTTPConnection(host, port, timeout=30)
+                continue
+            if response.status != 200:
+                failures.append(response.status)
+                continue
+            mine.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, failures, time.monotonic() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('url', help='base URL of the server')
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=15)
+    parser.add_argument('--path', action='append', dest='paths', help=f'path to load, repeatable (default {PATHS})')
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    headers = {'Authorization': f'Bearer {log_in(url.hostname, url.port, args.username, args.password)}'}
+    print(f'{"path":<24}  {"req/s":>6}  {"p50 ms":>7}  {"p99 ms":>7}  failures')
+    for path in args.paths or PATHS:
+        # Warm the server's caches and connections first
+        load(url.hostname, url.port, path, headers, args.clients, 1)
+        latencies, failures, elapsed = load(url.hostname, url.port, path, headers, args.clients, args.seconds)
+        if not latencies:
+            print(f'{path:<24}  every request failed, e.g. {failures[0]}')
+            continue
+        percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        print(
+            f'{path:<24}  {len(latencies) / elapsed:>6.0f}  {percentiles[49] * 1000:>7.0f}  '
+            f'{percentiles[98] * 1000:>7.0f}  {len(failures)}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark PostgreSQL connection handling under a threaded worker: requests
+per second and connections opened when each request opens its own
+connection (DB_CONN_MAX_AGE=0), when each thread keeps one open
+(DB_CONN_MAX_AGE, the default) and when the threads share a pool
+(DB_POOL=True). Requests go through Django's WSGI handler, so connections
+are closed or returned at the end of each as under gunicorn.
+    python scripts/bench_db_connections.py --threads 16 --requests 100
+
+Needs PostgreSQL (DB_ENGINE=postgresql and the DB_* settings). Each mode
+runs in its own process. Connecting costs more over TCP with TLS than over
+a local socket, so the gap grows with the distance to the server.
+"""
+
+import argparse
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from benchutil import seed, setup_database
+
+
+MODES = {
+    'connect': {'DB_CONN_MAX_AGE': '0', 'DB_POOL': 'False'},
+    'persistent': {'DB_CONN_MAX_AGE': '60', 'DB_POOL': 'False'},
+    'pool': {'DB_POOL': 'True'},
+}
+
+
+def run_mode(args):
+    """Serve the requests in this process and print one result line."""
+    setup_database()
+    from django.conf import settings
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.db import connection, connections
+    from django.db.backends.signals import connection_created
+    from crm.dbpool import get_pool
+    from django.test import RequestFactory
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    assert connection.vendor == 'postgresql', 'needs DB_ENGINE=postgresql'
+    users = seed(leads=200, contacts=200, notes=200)
+    handler = WSGIHandler()
+    environ = RequestFactory()._base_environ(
+        PATH_INFO=args.path, REQUEST_METHOD='GET', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(users[0])}'
+    )
+    connections.close_all()
+
+    opened = 0
+    lock = threading.Lock()
+
+    def count_connection(**kwargs):
+        nonlocal opened
+        with lock:
+            opened += 1
+
+    connection_created.connect(count_connection)
+    pool = get_pool(connection.alias, connection.settings_dict) if settings.DB_POOL else None
+    pool_opened = pool.counters['connections_opened'] if pool else 0
+    failures = []
+
+    def worker():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT current_database()')
+            assert cursor.fetchone()[0] == connection.settings_dict['NAME']
+        for _ in range(args.requests):
+            statuses = []
+            body = handler({**environ, 'wsgi.input': io.BytesIO()}, lambda status, headers, exc_info=None: statuses.append(status))
+            b''.join(body)
+            body.close()
+            if not statuses[0].startswith('200'):
+                failures.append(statuses[0])
+        connections.close_all()
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    assert not failures, f'{len(failures)} requests failed, e.g. {failures[0]}'
+    if pool:
+        # Borrowing from the pool sends connection_created too; count the real connects
+        opened = pool.counters['connections_opened'] - pool_opened
+        # Leave no connection open, or the test database cannot be dropped
+        pool.flush()
+
+    total = args.threads * args.requests
+    engine = settings.DATABASES['default']['ENGINE'].rsplit('.', 1)[-1]
+    print(f'{args.mode:<10}  {engine:<10}  {total / elapsed:>6.0f}  {elapsed / total * args.threads * 1000:>7.1f}  {opened:>11}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=100, help='requests per thread')
+    parser.add_argument('--path', default='/api/leads/')
+    parser.add_argument('--pool-size', type=int, help='DB_POOL_MAX_SIZE, by default the threads plus query threads')
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        return run_mode(args)
+
+    pool_size = {'DB_POOL_MAX_SIZE': str(args.pool_size)} if args.pool_size else {}
+    print(f'{"mode":<10}  {"engine":<10}  {"req/s":>6}  {"ms/req":>7}  {"connections":>11}')
+    for mode, env in MODES.items():
+        subprocess.run(
+            [sys.executable, __file__, '--mode', mode, '--threads', str(args.threads),
+             '--requests', str(args.requests), '--path', args.path],
+            # Contended requests would be logged as slow, interleaved with the table
+            env={
+                **os.environ, **env, **pool_size,
+                'APP_SERVER_THREADS': str(args.threads), 'PERF_SLOW_REQUEST_MS': '60000',
+            },
+            check=True,
+        )
+
+
+if __name__ == '__main__':
+    main()
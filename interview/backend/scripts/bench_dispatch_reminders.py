@@ -0,0 +1,101 @@
+"""
+Benchmark sending due reminders: reminders per second and queries for a
+backlog that falls due at once, sent by dispatch_due_reminders (locked
+batches over one mail connection) and, for comparison, by the loop
+check_reminders used to run (one email and one save per reminder).
+    python scripts/bench_dispatch_reminders.py --reminders 10000 100000
+
+Mail goes to Django's in-memory test backend, and the scheduler and live
+event notifications are left out, so this measures the database work and
+message building; real SMTP gains more from the reused connection.
+"""
+
+import argparse
+import time
+from datetime import timedelta
+from unittest import mock
+
+from benchutil import seed, setup_database
+
+
+def loop_dispatch(now):
+    """The dispatch before it was batched: one email and one save per reminder."""
+    from django.core.mail import send_mail
+    from crm.reminders import build_reminder_message, get_from_email
+    from crm.models import Reminder
+
+    count = 0
+    for reminder in Reminder.objects.filter(status='pending', reminder_date__lte=now).select_related('user', 'lead'):
+        message = build_reminder_message(reminder)
+        send_mail(message.subject, message.body, get_from_email(), message.to, fail_silently=True)
+        reminder.status = 'sent'
+        reminder.save()
+        count += 1
+    return count
+
+
+def measure(func, count):
+    """Run func(now) over `count` freshly created due reminders; returns (per second, queries)."""
+    from django.core import mail
+    from django.db import connection
+    from django.utils import timezone
+    from crm.models import Lead, Reminder
+
+    Reminder.objects.all()._raw_delete(connection.alias)
+    now = timezone.now()
+    leads = list(Lead.objects.select_related('owner')[:100])
+    Reminder.objects.bulk_create([
+        Reminder(
+            lead=leads[i % len(leads)], user=leads[i % len(leads)].owner, title=f'Follow up {i}',
+            description='Call back about the offer', reminder_date=now - timedelta(minutes=i % 60),
+        )
+        for i in range(count)
+    ], batch_size=2000)
+    mail.outbox = []
+
+    queries = 0
+
+    def count_query(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count_query):
+        started = time.perf_counter()
+        sent = func(now)
+        elapsed = time.perf_counter() - started
+    assert sent == count == len(mail.outbox), f'sent {sent} of {count} reminders'
+    return count / elapsed, queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reminders', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--batch-size', type=int, default=None, help='REMINDER_BATCH_SIZE by default')
+    parser.add_argument('--loop-max', type=int, default=10000,
+                        help='largest backlog to also send with the old loop, which is slow')
+    args = parser.parse_args()
+
+    setup_database()
+    from django.conf import settings
+    from django.test.utils import override_settings
+    from crm.events import get_broker
+    from crm.reminders import dispatch_due_reminders
+
+    seed(leads=100, contacts=0, notes=0)
+    batch_size = args.batch_size or settings.REMINDER_BATCH_SIZE
+    with override_settings(EVENTS_BROKER='crm.events.InMemoryBroker'), \
+            mock.patch('crm.signals.publish_reminder_change'):
+        get_broker.cache_clear()
+        print(f'{"reminders":>9}  {"batched/s":>9}  {"queries":>7}  {"loop/s":>7}  {"queries":>7}')
+        for count in sorted(set(args.reminders)):
+            rate, queries = measure(lambda now: dispatch_due_reminders(now, batch_size), count)
+            row = f'{count:>9}  {rate:>9.0f}  {queries:>7}'
+            if count <= args.loop_max:
+                loop_rate, loop_queries = measure(loop_dispatch, count)
+                row += f'  {loop_rate:>7.0f}  {loop_queries:>7}'
+            print(row)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark the lead CSV export: peak Python memory and time to produce the
+whole file, streamed by /api/leads/export/csv/ and, for comparison, built
+in memory from model instances as the export used to be.
+    python scripts/bench_export_csv.py --leads 1000 10000 50000
+"""
+
+import argparse
+import csv
+import tracemalloc
+
+from benchutil import api_client, median_ms, seed, setup_database
+
+
+def buffered_export(leads):
+    """The export before it streamed: one HttpResponse written from model instances."""
+    from django.http import HttpResponse
+    from crm.views import LEAD_EXPORT_HEADER
+
+    response = HttpResponse(content_type='text/csv')
+    writer = csv.writer(response)
+    writer.writerow(LEAD_EXPORT_HEADER)
+    for lead in leads.select_related('owner').order_by('-created_at'):
+        writer.writerow([
+            lead.id, lead.name, lead.company, lead.email, lead.phone,
+            lead.get_status_display(), lead.get_priority_display(), lead.source,
+            lead.owner.username if lead.owner else 'N/A',
+            lead.estimated_value if lead.estimated_value else 0, lead.description,
+            lead.created_at.strftime('%Y-%m-%d %H:%M:%S'), lead.updated_at.strftime('%Y-%m-%d %H:%M:%S'),
+        ])
+    return len(response.content)
+
+
+def peak_mb(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--leads', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_database()
+    from crm.models import Lead
+
+    users = seed(leads=0, users=5)
+    client = api_client(users[0])
+
+    def streamed():
+        response = client.get('/api/leads/export/csv/')
+        return sum(len(chunk) for chunk in response.streaming_content)
+
+    print(f'{"leads":>7}  {"streamed MB":>11}  {"ms":>7}  {"buffered MB":>11}  {"ms":>7}  {"bytes":>10}')
+    for count in sorted(set(args.leads)):
+        seed(leads=count - Lead.objects.count(), contacts=0, notes=0, users=users)
+        size = streamed()
+        assert size == buffered_export(Lead.objects.all()), 'streamed and buffered files differ in size'
+        print(
+            f'{count:>7}  {peak_mb(streamed):>11.1f}  {median_ms(streamed, args.repeat):>7.0f}  '
+            f'{peak_mb(lambda: buffered_export(Lead.objects.all())):>11.1f}  '
+            f'{median_ms(lambda: buffered_export(Lead.objects.all()), args.repeat):>7.0f}  {size:>10}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark JSON rendering and parsing with orjson (crm.renderers, the
+FAST_JSON default) against DRF's stdlib-based JSONRenderer and JSONParser,
+on lead and audit log list pages of several sizes. Both renderers must
+produce the same bytes, for those pages and for search results, whose
+ranks are tiny floats on SQLite.
+    python scripts/bench_json.py --leads 1000 3300 --auditlogs 1000 5000
+"""
+
+import argparse
+import io
+from unittest import mock
+
+from benchutil import api_client, median_ms, seed, setup_database
+
+
+def seed_audit_logs(count, users):
+    from crm.models import AuditLog
+
+    AuditLog.objects.bulk_create([
+        AuditLog(
+            user=users[i % len(users)], action='update', model_name='Lead', object_id=i,
+            object_repr=f'Lead {i} - Company {i % 500}', ip_address='10.0.0.1',
+            changes={'status': {'old': 'new', 'new': 'contacted'}, 'estimated_value': {'old': '1000.00', 'new': '1500.00'}},
+        )
+        for i in range(count)
+    ], batch_size=2000)
+
+
+def page_data(client, url, rows):
+    from crm.pagination import CRMPagination
+
+    with mock.patch.object(CRMPagination, 'page_size', rows):
+        response = client.get(url)
+    assert response.status_code == 200, response.status_code
+    return response.data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--leads', type=int, nargs='+', default=[1000, 3300])
+    parser.add_argument('--auditlogs', type=int, nargs='+', default=[1000, 5000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_database()
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+    from crm.renderers import ORJSONParser, ORJSONRenderer
+
+    users = seed(leads=max(args.leads), contacts=0, notes=0)
+    seed_audit_logs(max(args.auditlogs), users)
+    client = api_client(users[0])
+
+    # orjson writes floats below 1e-4 differently, so the renderer hands them to DRF
+    search = client.get('/api/search/?q=enterprise&limit=50')
+    assert search.status_code == 200, search.status_code
+    assert ORJSONRenderer().render(search.data) == JSONRenderer().render(search.data), (
+        'orjson renders the search results differently'
+    )
+
+    pages = [('leads', '/api/leads/', rows) for rows in sorted(set(args.leads))]
+    pages += [('auditlogs', '/api/audit-logs/', rows) for rows in sorted(set(args.auditlogs))]
+
+    print(f'{"page":<10}  {"rows":>5}  {"KB":>6}  {"render DRF":>10}  {"orjson":>7}  {"parse DRF":>9}  {"orjson":>7}')
+    for name, url, rows in pages:
+        data = page_data(client, url, rows)
+        body = JSONRenderer().render(data)
+        assert ORJSONRenderer().render(data) == body, f'orjson renders the {name} page differently'
+        assert ORJSONParser().parse(io.BytesIO(body)) == JSONParser().parse(io.BytesIO(body))
+
+        timings = [
+            median_ms(lambda: renderer().render(data), args.repeat)
+            for renderer in (JSONRenderer, ORJSONRenderer)
+        ] + [
+            median_ms(lambda: json_parser().parse(io.BytesIO(body)), args.repeat)
+            for json_parser in (JSONParser, ORJSONParser)
+        ]
+        print(
+            f'{name:<10}  {rows:>5}  {len(body) / 1024:>6.0f}  {timings[0]:>8.1f}ms  {timings[1]:>5.1f}ms  '
+            f'{timings[2]:>7.1f}ms  {timings[3]:>5.1f}ms'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark list pages rendered from values() rows by RowSerializer against
+DRF serializers over model instances (`fast_list = False`): time to answer
+one page of leads, notes and correspondence, queries and rendering
+included, at several page sizes. Both paths must return the same JSON.
+    python scripts/bench_list_rendering.py --rows 20 100 1000
+"""
+
+import argparse
+from unittest import mock
+
+from benchutil import api_client, median_ms, seed, setup_database
+
+
+ENDPOINTS = [
+    ('LeadList', '/api/leads/', 'LeadViewSet'),
+    ('Note', '/api/notes/', 'NoteViewSet'),
+    ('Correspondence', '/api/correspondences/', 'CorrespondenceViewSet'),
+]
+
+
+def seed_correspondence(count, users):
+    from crm.models import Contact, Correspondence
+
+    contact_ids = list(Contact.objects.values_list('id', flat=True))
+    Correspondence.objects.bulk_create([
+        Correspondence(
+            contact_id=contact_ids[i % len(contact_ids)], type='email', subject=f'Offer {i}',
+            description='Sent the updated quote', logged_by=users[i % len(users)],
+        )
+        for i in range(count)
+    ], batch_size=2000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[20, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_database()
+    from crm import views
+    from crm.pagination import CRMPagination
+
+    largest = max(args.rows)
+    users = seed(leads=largest, contacts=largest, notes=largest)
+    seed_correspondence(largest, users)
+    client = api_client(users[0])
+
+    print(f'{"endpoint":<15}  {"rows":>5}  {"DRF ms":>7}  {"rows ms":>7}  {"speedup":>7}')
+    for name, url, view_name in ENDPOINTS:
+        view = getattr(views, view_name)
+        for rows in sorted(set(args.rows)):
+            with mock.patch.object(CRMPagination, 'page_size', rows):
+                get = lambda: client.get(url).content
+                fast = get()
+                with mock.patch.object(view, 'fast_list', False):
+                    assert get() == fast, f'{name} renders differently with fast_list off'
+                    drf_ms = median_ms(get, args.repeat)
+                rows_ms = median_ms(get, args.repeat)
+            print(f'{name:<15}  {rows:>5}  {drf_ms:>7.1f}  {rows_ms:>7.1f}  {drf_ms / rows_ms:>6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark the dashboard stats and the global search computed from a cold
+cache with their independent queries run one after another
+(PARALLEL_QUERY_THREADS=1) and concurrently (crm.parallel), and check both
+give the same response. Times are medians in milliseconds:
+    python scripts/bench_parallel_queries.py --leads 20000 --threads 8
+
+Needs PostgreSQL (DB_ENGINE=postgresql and the DB_* settings): on SQLite the
+queries always run inline. Overlapping helps most when each query waits on
+the network, so a local server shows the smallest gain.
+"""
+
+import argparse
+import threading
+
+from benchutil import api_client, median_ms, seed, setup_database
+
+
+PATHS = {
+    'dashboard stats': '/api/dashboard/stats/',
+    'search': '/api/search/?q=offer',
+    'search, 2 types': '/api/search/?q=lead&types=notes,leads&limit=20',
+}
+
+
+def close_pool_connections(threads):
+    """Close the connections of the query threads, or the test database cannot be dropped."""
+    from django.db import connections
+    from crm.parallel import get_executor
+
+    # Every thread waits for the others, so each runs exactly one of the calls
+    barrier = threading.Barrier(threads)
+
+    def close():
+        barrier.wait()
+        connections.close_all()
+
+    for future in [get_executor().submit(close) for _ in range(threads)]:
+        future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--leads', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=8, help='PARALLEL_QUERY_THREADS to compare with 1')
+    parser.add_argument('--repeat', type=int, default=15)
+    args = parser.parse_args()
+
+    setup_database()
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test.utils import override_settings
+
+    assert connection.vendor == 'postgresql', 'needs DB_ENGINE=postgresql'
+    users = seed(leads=args.leads)
+    client = api_client(users[0])
+
+    def cold_get(path, threads):
+        with override_settings(PARALLEL_QUERY_THREADS=threads):
+            cache.clear()
+            response = client.get(path)
+        assert response.status_code == 200, response.status_code
+        return response.content
+
+    print(f'{"endpoint":<16}  {"1 thread":>9}  {f"{args.threads} threads":>9}  identical')
+    for name, path in PATHS.items():
+        identical = cold_get(path, 1) == cold_get(path, args.threads)
+        inline = median_ms(lambda: cold_get(path, 1), args.repeat)
+        parallel = median_ms(lambda: cold_get(path, args.threads), args.repeat)
+        print(f'{name:<16}  {inline:>9.1f}  {parallel:>9.1f}  {"yes" if identical else "NO"}')
+
+    close_pool_connections(args.threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Setup shared by the benchmark scripts in this directory.
+
+Benchmarks run against a throwaway test database, as `manage.py test` does:
+an in-memory database with SQLite, `test_<DB_NAME>` with PostgreSQL. It is
+created and migrated on start, seeded with generated rows and dropped on
+exit, so real data is never touched. Run the scripts from the backend
+directory, with the environment (DB_ENGINE, ...) of the setup to measure:
+    python scripts/bench_export_csv.py --help
+"""
+
+import atexit
+import os
+import random
+import statistics
+import sys
+import time
+import warnings
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django
+
+
+def setup_database():
+    """Set Django up on a fresh test database, dropped at exit."""
+    django.setup()
+    from django.test.runner import DiscoverRunner
+    from django.test.utils import setup_test_environment
+
+    # Static files are not collected for benchmarks
+    warnings.filterwarnings('ignore', message='No directory at')
+    # DEBUG off, so queries are not recorded in memory
+    setup_test_environment(debug=False)
+    runner = DiscoverRunner(verbosity=0, interactive=False)
+    old_config = runner.setup_databases()
+    atexit.register(runner.teardown_databases, old_config)
+
+
+def seed(leads=1000, contacts=None, notes=None, users=10):
+    """
+    Create `users` users, or take a list of existing ones, then `leads`
+    leads owned by them with `contacts` contacts and `notes` notes (as many
+    as leads by default) spread over the new leads at random. Returns the
+    users, the first one a manager.
+    """
+    from django.contrib.auth import get_user_model
+    from crm.models import Lead, Contact, Note
+
+    User = get_user_model()
+    rng = random.Random(1)
+    statuses = [choice for choice, _ in Lead.STATUS_CHOICES]
+    priorities = [choice for choice, _ in Lead.PRIORITY_CHOICES]
+
+    if isinstance(users, int):
+        users = User.objects.bulk_create([
+            User(username=f'bench{i}', email=f'bench{i}@example.com', role='manager' if i == 0 else 'agent')
+            for i in range(users)
+        ])
+    start = Lead.objects.count()
+    instances = []
+    for i in range(start, start + leads):
+        lead = Lead(
+            name=f'Lead {i}', company=f'Company {i % 500}', email=f'lead{i}@example.com',
+            phone=f'+254-700-{i:06d}', status=rng.choice(statuses), priority=rng.choice(priorities),
+            source='Website', owner=rng.choice(users), estimated_value=rng.randint(0, 1000000),
+            description=f'Lead {i} interested in the enterprise plan',
+        )
+        lead.update_derived_fields()
+        instances.append(lead)
+    Lead.objects.bulk_create(instances, batch_size=2000)
+    lead_ids = list(Lead.objects.order_by('id').values_list('id', flat=True)[start:])
+    Contact.objects.bulk_create([
+        Contact(lead_id=rng.choice(lead_ids), name=f'Contact {i}', email=f'contact{i}@example.com')
+        for i in range(leads if contacts is None else contacts)
+    ], batch_size=2000)
+    Note.objects.bulk_create([
+        Note(lead_id=rng.choice(lead_ids), author=rng.choice(users), content=f'Called about offer {i}')
+        for i in range(leads if notes is None else notes)
+    ], batch_size=2000)
+    return users
+
+
+def api_client(user):
+    from rest_framework.test import APIClient
+
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+def median_ms(func, repeat=5):
+    """Median wall time of `repeat` calls of `func`, in milliseconds."""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
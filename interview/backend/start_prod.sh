@@ -3,6 +3,7 @@
 # Run migrations
 echo "Running migrations..."
 python manage.py migrate
+python manage.py createcachetable
 
 # Create superuser if it doesn't exist
 echo "Creating superuser..."
@@ -21,5 +22,10 @@ if username and password:
 "
 
 # Start server
+# APP_SERVER=asgi serves config.asgi with uvicorn workers instead of WSGI threads
+if [ "$APP_SERVER" = "asgi" ]; then
+    echo "Starting Gunicorn with uvicorn workers..."
+    exec gunicorn config.asgi:application --bind 0.0.0.0:8000 --workers 3 --worker-class uvicorn.workers.UvicornWorker
+fi
 echo "Starting Gunicorn..."
-exec gunicorn config.wsgi:application --bind 0.0.0.0:8000 --workers 3
+exec gunicorn config.wsgi:application --bind 0.0.0.0:8000 --workers 3 --threads "${APP_SERVER_THREADS:-16}"
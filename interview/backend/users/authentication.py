@@ -0,0 +1,111 @@
+"""
+JWT authentication that looks the user up in the cache, when
+USER_CACHE_TIMEOUT is set (by default only with Redis as the cache).
+
+The user row is cached under the user id and the user's version, a value
+kept in the cache that changes whenever the user is saved or deleted (see
+users.signals). Profile updates, the admin, role and password changes all
+save the user, so the next request sees the change, and a stale row cached
+by a request racing the change lands under the old version, where nothing
+reads it.
+"""
+
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+
+USER_VERSION_KEY = 'users:version:{}'
+USER_CACHE_KEY = 'users:auth:{}:{}'
+
+# Kept out of the cache; loaded from the database if a view reads it
+UNCACHED_FIELDS = ('password',)
+
+
+def get_user_version(user_id):
+    """
+    The current version of a user. Versions are timestamps rather than a
+    counter, so a version evicted from the cache is never handed out again.
+    """
+    key = USER_VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_user_version(user_id):
+    """Make every cached copy of the user unreachable."""
+    cache.set(USER_VERSION_KEY.format(user_id), time.time_ns(), timeout=None)
+
+
+def user_snapshot(user):
+    return {
+        field.attname: getattr(user, field.attname)
+        for field in user._meta.concrete_fields
+        if field.name not in UNCACHED_FIELDS
+    }
+
+
+def user_from_snapshot(snapshot):
+    """
+    The user as if loaded from the database with the uncached fields
+    deferred, so save() leaves them alone.
+    """
+    return get_user_model().from_db(DEFAULT_DB_ALIAS, list(snapshot), list(snapshot.values()))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that reads the user from the cache when it can."""
+
+    def get_user(self, validated_token):
+        if not settings.USER_CACHE_TIMEOUT or api_settings.CHECK_REVOKE_TOKEN:
+            # CHECK_REVOKE_TOKEN compares the token with the password hash, which is not cached
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        key = USER_CACHE_KEY.format(user_id, get_user_version(user_id))
+        snapshot = cache.get(key)
+        if snapshot is None:
+            user = super().get_user(validated_token)
+            cache.set(key, user_snapshot(user), timeout=settings.USER_CACHE_TIMEOUT)
+            return user
+
+        user = user_from_snapshot(snapshot)
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
+
+
+class QueryParamJWTAuthentication(CachedJWTAuthentication):
+    """
+    JWT authentication that also takes the access token from the `token`
+    query parameter, for clients that cannot send headers, such as the
+    browser's EventSource. URLs end up in access logs, so only use it on
+    the endpoints that need it.
+    """
+    query_param = 'token'
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            return result
+
+        raw_token = request.query_params.get(self.query_param)
+        if not raw_token:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return self.get_user(validated_token), validated_token
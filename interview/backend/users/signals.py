@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from crm.cache import bump_version_on_commit
+
+from .authentication import bump_user_version
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    Drop the cached copies of a user once the change is committed, so the
+    row cached next is the new one.
+    """
+    if not settings.USER_CACHE_TIMEOUT:
+        return
+    user_id = instance.pk
+    transaction.on_commit(lambda: bump_user_version(user_id))
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_rendered_user(sender, instance, update_fields=None, **kwargs):
+    """
+    Bump the `user` version once committed. CRM responses render users
+    nested, and their ETags and the dashboard cache include that version.
+    Logins only write last_login, which is not rendered.
+    """
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    bump_version_on_commit(sender._meta.model_name)
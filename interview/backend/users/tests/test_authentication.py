@@ -0,0 +1,42 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users import authentication
+from users.authentication import CachedJWTAuthentication
+
+
+User = get_user_model()
+
+
+class CachedUserTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('agent', password='secret')
+        self.token = AccessToken.for_user(self.user)
+
+    @override_settings(USER_CACHE_TIMEOUT=0)
+    def test_without_user_cache_loads_user(self):
+        with mock.patch.object(authentication, 'cache') as cache, self.assertNumQueries(1):
+            self.assertEqual(CachedJWTAuthentication().get_user(self.token), self.user)
+        cache.get.assert_not_called()
+
+    @override_settings(USER_CACHE_TIMEOUT=60)
+    def test_cached_user_skips_user_query(self):
+        CachedJWTAuthentication().get_user(self.token)
+        with mock.patch.object(User.objects, 'get', side_effect=AssertionError('user loaded')):
+            user = CachedJWTAuthentication().get_user(self.token)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user.username, 'agent')
+
+    @override_settings(USER_CACHE_TIMEOUT=60)
+    def test_role_change_is_seen_once_committed(self):
+        self.assertEqual(CachedJWTAuthentication().get_user(self.token).role, 'agent')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.role = 'manager'
+            self.user.save()
+        user = CachedJWTAuthentication().get_user(self.token)
+        self.assertEqual(user.role, 'manager')
+        self.assertTrue(user.is_manager)
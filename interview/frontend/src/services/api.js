@@ -11,6 +11,8 @@ const API_URL = process.env.VUE_APP_API_URL || 'http://localhost:8000'
 // Create axios instance with default configuration
 const api = axios.create({
   baseURL: API_URL,
+  // Sends the cookie that keeps reads on the primary database after a write
+  withCredentials: true,
   headers: {
     'Content-Type': 'application/json',
   },